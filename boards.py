@@ -0,0 +1,72 @@
+import time
+from collections import Counter
+import discord
+import database as db
+import utils
+
+# Conteúdo igual ao último publicado: só reedita para renovar o rodapé "Atualizado às" nesse intervalo
+BOARD_FOOTER_REFRESH = 2 * 3600
+
+class BoardRegistry:
+    """Mensagens fixas do bot (ranking, grade de eventos...) por (guild_id, chave).
+
+    O registro fica no banco (`bot_messages`) e em memória: atualizar um quadro é um único
+    `PartialMessage.edit`, sem varrer `channel.history`. A mensagem só é recriada em NotFound.
+    Edições cujo conteúdo (sem o rodapé) não mudou são puladas.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._messages = None  # (guild_id, key) -> (channel_id, message_id)
+        self._published = {}   # (guild_id, key) -> (hash do conteúdo, monotonic da última edição)
+        self.stats = Counter()
+
+    async def _load(self):
+        if self._messages is None:
+            self._messages = {(r['guild_id'], r['key']): (r['channel_id'], r['message_id']) for r in await db.get_bot_messages()}
+
+    async def _register(self, guild_id, key, channel_id, message_id):
+        self._messages[(guild_id, key)] = (channel_id, message_id)
+        await db.set_bot_message(guild_id, key, channel_id, message_id)
+
+    async def _adopt(self, channel, adopt):
+        # Migração única: reaproveita a mensagem que o bot já tinha publicado antes do registro existir
+        async for msg in channel.history(limit=20):
+            if msg.author == self.bot.user and adopt(msg): return msg
+        return None
+
+    async def publish(self, key, channel, embed, adopt=None, footer=None):
+        """Edita (ou cria) a mensagem do quadro `key` em `channel`. Retorna False se a edição foi pulada.
+
+        - adopt(msg): identifica a mensagem publicada antes do registro existir.
+        - footer: texto de atualização; fica fora do hash e só força edição a cada BOARD_FOOTER_REFRESH.
+        """
+        await self._load()
+        guild_id = channel.guild.id
+        digest = utils.embed_hash(embed)
+        known = self._messages.get((guild_id, key))
+        last = self._published.get((guild_id, key))
+        if known and known[0] == channel.id and last and last[0] == digest and (not footer or time.monotonic() - last[1] < BOARD_FOOTER_REFRESH):
+            self.stats['skipped'] += 1
+            return False
+        if footer: embed.set_footer(text=footer)
+
+        if known and known[0] == channel.id:
+            try:
+                await channel.get_partial_message(known[1]).edit(embed=embed)
+                return self._mark(guild_id, key, digest, 'published')
+            except discord.NotFound: pass
+        elif adopt:
+            msg = await self._adopt(channel, adopt)
+            if msg:
+                await msg.edit(embed=embed)
+                await self._register(guild_id, key, channel.id, msg.id)
+                return self._mark(guild_id, key, digest, 'published')
+        msg = await channel.send(embed=embed)
+        await self._register(guild_id, key, channel.id, msg.id)
+        return self._mark(guild_id, key, digest, 'created')
+
+    def _mark(self, guild_id, key, digest, stat):
+        self._published[(guild_id, key)] = (digest, time.monotonic())
+        self.stats[stat] += 1
+        return True
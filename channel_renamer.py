@@ -0,0 +1,69 @@
+import asyncio
+import time
+from collections import Counter, deque
+import discord
+
+# Limite do Discord para renomear um canal: 2 vezes a cada 10 minutos
+RENAME_BUDGET = 2
+RENAME_WINDOW = 600
+
+class ChannelRenamer:
+    """Coalescer de renomeações: guarda só o nome desejado mais recente de cada canal e
+    aplica quando o orçamento de renomeações do canal permite, sem nunca esperar um 429.
+    """
+
+    def __init__(self, budget=RENAME_BUDGET, window=RENAME_WINDOW):
+        self.budget = budget
+        self.window = window
+        self._desired = {}                   # channel_id -> (canal, nome desejado)
+        self._history = {}                   # channel_id -> deque de monotonic das últimas renomeações
+        self._tasks = {}
+        self.stats = Counter()
+
+    def request(self, channel, name):
+        """Pede que `channel` passe a se chamar `name`. Pedidos anteriores ainda pendentes são substituídos."""
+        if channel.id not in self._desired and channel.name == name: return
+        if channel.id in self._desired: self.stats['coalesced'] += 1
+        self._desired[channel.id] = (channel, name)
+        if channel.id not in self._tasks:
+            self._tasks[channel.id] = asyncio.create_task(self._apply(channel.id))
+
+    def forget(self, channel_id):
+        self._desired.pop(channel_id, None)
+        self._history.pop(channel_id, None)
+        task = self._tasks.pop(channel_id, None)
+        if task: task.cancel()
+
+    def _wait_time(self, channel_id):
+        history = self._history.setdefault(channel_id, deque())
+        now = time.monotonic()
+        while history and now - history[0] >= self.window: history.popleft()
+        if len(history) < self.budget: return 0
+        return self.window - (now - history[0])
+
+    async def _apply(self, channel_id):
+        try:
+            while channel_id in self._desired:
+                wait = self._wait_time(channel_id)
+                if wait > 0:
+                    self.stats['deferred'] += 1
+                    await asyncio.sleep(wait)
+                    continue
+                channel, name = self._desired.pop(channel_id)
+                if channel.name == name: continue
+                self._history[channel_id].append(time.monotonic())
+                try:
+                    await channel.edit(name=name)
+                    self.stats['renamed'] += 1
+                except discord.NotFound:
+                    self._desired.pop(channel_id, None)
+                    break
+                except discord.HTTPException as e:
+                    self.stats['failed'] += 1
+                    if e.status == 429:
+                        # Orçamento gasto fora do nosso controle (ex: restart): marca a janela como cheia e tenta depois
+                        self._history[channel_id].extend([time.monotonic()] * self.budget)
+                        self._desired.setdefault(channel_id, (channel, name))
+                    else: print(f"[RENAME] Erro ao renomear {channel_id}: {e}")
+        finally:
+            self._tasks.pop(channel_id, None)
@@ -1,10 +1,10 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import config
 import database as db
 import utils
-from views import PersistentRsvpView
+from views import event_renderer
+from provisioning import provision_event
 from typing import Union
 
 # --- View para selecionar Vagas ---
@@ -18,60 +18,12 @@ class SlotsView(discord.ui.View):
     async def finalize_creation(self, interaction: discord.Interaction, slots: int):
         await interaction.response.defer(ephemeral=True)
         
-        # Define as vagas selecionadas
-        self.event_data['max_slots'] = slots
-        
-        # --- Lógica de Criação (Reusada) ---
-        guild = interaction.guild
-        dt = self.event_data['date_time']
-        official_name = self.event_data['title']
-        act_type = self.event_data['activity_type']
-        description_text = self.event_data['description']
-        
-        # Cargo
-        role_name = f"{official_name[:20]} {dt.strftime('%d/%m')}"
-        role = await guild.create_role(name=role_name, mentionable=True, reason="Evento Bot")
-        self.event_data['role_id'] = role.id
-        
-        # Canal
-        category = guild.get_channel(config.CATEGORY_EVENTS_ID)
-        channel_name = utils.generate_channel_name(official_name, dt, act_type, slots, description=description_text)
-        
-        if category:
-            channel = await guild.create_text_channel(name=channel_name, category=category)
-        else:
-            channel = await guild.create_text_channel(name=channel_name)
-        self.event_data['channel_id'] = channel.id
-        
-        # DB e Embed
-        embed_loading = discord.Embed(title="Criando...", color=discord.Color.blue())
-        msg = await channel.send(content=role.mention, embed=embed_loading, view=PersistentRsvpView())
-        self.event_data['message_id'] = msg.id
-        
-        db_payload = {
-            'guild_id': self.event_data['guild_id'],
-            'channel_id': self.event_data['channel_id'],
-            'message_id': self.event_data['message_id'],
-            'role_id': self.event_data['role_id'],
-            'title': self.event_data['title'],
-            'desc': self.event_data['description'],
-            'type': self.event_data['activity_type'],
-            'date': self.event_data['date_time'],
-            'slots': self.event_data['max_slots'],
-            'creator': self.event_data['creator_id']
-        }
-        
-        event_id = await db.create_event(db_payload)
-        self.event_data['event_id'] = event_id
-        
-        # RSVP e Finalização
-        await db.update_rsvp(event_id, self.event_data['creator_id'], 'confirmed')
-        await interaction.user.add_roles(role)
-        
-        rsvps = await db.get_rsvps(event_id)
-        final_embed = await utils.build_event_embed(self.event_data, rsvps, self.bot)
-        
-        await msg.edit(embed=final_embed)
+        data = self.event_data
+        result = await provision_event(self.bot, interaction.guild, title=data['title'], description=data['description'],
+                                       activity_type=data['activity_type'], dt=data['date_time'], max_slots=slots, creator_id=data['creator_id'],
+                                       confirmed_ids=[data['creator_id']], role_name=f"{data['title'][:20]} {data['date_time'].strftime('%d/%m')}")
+        if not result: return await interaction.followup.send("❌ Erro ao criar o evento.", ephemeral=True)
+        event_id, channel = result
         await interaction.followup.send(f"✅ Evento criado em {channel.mention} ({slots} vagas)!", ephemeral=True)
         
         self.stop()
@@ -125,56 +77,30 @@ class EventModal(discord.ui.Modal, title="Agendar Evento"):
             return
 
         # CASO 2: Raid/Masmorra/PvP -> Cria Direto
-        event_data_partial['max_slots'] = slots
-        
-        # --- Criação Direta (Cópia da lógica acima) ---
-        guild = interaction.guild
-        role_name = f"{official_name[:20]} {dt.strftime('%d/%m')}"
-        role = await guild.create_role(name=role_name, mentionable=True, reason="Evento Bot")
-        event_data_partial['role_id'] = role.id
-        
-        category = interaction.guild.get_channel(config.CATEGORY_EVENTS_ID)
-        channel_name = utils.generate_channel_name(official_name, dt, act_type, slots, description=event_data_partial['description'])
-        
-        if category:
-            channel = await guild.create_text_channel(name=channel_name, category=category)
-        else:
-            channel = await guild.create_text_channel(name=channel_name)
-        event_data_partial['channel_id'] = channel.id
-        
-        embed_loading = discord.Embed(title="Criando...", color=discord.Color.blue())
-        msg = await channel.send(content=role.mention, embed=embed_loading, view=PersistentRsvpView())
-        event_data_partial['message_id'] = msg.id
-        
-        db_payload = {
-            'guild_id': event_data_partial['guild_id'],
-            'channel_id': event_data_partial['channel_id'],
-            'message_id': event_data_partial['message_id'],
-            'role_id': event_data_partial['role_id'],
-            'title': event_data_partial['title'],
-            'desc': event_data_partial['description'],
-            'type': event_data_partial['activity_type'],
-            'date': event_data_partial['date_time'],
-            'slots': event_data_partial['max_slots'],
-            'creator': event_data_partial['creator_id']
-        }
-        
-        event_id = await db.create_event(db_payload)
-        event_data_partial['event_id'] = event_id
-        
-        await db.update_rsvp(event_id, interaction.user.id, 'confirmed')
-        await interaction.user.add_roles(role)
-        
-        rsvps = await db.get_rsvps(event_id)
-        final_embed = await utils.build_event_embed(event_data_partial, rsvps, interaction.client)
-        
-        await msg.edit(embed=final_embed)
+        result = await provision_event(interaction.client, interaction.guild, title=official_name, description=event_data_partial['description'],
+                                       activity_type=act_type, dt=dt, max_slots=slots, creator_id=interaction.user.id,
+                                       confirmed_ids=[interaction.user.id], role_name=f"{official_name[:20]} {dt.strftime('%d/%m')}")
+        if not result: return await interaction.followup.send("❌ Erro ao criar o evento.", ephemeral=True)
+        event_id, channel = result
         await interaction.followup.send(f"✅ Evento criado em {channel.mention}!", ephemeral=True)
 
 class EventsCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    # Nome mudou -> descarta o nome em cache usado pelos embeds
+    @commands.Cog.listener()
+    async def on_user_update(self, before, after):
+        utils.display_names.invalidate(after.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if before.display_name != after.display_name: utils.display_names.invalidate(after.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        utils.display_names.invalidate(member.id)
+
     @app_commands.command(name="agendar", description="Cria um novo evento.")
     async def agendar(self, interaction: discord.Interaction):
         await interaction.response.send_modal(EventModal())
@@ -199,15 +125,14 @@ class EventsCog(commands.Cog):
     async def manage_rsvp(self, interaction: discord.Interaction, event_id: int, member: discord.Member, status: app_commands.Choice[str]):
         status_val = status.value
         await db.update_rsvp(event_id, member.id, status_val)
+        await db.promote_waitlist(event_id)
+        tasks_cog = self.bot.get_cog('TasksCog')
+        if tasks_cog: await tasks_cog.refresh_channel_name(event_id)
         
         event = await db.get_event(event_id)
         if event:
             try:
-                channel = interaction.guild.get_channel(event['channel_id'])
-                msg = await channel.fetch_message(event['message_id'])
-                rsvps = await db.get_rsvps(event_id)
-                new_embed = await utils.build_event_embed(dict(event), rsvps, self.bot)
-                await msg.edit(embed=new_embed)
+                event_renderer.request(event_id, self.bot)
                 
                 status_map = {'confirmed': 'Confirmado', 'waitlist': 'Lista de Espera', 'maybe': 'Talvez', 'absent': 'Não Vou'}
                 display_status = status_map.get(status_val, status_val)
@@ -2,10 +2,9 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import config
-import database as db
 import json
 import utils
-from cogs.views_polls import PollBuilderView, VotingPollView
+from cogs.views_polls import PollBuilderView, VotingPollView, register_poll
 
 class PollsCog(commands.Cog):
     def __init__(self, bot):
@@ -81,7 +80,7 @@ class PollsCog(commands.Cog):
             await main_chat.send(f"📢 **Duelo de Atividades!**\nEscolha o que jogar em {quando}: {msg.jump_url}")
 
         await interaction.response.send_message("Enquete criada!", ephemeral=True)
-        await db.create_poll(msg.id, interaction.channel_id, interaction.guild.id, 'what', target_data)
+        await register_poll(self.bot, msg, view)
 
 async def setup(bot):
     await bot.add_cog(PollsCog(bot))
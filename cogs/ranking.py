@@ -8,30 +8,90 @@ from constants import BR_TIMEZONE, RANK_THRESHOLDS
 import config
 import utils
 
+# Intervalo de gravação do diário de sessões abertas (é também o heartbeat: perda máxima numa queda)
+JOURNAL_FLUSH_SECONDS = 15
+
+class VoiceOccupancy:
+    """Índice em memória dos canais de voz: canal -> {membro humano: está aberto (desmutado e ouvindo)}.
+
+    Atualizado incrementalmente pelos eventos de voz; as checagens de validade não
+    percorrem mais `channel.members`.
+    """
+
+    def __init__(self):
+        self.channels = {}
+        self.member_channel = {}
+
+    @staticmethod
+    def is_open(state):
+        return not (state.self_mute or state.self_deaf or state.mute or state.deaf)
+
+    def rebuild(self, guilds):
+        self.channels.clear()
+        self.member_channel.clear()
+        for guild in guilds:
+            for member in guild.members:
+                if not member.bot and member.voice and member.voice.channel:
+                    self.update(member.id, member.voice)
+
+    def update(self, user_id, state):
+        """Aplica o novo estado de voz e retorna os canais afetados (antigo e novo)."""
+        affected = set()
+        old_channel = self.member_channel.pop(user_id, None)
+        if old_channel is not None:
+            members = self.channels.get(old_channel, {})
+            members.pop(user_id, None)
+            if not members: self.channels.pop(old_channel, None)
+            affected.add(old_channel)
+        if state and state.channel:
+            self.channels.setdefault(state.channel.id, {})[user_id] = self.is_open(state)
+            self.member_channel[user_id] = state.channel.id
+            affected.add(state.channel.id)
+        return affected
+
+    def in_voice(self, user_id):
+        return user_id in self.member_channel
+
+    def members_in(self, channel_id):
+        return list(self.channels.get(channel_id, {}))
+
+    def is_valid(self, user_id):
+        # Regra de Ouro: em canal, desmutado/ouvindo e com companhia humana (>1 pessoa)
+        channel_id = self.member_channel.get(user_id)
+        if channel_id is None: return False
+        members = self.channels.get(channel_id, {})
+        return members.get(user_id, False) and len(members) >= 2
+
 class RankingCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.active_timers = {} 
+        self.active_timers = {}  # user_id -> (início do trecho, trecho válido?)
+        self.occupancy = VoiceOccupancy()
+        self.journal_dirty = set()  # usuários cujo trecho aberto mudou desde o último flush
         self.update_ranking_loop.start()
 
+    async def cog_load(self):
+        # Antes de conectar ao gateway: fecha os trechos que ficaram abertos na última queda
+        closed = await db.close_orphan_voice_sessions()
+        if closed: print(f"[RANKING] {closed} sessões órfãs fechadas no último heartbeat.")
+        self.journal_loop.start()
+
     def cog_unload(self):
         self.update_ranking_loop.cancel()
+        self.journal_loop.cancel()
 
     @commands.Cog.listener()
     async def on_ready(self):
         await self.bot.wait_until_ready()
         
         now = datetime.datetime.now(BR_TIMEZONE)
-        restored_count = 0
-        
-        for guild in self.bot.guilds:
-            for member in guild.members:
-                if member.bot: continue
-                if member.voice and member.voice.channel:
-                    self.active_timers[member.id] = now
-                    restored_count += 1
+        self.occupancy.rebuild(self.bot.guilds)
+        for user_id in list(self.active_timers):
+            if not self.occupancy.in_voice(user_id): await self.close_timer(user_id, now)
+        for user_id in list(self.occupancy.member_channel):
+            await self.sync_timer(user_id, now)
         
-        print(f"[RANKING] System online. Resumed tracking for {restored_count} users.")
+        print(f"[RANKING] System online. Resumed tracking for {len(self.active_timers)} users.")
 
         await asyncio.sleep(10)
         await self.update_ranking_board()
@@ -43,33 +103,54 @@ class RankingCog(commands.Cog):
         await self.update_ranking_board()
         await interaction.followup.send("✅ Ranking atualizado!", ephemeral=True)
 
-    def check_validity_conditions(self, member):
-        if member.bot: return False
-        voice = member.voice
-        if not voice or not voice.channel: return False
-        if voice.self_mute or voice.self_deaf or voice.mute or voice.deaf: return False
-        humans_in_channel = [m for m in voice.channel.members if not m.bot]
-        if len(humans_in_channel) < 2: return False
-        return True
-
-    async def reconcile_session(self, member):
-        user_id = member.id
-        now = datetime.datetime.now(BR_TIMEZONE)
-        is_in_voice = member.voice and member.voice.channel
-        is_counting = user_id in self.active_timers
+    @app_commands.command(name="recalcular_ranking", description="Admin: Recalcula o resumo diário de voz a partir das sessões.")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def rebuild_ranking(self, interaction: discord.Interaction):
+        await interaction.response.defer(ephemeral=True)
+        await db.rebuild_voice_daily()
+        await self.update_ranking_board()
+        await interaction.followup.send("✅ Resumo diário de voz recalculado!", ephemeral=True)
 
-        if is_in_voice and not is_counting:
-            self.active_timers[user_id] = now
-        elif not is_in_voice and is_counting:
-            start_time = self.active_timers.pop(user_id)
-            duration = (now - start_time).total_seconds() / 60
-            if duration >= 1:
-                await db.log_voice_session(user_id, start_time, now, int(duration), is_valid=1)
+    async def close_timer(self, user_id, now):
+        start_time, is_valid = self.active_timers.pop(user_id)
+        self.journal_dirty.add(user_id)
+        duration = (now - start_time).total_seconds() / 60
+        if duration >= 1:
+            await db.log_voice_session(user_id, start_time, now, int(duration), is_valid=1 if is_valid else 0)
+
+    async def sync_timer(self, user_id, now):
+        """Fecha/abre o trecho do usuário conforme o estado atual (PLAY quando válido, PAUSE quando não)."""
+        in_voice = self.occupancy.in_voice(user_id)
+        is_valid = self.occupancy.is_valid(user_id)
+        current = self.active_timers.get(user_id)
+        if current and (not in_voice or current[1] != is_valid):
+            await self.close_timer(user_id, now)
+            current = None
+        if in_voice and current is None:
+            self.active_timers[user_id] = (now, is_valid)
+            self.journal_dirty.add(user_id)
+
+    async def flush_journal(self):
+        # Foto e enfileiramento sem await no meio: fica na ordem certa em relação aos trechos fechados
+        dirty, self.journal_dirty = self.journal_dirty, set()
+        upserts = [(uid, *self.active_timers[uid]) for uid in dirty if uid in self.active_timers]
+        deletes = [uid for uid in dirty if uid not in self.active_timers]
+        await db.flush_open_voice_sessions(upserts, deletes, datetime.datetime.now(BR_TIMEZONE))
+
+    @tasks.loop(seconds=JOURNAL_FLUSH_SECONDS)
+    async def journal_loop(self):
+        await self.flush_journal()
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
-        if not member.bot:
-            await self.reconcile_session(member)
+        if member.bot: return
+        now = datetime.datetime.now(BR_TIMEZONE)
+        affected = self.occupancy.update(member.id, after)
+        # Validação Cruzada / Pausa: reavalia quem está nos canais afetados, não só quem mudou
+        await self.sync_timer(member.id, now)
+        for channel_id in affected:
+            for user_id in self.occupancy.members_in(channel_id):
+                if user_id != member.id: await self.sync_timer(user_id, now)
 
     async def update_ranking_board(self):
         guild = self.bot.get_guild(self.bot.guilds[0].id) if self.bot.guilds else None
@@ -77,14 +158,13 @@ class RankingCog(commands.Cog):
 
         now = datetime.datetime.now(BR_TIMEZONE)
         
-        for user_id, start_time in list(self.active_timers.items()):
-            member = guild.get_member(user_id)
-            if member and member.voice:
-                duration = (now - start_time).total_seconds() / 60
-                if duration >= 1:
-                    valid = 1 if self.check_validity_conditions(member) else 0
-                    await db.log_voice_session(user_id, start_time, now, int(duration), is_valid=valid)
-                    self.active_timers[user_id] = now
+        # Checkpoint: grava os trechos em andamento (a validade já é mantida pelos eventos de voz)
+        for user_id, (start_time, is_valid) in list(self.active_timers.items()):
+            duration = (now - start_time).total_seconds() / 60
+            if duration >= 1:
+                # Reabre antes do await: um evento de voz no meio pode fechar o trecho novo com segurança
+                self.active_timers[user_id] = (now, is_valid)
+                await db.log_voice_session(user_id, start_time, now, int(duration), is_valid=1 if is_valid else 0, reopen_valid=is_valid)
 
         data_7d = await db.get_voice_hours(7)
         hours_map = {r['user_id']: r['total_mins']/60 for r in data_7d}
@@ -172,17 +252,11 @@ class RankingCog(commands.Cog):
 
         embed.add_field(name="⠀", value="🎙️ **Suba de Rank:** Entre em calls com grupo, áudio aberto e fale!", inline=False)
         if guild.icon: embed.set_thumbnail(url=guild.icon.url)
-        embed.set_footer(text=f"Atualizado às {now.strftime('%H:%M')} • Staff não listado")
 
         channel = guild.get_channel(config.CHANNEL_RANKING)
         if channel:
-            try:
-                last_msg = None
-                async for msg in channel.history(limit=10):
-                    if msg.author == self.bot.user: last_msg = msg; break
-                if last_msg: await last_msg.edit(embed=embed)
-                else: await channel.send(embed=embed)
-            except: pass
+            try: await self.bot.boards.publish('ranking', channel, embed, adopt=lambda m: bool(m.embeds), footer=f"Atualizado às {now.strftime('%H:%M')} • Staff não listado")
+            except Exception as e: print(f"[RANKING] Erro ao publicar quadro: {e}")
 
     times_list = [datetime.time(hour=h, minute=m, tzinfo=BR_TIMEZONE) for h in range(24) for m in [0, 30]]
     @tasks.loop(time=times_list)
@@ -6,10 +6,30 @@ import datetime
 import asyncio
 from constants import BR_TIMEZONE, RANK_THRESHOLDS, RANK_STYLE
 import utils
+from ratelimit import TokenBucket
+
+# Rota PATCH /guilds/{id}/members/{id}: ~10 edições a cada 10s por servidor (com margem)
+MEMBER_EDIT_BURST = 8
+MEMBER_EDIT_PER_SECOND = 0.8
+
+# Presente Sempre: 5 dos últimos 7 dias com 60+ min válidos de voz
+PRESENTE_SEMPRE_MIN_DAYS = 5
+PRESENTE_SEMPRE_MIN_MINUTES = 60
+
+# Mapeamento de Rank -> ID do Cargo (MESTRE é controlado pelo WeeklyCog)
+RANK_ROLE_IDS = {
+    'LENDA': config.ROLE_LENDA_ID,
+    'ADEPTO': config.ROLE_ADEPTO_ID,
+    'ATIVO': config.ROLE_ATIVO_ID,
+    'TURISTA': config.ROLE_TURISTA_ID,
+    'INATIVO': config.ROLE_INATIVO_ID
+}
 
 class RolesManager(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.edit_bucket = TokenBucket(MEMBER_EDIT_BURST, MEMBER_EDIT_PER_SECOND)
+        self.sync_lock = asyncio.Lock()
         self.sync_loop.start()
         self.db_cleanup_loop.start()
 
@@ -20,85 +40,95 @@ class RolesManager(commands.Cog):
     @commands.Cog.listener()
     async def on_ready(self):
         await self.bot.wait_until_ready()
-        print("[ROLES] Iniciando sincronização (Modo Seguro - Delay 2.0s)...")
+        print("[ROLES] Iniciando sincronização (diff + token bucket)...")
         self.bot.loop.create_task(self.sync_member_ranks())
 
     async def sync_member_ranks(self):
         if not self.bot.guilds: return
         guild = self.bot.get_guild(self.bot.guilds[0].id)
         if not guild: return
-
-        valid_hours_data = await db.get_voice_hours(7)
-        valid_hours_map = {r['user_id']: r['total_mins']/60 for r in valid_hours_data}
-        
-        staff_roles = [config.ROLE_FOUNDER_ID, config.ROLE_MOD_ID, config.ROLE_ADMIN_ID]
-
-        # Mapeamento de Rank -> ID do Cargo
-        rank_to_id = {
-            'LENDA': config.ROLE_LENDA_ID,
-            'ADEPTO': config.ROLE_ADEPTO_ID,
-            'ATIVO': config.ROLE_ATIVO_ID,
-            'TURISTA': config.ROLE_TURISTA_ID,
-            'INATIVO': config.ROLE_INATIVO_ID
-        }
-
-        for member in guild.members:
-            if member.bot: continue
-            
-            await asyncio.sleep(2.0) # Rate Limit Protection
-
-            if any(r.id in staff_roles for r in member.roles):
-                continue
-
-            h7 = valid_hours_map.get(member.id, 0)
-            target_rank = self.get_target_rank(member, h7)
-            
-            # 1. Atualizar Nome
-            await self.update_nickname(member, target_rank)
-
-            # 2. Atualizar Cargos
-            if target_rank != 'MESTRE':
-                # Remove cargos que NÃO são o alvo
-                for r_key, r_id in rank_to_id.items():
-                    if r_key != target_rank and r_id:
-                        role = guild.get_role(r_id)
-                        if role and role in member.roles:
-                            try: await member.remove_roles(role)
-                            except: pass
-                
-                # Adiciona o cargo alvo
-                target_role_id = rank_to_id.get(target_rank)
-                if target_role_id:
-                    role = guild.get_role(target_role_id)
-                    if role and role not in member.roles:
-                        try: await member.add_roles(role)
-                        except: pass
-
-            # 3. Comportamento
-            await self.check_behavior_roles(member)
-
-    async def check_behavior_roles(self, member):
-        # Presente Sempre
-        sessions_7d = await db.get_sessions_in_range(member.id, 7)
-        days_activity = {}
-        for sess in sessions_7d:
-            try: s_date = sess['start_time'].split()[0]
-            except: continue
-            days_activity[s_date] = days_activity.get(s_date, 0) + sess['duration_minutes']
-        
-        presente_role = member.guild.get_role(config.ROLE_PRESENTE_SEMPRE)
-        if presente_role:
-            if sum(1 for mins in days_activity.values() if mins >= 60) >= 5:
-                if presente_role not in member.roles:
-                    try: await member.add_roles(presente_role)
-                    except: pass
-            else:
-                if presente_role in member.roles:
-                    try: await member.remove_roles(presente_role)
-                    except: pass
-
-    async def update_nickname(self, member, rank_key):
-        if member.id == member.guild.owner_id: return
+        # on_ready e o loop horário podem coincidir: uma passada por vez
+        if self.sync_lock.locked(): return
+        async with self.sync_lock:
+            valid_hours_data = await db.get_voice_hours(7)
+            valid_hours_map = {r['user_id']: r['total_mins']/60 for r in valid_hours_data}
+            active_days_map = await db.get_active_days(7, PRESENTE_SEMPRE_MIN_MINUTES)
+
+            staff_roles = [config.ROLE_FOUNDER_ID, config.ROLE_MOD_ID, config.ROLE_ADMIN_ID]
+
+            # 1. Calcula o estado desejado de todos e guarda só quem mudou
+            plans = []
+            checked = 0
+            for member in guild.members:
+                if member.bot: continue
+                if any(r.id in staff_roles for r in member.roles): continue
+                checked += 1
+                h7 = valid_hours_map.get(member.id, 0)
+                target_rank = self.get_target_rank(member, h7)
+                presente = active_days_map.get(member.id, 0) >= PRESENTE_SEMPRE_MIN_DAYS
+                plan = self.plan_member_sync(member, target_rank, presente)
+                if plan: plans.append(plan)
+
+            print(f"[ROLES] {len(plans)}/{checked} membros com alterações.")
+
+            # 2. Aplica uma única edição por membro alterado, no ritmo do token bucket
+            for plan in plans:
+                await self.apply_member_sync(guild, *plan)
+
+    @staticmethod
+    def diff_roles(member, add_ids, remove_ids):
+        """Cargos finais a partir dos cargos atuais do membro, ou None se nada muda."""
+        current = member.roles[1:]  # sem @everyone
+        current_ids = {r.id for r in current}
+        add_roles = [r for r in (member.guild.get_role(i) for i in add_ids if i not in current_ids) if r]
+        if not add_roles and not remove_ids & current_ids: return None
+        return [r for r in current if r.id not in remove_ids] + add_roles
+
+    def plan_member_sync(self, member, target_rank, presente):
+        """Retorna (member_id, rank alvo, ids a adicionar, ids a remover) se algo precisa mudar, senão None.
+
+        Só o diff é guardado: a lista final de cargos e o apelido são montados na hora de aplicar."""
+        add_ids, remove_ids = set(), set()
+        if target_rank != 'MESTRE':
+            target_role_id = RANK_ROLE_IDS.get(target_rank)
+            remove_ids.update(r_id for r_key, r_id in RANK_ROLE_IDS.items() if r_key != target_rank and r_id)
+            if target_role_id: add_ids.add(target_role_id)
+
+        if member.guild.get_role(config.ROLE_PRESENTE_SEMPRE):
+            if presente: add_ids.add(config.ROLE_PRESENTE_SEMPRE)
+            else: remove_ids.add(config.ROLE_PRESENTE_SEMPRE)
+
+        if self.diff_roles(member, add_ids, remove_ids) is None and self.build_nickname(member, target_rank) is None: return None
+        return member.id, target_rank, add_ids, remove_ids
+
+    async def apply_member_sync(self, guild, member_id, target_rank, add_ids, remove_ids):
+        await self.edit_bucket.acquire()
+        # Recalcula sobre o estado atual: cargos dados (ex: MESTRE, admin) ou apelido trocado durante a fila são mantidos
+        member = guild.get_member(member_id)
+        if not member: return
+        live_rank = self.get_target_rank(member, 0)
+        if live_rank in ('INATIVO', 'MESTRE') and live_rank != target_rank: return  # rank mudou por cargo; a próxima passada recalcula
+        new_roles = self.diff_roles(member, add_ids, remove_ids)
+        new_nick = self.build_nickname(member, target_rank)
+        kwargs = {}
+        if new_roles is not None: kwargs['roles'] = new_roles
+        if new_nick is not None: kwargs['nick'] = new_nick
+        if not kwargs: return
+        try:
+            await member.edit(**kwargs, reason="Sync de Rank")
+        except discord.Forbidden:
+            # Apelido de alguém acima do bot na hierarquia: ainda aplica os cargos
+            if 'nick' in kwargs and 'roles' in kwargs:
+                await self.edit_bucket.acquire()
+                try: await member.edit(roles=new_roles, reason="Sync de Rank")
+                except: pass
+        except discord.HTTPException as e:
+            if e.status == 429: self.edit_bucket.penalize(getattr(e, 'retry_after', None) or 10)
+        except: pass
+
+    def build_nickname(self, member, rank_key):
+        """Apelido desejado para o rank, ou None se não muda (ou se não pode ser editado)."""
+        if member.id == member.guild.owner_id: return None
         
         prefix = RANK_STYLE.get(rank_key, "")
         clean_current = utils.strip_rank_prefix(member.display_name)
@@ -111,9 +141,7 @@ class RolesManager(commands.Cog):
             if allowed > 0: new_nick = f"{prefix} {clean_current[:allowed]}…"
             else: new_nick = new_nick[:32]
 
-        if member.display_name != new_nick:
-            try: await member.edit(nick=new_nick)
-            except: pass
+        return new_nick if member.display_name != new_nick else None
 
     def get_target_rank(self, member, h7):
         if member.get_role(config.ROLE_INATIVO_ID): return 'INATIVO'
@@ -1,6 +1,6 @@
 import discord
 from discord.ext import commands, tasks
-from discord import ui
+from discord import app_commands, ui
 import datetime
 import random
 import asyncio
@@ -11,10 +11,28 @@ from constants import BR_TIMEZONE
 import quotes
 import json
 import os
-from cogs.views_polls import VotingPollView
+import math
+import functools
+from cogs.views_polls import VotingPollView, open_poll_views, parse_poll_data, poll_expiry, register_poll
+from scheduler import EventScheduler
+from views import event_renderer, migrate_rsvp_messages
 
 LORE_STATE_FILE = "lore_state.json"
 
+# Lembretes de cada evento: (nome, minutos em relação ao início, prazo máximo para disparar, flag do event_lifecycle).
+# O prazo segue as janelas dos antigos loops e permite disparar atrasado após um restart.
+EVENT_REMINDERS = [
+    ('reminder_24h', -1440, -1430, 'reminder_24h_sent'),
+    ('reminder_4h', -240, -235, 'reminder_4h_sent'),
+    ('reminder_1h', -60, -50, 'reminder_1h_sent'),
+    ('start_alert', -5, 2, 'start_alert_sent'),
+]
+# Presença: a cada 5 min entre +30 e +210 min do início. Limpeza: +215 min.
+ATTENDANCE_START_MIN = 30
+ATTENDANCE_END_MIN = 210
+ATTENDANCE_STEP_MIN = 5
+CLEANUP_AFTER_MIN = 215
+
 class ProbationDecisionView(ui.View):
     def __init__(self, bot, member_id):
         super().__init__(timeout=None)
@@ -37,31 +55,32 @@ class ProbationDecisionView(ui.View):
         member = guild.get_member(self.member_id)
         if not member: return await interaction.followup.send("Membro não encontrado.", ephemeral=True)
         await db.extend_probation(self.member_id)
-        try: await member.send(embed=discord.Embed(title="⚠️ Aviso", description="Segunda chance dada.", color=discord.Color.green()))
-        except: pass
+        self.bot.dms.send(member.id, embed=discord.Embed(title="⚠️ Aviso", description="Segunda chance dada.", color=discord.Color.green()), run="probation")
         await interaction.message.edit(content=f"🛡️ **{member.name}** salvo.", view=None, embed=None)
 
 class TasksCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.cleanup_loop.start()
-        self.reminders_loop.start()
-        self.channel_rename_loop.start()
+        self.scheduler = EventScheduler()
+        self.event_times = {}
+        self.last_attendance_tick = {}
+        self.firing = set()
+        self.scheduler.start()
+        self.schedule_sync_loop.start()
+        self.presence_loop.start()
         self.daily_morning_loop.start()
         self.daily_lore_loop.start()
-        self.attendance_monitor_loop.start()
         self.auto_survey_loop.start()
         self.probation_monitor_loop.start()
         if hasattr(self, 'polls_management_loop'): self.polls_management_loop.start()
         if hasattr(self, 'info_board_loop'): self.info_board_loop.start()
 
     def cog_unload(self):
-        self.cleanup_loop.cancel()
-        self.reminders_loop.cancel()
-        self.channel_rename_loop.cancel()
+        self.scheduler.stop()
+        self.schedule_sync_loop.cancel()
+        self.presence_loop.cancel()
         self.daily_morning_loop.cancel()
         self.daily_lore_loop.cancel()
-        self.attendance_monitor_loop.cancel()
         self.auto_survey_loop.cancel()
         self.probation_monitor_loop.cancel()
         if hasattr(self, 'polls_management_loop'): self.polls_management_loop.cancel()
@@ -104,7 +123,7 @@ class TasksCog(commands.Cog):
                 target_data = json.dumps({'date_str': 'hoje 21h', 'options': options_list})
                 view = VotingPollView(self.bot, 'what', target_data, options_list)
                 msg = await poll_channel.send(embed=embed, view=view)
-                await db.create_poll(msg.id, poll_channel.id, main_chat.guild.id, 'what', target_data)
+                await register_poll(self.bot, msg, view)
                 await main_chat.send(f"⚠️ **Sem atividades!** Vote aqui: {msg.jump_url}")
 
     @tasks.loop(time=datetime.time(hour=8, minute=0, tzinfo=BR_TIMEZONE))
@@ -120,135 +139,169 @@ class TasksCog(commands.Cog):
         idx = self.get_lore_index()
         if chan and idx < len(quotes.LORE_QUOTES): await chan.send(f"{quotes.LORE_QUOTES[idx]}"); self.increment_lore_index()
 
-    @tasks.loop(minutes=1)
-    async def reminders_loop(self):
-        await self.bot.wait_until_ready()
-        events = await db.get_active_events()
+    # --- MARCOS DOS EVENTOS (AGENDADOR) ---
+
+    def schedule_event_milestones(self, event):
+        """Registra os horários exatos de lembretes, presença e limpeza de um evento (dict do overview)."""
+        event_id = event['event_id']
+        self.scheduler.cancel_group(event_id)
+        evt_time = event['dt']
+        if not evt_time:
+            self.event_times.pop(event_id, None)
+            return
+        self.event_times[event_id] = (event['title'], evt_time)
         now = datetime.datetime.now(BR_TIMEZONE)
-        next_event = None
-        min_diff = float('inf')
+        at = lambda minutes: evt_time + datetime.timedelta(minutes=minutes)
+
+        for name, offset, deadline, flag in EVENT_REMINDERS:
+            if event['lifecycle'].get(flag) or now > at(deadline): continue
+            self.scheduler.schedule((event_id, name), at(offset), functools.partial(self.fire_reminder, event_id, name))
+
+        elapsed = (now - at(ATTENDANCE_START_MIN)).total_seconds() / 60
+        next_tick = ATTENDANCE_START_MIN + max(0, math.ceil(elapsed / ATTENDANCE_STEP_MIN)) * ATTENDANCE_STEP_MIN
+        next_tick = max(next_tick, self.last_attendance_tick.get(event_id, 0) + ATTENDANCE_STEP_MIN)
+        if next_tick <= ATTENDANCE_END_MIN:
+            self.scheduler.schedule((event_id, 'attendance'), at(next_tick), functools.partial(self.fire_attendance, event_id, next_tick))
+
+        self.scheduler.schedule((event_id, 'cleanup'), at(CLEANUP_AFTER_MIN), functools.partial(self.fire_cleanup, event_id))
+
+        # O nome do canal troca de formato (data -> horário/vagas) quando faltam menos de 7 dias
+        short_name_at = BR_TIMEZONE.localize(datetime.datetime.combine(evt_time.date() - datetime.timedelta(days=6), datetime.time()))
+        if now < short_name_at:
+            self.scheduler.schedule((event_id, 'rename'), short_name_at, functools.partial(self.refresh_channel_name, event_id))
 
+    def unschedule_event(self, event_id):
+        # Evento saiu da agenda (concluído, apagado ou inativo): libera também o estado do render
+        self.scheduler.cancel_group(event_id)
+        self.event_times.pop(event_id, None)
+        self.last_attendance_tick.pop(event_id, None)
+        event_renderer.forget(event_id)
+
+    async def schedule_event(self, event_id):
+        """Reagenda um evento após criação/edição (ou remove da agenda se não estiver mais ativo)."""
+        event = await db.get_event_overview(event_id)
+        if event: self.schedule_event_milestones(event)
+        else: self.unschedule_event(event_id)
+        await self.update_presence()
+
+    @tasks.loop(hours=1)
+    async def schedule_sync_loop(self):
+        # Reconstrói a agenda a partir do banco (no startup e como rede de segurança)
+        events = await db.get_active_events_overview()
+        active_ids = set()
         for event in events:
-            try:
-                if isinstance(event['date_time'], str): evt_time = datetime.datetime.fromisoformat(event['date_time'])
-                else: evt_time = event['date_time']
-                if evt_time.tzinfo is None: evt_time = BR_TIMEZONE.localize(evt_time)
-                diff_minutes = (evt_time - now).total_seconds() / 60
-                
-                if 0 < diff_minutes < min_diff:
-                    min_diff = diff_minutes
-                    next_event = (event['title'], diff_minutes)
-
-                lifecycle = await db.get_event_lifecycle(event['event_id'])
-                if not lifecycle: 
-                    await db.set_lifecycle_flag(event['event_id'], 'reminder_1h_sent', 0)
-                    lifecycle = {'reminder_1h_sent': 0, 'reminder_4h_sent': 0, 'reminder_24h_sent': 0, 'start_alert_sent': 0}
-
-                guild = self.bot.get_guild(event['guild_id'])
-                if not guild: continue
-                rsvps = await db.get_rsvps(event['event_id'])
-                confirmed_users = [r['user_id'] for r in rsvps if r['status'] == 'confirmed']
-                maybe_users = [r['user_id'] for r in rsvps if r['status'] == 'maybe']
-                slots = event['max_slots']
-                has_slots = len(confirmed_users) < slots
-                main_chat = guild.get_channel(config.CHANNEL_MAIN_CHAT)
-                event_channel = guild.get_channel(event['channel_id'])
-                role = guild.get_role(event['role_id'])
-
-                if 1430 <= diff_minutes <= 1450 and has_slots:
-                     if not lifecycle.get('reminder_24h_sent'):
-                         if main_chat: await main_chat.send(f"📢 **Atenção Guardiões!**\nA atividade **{event['title']}** é amanhã! Ainda há vagas. {event_channel.mention}")
-                         await db.set_lifecycle_flag(event['event_id'], 'reminder_24h_sent', 1)
-                if 235 <= diff_minutes <= 245 and has_slots:
-                    if not lifecycle.get('reminder_4h_sent'):
-                        if main_chat: await main_chat.send(f"📢 **Vagas Abertas!** **{event['title']}** começa em 4h! {event_channel.mention}")
-                        await db.set_lifecycle_flag(event['event_id'], 'reminder_4h_sent', 1)
-                if 50 <= diff_minutes <= 65:
-                    if not lifecycle.get('reminder_1h_sent'):
-                        if event_channel and role: await event_channel.send(f"{role.mention} ⏰ O evento começa em 1 hora!")
-                        if has_slots and main_chat: await main_chat.send(f"⚠️ **Última Chamada!** **{event['title']}** em 1h! {event_channel.mention}")
-                        
-                        targets = set(confirmed_users + maybe_users)
-                        for uid in targets:
-                            try:
-                                member = guild.get_member(uid)
-                                if member: await member.send(embed=discord.Embed(title=f"⏰ Lembrete: {event['title']}", description="Começa em **1 hora**.", color=discord.Color.orange()))
-                            except: pass
-                        await db.set_lifecycle_flag(event['event_id'], 'reminder_1h_sent', 1)
-                if -2 <= diff_minutes <= 5:
-                    if not lifecycle.get('start_alert_sent'):
-                        for uid in confirmed_users:
-                            try:
-                                member = guild.get_member(uid)
-                                if member: await member.send(embed=discord.Embed(title=f"🚀 Hora do Show: {event['title']}", description=f"A fireteam está reunindo!\n**Entre:** {event_channel.jump_url}", color=discord.Color.green()))
-                            except: pass
-                        await db.set_lifecycle_flag(event['event_id'], 'start_alert_sent', 1)
-            except: continue
+            active_ids.add(event['event_id'])
+            self.schedule_event_milestones(event)
+            self.request_rename(event)
+        for event_id in list(self.event_times):
+            if event_id not in active_ids: self.unschedule_event(event_id)
+        await self.update_presence()
+        # Uma vez por startup: troca os botões antigos (id no rodapé) pelos que levam o id no custom_id
+        if self.schedule_sync_loop.current_loop == 0:
+            migrated = await migrate_rsvp_messages(self.bot)
+            if migrated: print(f"[RSVP] Botões de {migrated} eventos migrados.")
+
+    async def fire_reminder(self, event_id, name):
+        key = (event_id, name)
+        if key in self.firing: return
+        self.firing.add(key)
+        try:
+            event = await db.get_event_overview(event_id)
+            if event: await self.send_reminder(event, name)
+        finally: self.firing.discard(key)
 
+    async def send_reminder(self, event, name):
+        flag = next(f for n, _, _, f in EVENT_REMINDERS if n == name)
+        if event['lifecycle'].get(flag): return
+        guild = self.bot.get_guild(event['guild_id'])
+        if not guild: return
+        confirmed_users = event['rsvps']['confirmed']
+        maybe_users = event['rsvps']['maybe']
+        has_slots = len(confirmed_users) < event['max_slots']
+        main_chat = guild.get_channel(config.CHANNEL_MAIN_CHAT)
+        event_channel = guild.get_channel(event['channel_id'])
+        chan_ref = event_channel.mention if event_channel else ""
+        role = guild.get_role(event['role_id'])
+        # Dedup das DMs pelo horário também: se o evento for remarcado, os lembretes novos não são descartados
+        dm_key = f"{event['event_id']}:{name}:{int(event['dt'].timestamp())}"
+
+        if name == 'reminder_24h':
+            if has_slots and main_chat: await main_chat.send(f"📢 **Atenção Guardiões!**\nA atividade **{event['title']}** é amanhã! Ainda há vagas. {chan_ref}")
+        elif name == 'reminder_4h':
+            if has_slots and main_chat: await main_chat.send(f"📢 **Vagas Abertas!** **{event['title']}** começa em 4h! {chan_ref}")
+        elif name == 'reminder_1h':
+            if event_channel and role: await event_channel.send(f"{role.mention} ⏰ O evento começa em 1 hora!")
+            if has_slots and main_chat: await main_chat.send(f"⚠️ **Última Chamada!** **{event['title']}** em 1h! {chan_ref}")
+            embed = discord.Embed(title=f"⏰ Lembrete: {event['title']}", description="Começa em **1 hora**.", color=discord.Color.orange())
+            for uid in dict.fromkeys(confirmed_users + maybe_users):
+                if guild.get_member(uid): self.bot.dms.send(uid, embed=embed, key=dm_key, digest="⏰ Seus eventos começam em 1 hora", run=f"{name}:{event['event_id']}")
+        elif name == 'start_alert':
+            jump = event_channel.jump_url if event_channel else ""
+            embed = discord.Embed(title=f"🚀 Hora do Show: {event['title']}", description=f"A fireteam está reunindo!\n**Entre:** {jump}", color=discord.Color.green())
+            for uid in confirmed_users:
+                if guild.get_member(uid): self.bot.dms.send(uid, embed=embed, key=dm_key, digest="🚀 Hora do Show!", run=f"{name}:{event['event_id']}")
+        await db.set_lifecycle_flag(event['event_id'], flag, 1)
+
+    async def fire_attendance(self, event_id, tick):
+        event = await db.get_event_overview(event_id)
+        if not event: return
+        self.last_attendance_tick[event_id] = tick
+        try: await self.track_attendance(event)
+        finally: self.schedule_event_milestones(event)
+
+    async def track_attendance(self, event):
+        guild = self.bot.get_guild(event['guild_id'])
+        if not guild: return
+        channel = guild.get_channel(event['channel_id'])
+        if not channel: return
+
+        voice_ids = {m.id for m in channel.members if not m.bot}
+        if not voice_ids: return
+
+        confirmed_ids = set(event['rsvps']['confirmed'])
+        valid_track = voice_ids.intersection(confirmed_ids)
+        for uid in valid_track:
+            await db.increment_event_attendance(event['event_id'], uid, ATTENDANCE_STEP_MIN)
+
+    async def fire_cleanup(self, event_id):
+        event = await db.get_event_overview(event_id)
+        self.unschedule_event(event_id)
+        if event: await self.close_event(event)
+        await self.update_presence()
+
+    @tasks.loop(minutes=5)
+    async def presence_loop(self):
+        await self.update_presence()
+
+    async def update_presence(self):
+        # Usa só a agenda em memória (sem consultar o banco)
+        now = datetime.datetime.now(BR_TIMEZONE)
+        upcoming = [(dt, title) for title, dt in self.event_times.values() if dt > now]
         try:
-            if next_event:
-                t, m = next_event
+            if upcoming:
+                dt, t = min(upcoming)
+                m = (dt - now).total_seconds() / 60
                 ts = f"{int(m//60)}h" if m > 60 else f"{int(m)}m"
                 await self.bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name=f"{t} em {ts}"))
             else:
                 await self.bot.change_presence(activity=discord.Activity(type=discord.ActivityType.custom, name="🛡️ Patrulhando a Torre"))
         except: pass
 
-    @tasks.loop(minutes=5)
-    async def attendance_monitor_loop(self):
-        await self.bot.wait_until_ready()
-        events = await db.get_active_events()
-        now = datetime.datetime.now(BR_TIMEZONE)
-        for event in events:
-            try:
-                if isinstance(event['date_time'], str): evt_time = datetime.datetime.fromisoformat(event['date_time'])
-                else: evt_time = event['date_time']
-                if evt_time.tzinfo is None: evt_time = BR_TIMEZONE.localize(evt_time)
-                diff = (now - evt_time).total_seconds() / 60
-                
-                if 30 <= diff <= 210:
-                    guild = self.bot.get_guild(event['guild_id'])
-                    if not guild: continue
-                    channel = guild.get_channel(event['channel_id'])
-                    if not channel: continue
-                    
-                    voice_ids = {m.id for m in channel.members if not m.bot}
-                    if not voice_ids: continue
-                    
-                    rsvps = await db.get_rsvps(event['event_id'])
-                    confirmed_ids = {r['user_id'] for r in rsvps if r['status'] == 'confirmed'}
-                    
-                    if not confirmed_ids.intersection(voice_ids): continue
-                    
-                    valid_track = voice_ids.intersection(confirmed_ids)
-                    for uid in valid_track:
-                        await db.increment_event_attendance(event['event_id'], uid, 5)
-            except: pass
-
     @tasks.loop(minutes=5)
     async def info_board_loop(self):
         await self.bot.wait_until_ready()
         try:
             sched_channel = self.bot.get_channel(config.CHANNEL_SCHEDULE)
             if sched_channel:
-                instr_msg, list_msg = None, None
-                async for msg in sched_channel.history(limit=20):
-                    if msg.author == self.bot.user:
-                        if msg.embeds and msg.embeds[0].title == "📅 Agendamento de Grades": instr_msg = msg
-                        elif msg.embeds and msg.embeds[0].title == "📋 Próximas Atividades": list_msg = msg
+                boards = self.bot.boards
+                has_title = lambda title: lambda m: bool(m.embeds) and m.embeds[0].title == title
                 embed_instr = discord.Embed(title="📅 Agendamento de Grades", description="Veja abaixo os eventos já marcados.\n\n**Quer criar o seu?**\nUse o comando `/agendar` no bate-papo!", color=discord.Color.green())
-                if not instr_msg: await sched_channel.send(embed=embed_instr)
-                events = await db.get_active_events()
+                await boards.publish('schedule_instructions', sched_channel, embed_instr, adopt=has_title("📅 Agendamento de Grades"))
+                events = await db.get_active_events_overview()
                 valid_events = []
                 for evt in events:
-                    try:
-                        if isinstance(evt['date_time'], str): dt = datetime.datetime.fromisoformat(evt['date_time'])
-                        else: dt = evt['date_time']
-                        if dt.tzinfo is None: dt = BR_TIMEZONE.localize(dt)
-                        rsvps = await db.get_rsvps(evt['event_id'])
-                        confirmed = len([r for r in rsvps if r['status'] == 'confirmed'])
-                        valid_events.append({'dt': dt, 'title': evt['title'], 'slots': evt['max_slots'], 'confirmed': confirmed, 'channel_id': evt['channel_id']})
-                    except: continue
+                    if not evt['dt']: continue
+                    valid_events.append({'dt': evt['dt'], 'title': evt['title'], 'slots': evt['max_slots'], 'confirmed': evt['counts']['confirmed'], 'channel_id': evt['channel_id']})
                 valid_events.sort(key=lambda x: x['dt'])
                 if not valid_events: desc_list = "*Nenhum evento agendado no momento.*"
                 else:
@@ -261,82 +314,121 @@ class TasksCog(commands.Cog):
                         lines.append(f"{status_emoji} **<t:{ts}:d> <t:{ts}:t>** | {chan_link}\n└ **{e['title']}** ({free} vagas)")
                     desc_list = "\n\n".join(lines)
                 embed_list = discord.Embed(title="📋 Próximas Atividades", description=desc_list, color=discord.Color.blue())
-                embed_list.set_footer(text=f"Atualizado em {datetime.datetime.now(BR_TIMEZONE).strftime('%H:%M')}")
-                if list_msg: await list_msg.edit(embed=embed_list)
-                else: await sched_channel.send(embed=embed_list)
-        except: pass
+                await boards.publish('schedule_list', sched_channel, embed_list, adopt=has_title("📋 Próximas Atividades"), footer=f"Atualizado em {datetime.datetime.now(BR_TIMEZONE).strftime('%H:%M')}")
+        except Exception as e: print(f"[INFO BOARD] Erro: {e}")
 
-    @tasks.loop(minutes=15)
-    async def polls_management_loop(self): pass
+    # --- VALIDADE DAS ENQUETES ---
 
-    @tasks.loop(minutes=5)
-    async def cleanup_loop(self):
-        events = await db.get_active_events()
-        now = datetime.datetime.now(BR_TIMEZONE)
-        for event in events:
-            try:
-                if isinstance(event['date_time'], str): evt_time = datetime.datetime.fromisoformat(event['date_time'])
-                else: evt_time = event['date_time']
-                if evt_time.tzinfo is None: evt_time = BR_TIMEZONE.localize(evt_time)
-            except: continue
+    def schedule_poll_expiry(self, message_id, expires_at):
+        self.scheduler.schedule(('poll', message_id), expires_at, self.expire_polls)
+
+    async def expire_polls(self):
+        """Fecha de uma vez todas as enquetes vencidas e desativa os botões de cada uma com uma única edição."""
+        closed = await db.close_expired_polls(datetime.datetime.now(BR_TIMEZONE))
+        edits = []
+        for poll in closed:
+            self.scheduler.cancel(('poll', poll['message_id']))
+            view = open_poll_views.pop(poll['message_id'], None)
+            if view:
+                async with view.lock: view.closed = True
+                for child in view.children: child.disabled = True
+                view.stop()
+            channel = self.bot.get_channel(poll['channel_id'])
+            # Sem view viva (enquete antiga) os botões são só removidos
+            if channel: edits.append(channel.get_partial_message(poll['message_id']).edit(view=view))
+        results = await asyncio.gather(*edits, return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception) and not isinstance(r, discord.NotFound): print(f"[POLLS] Erro ao encerrar enquete: {r}")
+        if closed: print(f"[POLLS] {len(closed)} enquetes expiradas encerradas.")
+
+    @tasks.loop(hours=6)
+    async def polls_management_loop(self):
+        # Agenda a validade das enquetes abertas (no startup e como rede de segurança) e poda votos antigos
+        for poll in await db.get_active_polls():
+            expires_at = poll['expires']
+            if expires_at is None:
+                # Enquetes criadas antes da validade existir
+                view = open_poll_views.get(poll['message_id'])
+                expires_at = view.expires_at if view else poll_expiry(poll['poll_type'], parse_poll_data(poll['poll_type'], poll['target_data']))
+                await db.set_poll_expiry(poll['message_id'], expires_at)
+            self.schedule_poll_expiry(poll['message_id'], expires_at)
+        pruned = await db.prune_closed_poll_votes()
+        if pruned: print(f"[POLLS] {pruned} votos de enquetes antigas removidos.")
+
+    async def close_event(self, event):
+        evt_time = event['dt']
+        guild = self.bot.get_guild(event['guild_id'])
+        if guild:
+            confirmed_ids = set(event['rsvps']['confirmed'])
             
-            if now > evt_time + datetime.timedelta(minutes=215):
-                guild = self.bot.get_guild(event['guild_id'])
-                if guild:
-                    rsvps = await db.get_rsvps(event['event_id'])
-                    confirmed_ids = {r['user_id'] for r in rsvps if r['status'] == 'confirmed'}
-                    
-                    valid_attendees = await db.get_valid_attendees(event['event_id'], min_minutes=60)
-                    valid_set = set(valid_attendees)
-                    
-                    users_present = confirmed_ids.intersection(valid_set)
-                    users_flake = confirmed_ids.difference(valid_set)
-
-                    def format_clean(uids):
-                        if not uids: return "Ninguém"
-                        names = []
-                        for uid in uids:
-                            mem = guild.get_member(uid)
-                            dname = utils.clean_voter_name(mem.display_name) if mem else f"ID {uid}"
-                            names.append(f"`{dname}`")
-                        return ", ".join(names)
-
-                    log_channel = guild.get_channel(config.CHANNEL_EVENT_LOGS)
-                    if log_channel:
-                        embed = discord.Embed(title=f"📝 Relatório: {event['title']}", description=f"**Data:** {evt_time.strftime('%d/%m %H:%M')}\n**Critério:** RSVP + 60min na call.", color=discord.Color.blue())
-                        embed.add_field(name=f"✅ Presentes ({len(users_present)})", value=format_clean(users_present), inline=False)
-                        if users_flake: embed.add_field(name=f"❌ Faltas ({len(users_flake)})", value=format_clean(users_flake), inline=False)
-                        await log_channel.send(embed=embed)
-                    
-                    try: 
-                        c = guild.get_channel(event['channel_id'])
-                        if c: await c.delete(reason="Fim")
-                    except: pass
-                    try:
-                        r = guild.get_role(event['role_id'])
-                        if r: await r.delete(reason="Fim")
-                    except: pass
-                
-                await db.update_event_status(event['event_id'], 'completed')
-
-    @tasks.loop(minutes=15)
-    async def channel_rename_loop(self):
-        events = await db.get_active_events()
-        for event in events:
+            valid_attendees = await db.get_valid_attendees(event['event_id'], min_minutes=60)
+            valid_set = set(valid_attendees)
+            
+            users_present = confirmed_ids.intersection(valid_set)
+            users_flake = confirmed_ids.difference(valid_set)
+
+            def format_clean(uids):
+                if not uids: return "Ninguém"
+                names = []
+                for uid in uids:
+                    mem = guild.get_member(uid)
+                    dname = utils.clean_voter_name(mem.display_name) if mem else f"ID {uid}"
+                    names.append(f"`{dname}`")
+                return ", ".join(names)
+
+            log_channel = guild.get_channel(config.CHANNEL_EVENT_LOGS)
+            if log_channel:
+                embed = discord.Embed(title=f"📝 Relatório: {event['title']}", description=f"**Data:** {evt_time.strftime('%d/%m %H:%M')}\n**Critério:** RSVP + 60min na call.", color=discord.Color.blue())
+                embed.add_field(name=f"✅ Presentes ({len(users_present)})", value=format_clean(users_present), inline=False)
+                if users_flake: embed.add_field(name=f"❌ Faltas ({len(users_flake)})", value=format_clean(users_flake), inline=False)
+                await log_channel.send(embed=embed)
+            
+            self.bot.renamer.forget(event['channel_id'])
+            try: 
+                c = guild.get_channel(event['channel_id'])
+                if c: await c.delete(reason="Fim")
+            except: pass
             try:
-                guild = self.bot.get_guild(event['guild_id'])
-                if not guild: continue
-                channel = guild.get_channel(event['channel_id'])
-                if not channel: continue
-                rsvps = await db.get_rsvps(event['event_id'])
-                confirmed_count = len([r for r in rsvps if r['status'] == 'confirmed'])
-                if isinstance(event['date_time'], str): evt_time = datetime.datetime.fromisoformat(event['date_time'])
-                else: evt_time = event['date_time']
-                if evt_time.tzinfo is None: evt_time = BR_TIMEZONE.localize(evt_time)
-                free_slots = max(0, event['max_slots'] - confirmed_count)
-                new_name = utils.generate_channel_name(event['title'], evt_time, event['activity_type'], free_slots, description=event['description'])
-                if channel.name != new_name: await channel.edit(name=new_name)
+                r = guild.get_role(event['role_id'])
+                if r: await r.delete(reason="Fim")
             except: pass
+        
+        await db.update_event_status(event['event_id'], 'completed')
+
+    def request_rename(self, event):
+        """Envia o nome desejado do canal do evento (dict do overview) para o coalescer de renomeações."""
+        try:
+            guild = self.bot.get_guild(event['guild_id'])
+            channel = guild.get_channel(event['channel_id']) if guild else None
+            if not channel or not event['dt']: return
+            free_slots = max(0, event['max_slots'] - event['counts']['confirmed'])
+            new_name = utils.generate_channel_name(event['title'], event['dt'], event['activity_type'], free_slots, description=event['description'])
+            self.bot.renamer.request(channel, new_name)
+        except Exception as e: print(f"[RENAME] Erro no evento {event.get('event_id')}: {e}")
+
+    async def refresh_channel_name(self, event_id):
+        event = await db.get_event_overview(event_id)
+        if event: self.request_rename(event)
+
+    @app_commands.command(name="diagnostico", description="Admin: Contadores internos (fila do banco, cache, renders, DMs, renomeações).")
+    @app_commands.checks.has_permissions(administrator=True)
+    async def diagnostics(self, interaction: discord.Interaction):
+        sections = {
+            "🗄️ Fila de escrita": db.get_write_queue_stats(),
+            "📦 Cache de eventos": db.get_event_cache_stats(),
+            "🖼️ Renders de evento": event_renderer.stats,
+            "✉️ DMs": self.bot.dms.get_stats(),
+            "✏️ Renomeações": self.bot.renamer.stats,
+            "📌 Quadros": self.bot.boards.stats,
+        }
+        embed = discord.Embed(title="🩺 Diagnóstico", color=discord.Color.dark_grey())
+        for name, stats in sections.items():
+            embed.add_field(name=name, value="\n".join(f"`{k}`: {v}" for k, v in stats.items()) or "-", inline=True)
+        runs = list(self.bot.dms.runs.items())[-5:]
+        if runs:
+            lines = [f"`{run}`: " + ", ".join(f"{k}={v}" for k, v in counter.items()) for run, counter in runs]
+            embed.add_field(name="✉️ Últimas rodadas de DM", value="\n".join(lines)[:1024], inline=False)
+        await interaction.response.send_message(embed=embed, ephemeral=True)
 
     @tasks.loop(hours=24)
     async def probation_monitor_loop(self):
@@ -365,8 +457,16 @@ class TasksCog(commands.Cog):
                 await log_channel.send(embed=embed, view=ProbationDecisionView(self.bot, member.id))
             except: pass
 
-    @cleanup_loop.before_loop
-    async def before_cleanup(self):
+    @schedule_sync_loop.before_loop
+    async def before_schedule_sync(self):
+        await self.bot.wait_until_ready()
+
+    @presence_loop.before_loop
+    async def before_presence(self):
+        await self.bot.wait_until_ready()
+
+    @polls_management_loop.before_loop
+    async def before_polls_management(self):
         await self.bot.wait_until_ready()
 
 async def setup(bot):
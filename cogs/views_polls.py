@@ -1,3 +1,4 @@
+import asyncio
 import discord
 import database as db
 import utils
@@ -5,158 +6,147 @@ import config
 import json
 import datetime
 from constants import BR_TIMEZONE
+from provisioning import provision_event
+
+# Enquete sem data aproveitável expira depois disso
+POLL_DEFAULT_TTL = datetime.timedelta(days=3)
+# Vida mínima: uma data já passada (ex: "hoje 9h" às 10h) não fecha a enquete no próximo ciclo
+POLL_MIN_TTL = datetime.timedelta(hours=2)
+
+# Views vivas das enquetes abertas: message_id -> VotingPollView
+open_poll_views = {}
+
+def parse_poll_data(poll_type, target_data):
+    """target_data é JSON com as opções; enquetes 'when' antigas guardavam só o nome da atividade."""
+    try:
+        data = json.loads(target_data)
+        if isinstance(data, dict): return data
+    except: pass
+    return {'activity': target_data} if poll_type == 'when' else {}
+
+def poll_expiry(poll_type, data, option_times=()):
+    """Quando a enquete deixa de fazer sentido: o último horário votável ('when') ou a data fixa ('what').
+    Nunca antes de POLL_MIN_TTL a partir de agora."""
+    if poll_type == 'when': expires_at = max(option_times, default=None)
+    else:
+        try: expires_at = utils.parse_human_date(data.get('date_str', ''))
+        except: expires_at = None
+    now = datetime.datetime.now(BR_TIMEZONE)
+    if not expires_at: return now + POLL_DEFAULT_TTL
+    return max(expires_at, now + POLL_MIN_TTL)
 
 # --- CLASSE BASE PARA ENQUETES ---
 class PollView(discord.ui.View):
-    def __init__(self, bot, poll_type, target_data):
+    def __init__(self, bot, poll_type, target_data, tally=None):
         super().__init__(timeout=None)
         self.bot = bot
         self.poll_type = poll_type
         self.target_data = target_data
+        self.data = parse_poll_data(poll_type, target_data)
         self.threshold = 3 if poll_type == 'when' else 4
+        # Placar em memória: opção -> {user_id: None} (dict como conjunto ordenado pela ordem de voto)
+        self.tally = tally if tally is not None else {}
+        self.options = {}  # valor -> cabeçalho já formatado, na ordem dos botões
+        # Votos da mesma enquete são aplicados um por vez: só um deles pode cruzar a meta e fechar
+        self.lock = asyncio.Lock()
+        self.closed = False
+
+    def option_time(self, value):
+        """Data/hora de uma opção 'when' (None se não for possível interpretar)."""
+        try: return utils.parse_human_date(value)
+        except: return None
+
+    def option_heading(self, value, dt=None):
+        """Cabeçalho da opção no embed; calculado uma vez por opção na criação da view."""
+        if self.poll_type != 'when': return f"**{value}**"
+        # Timestamp Dinâmico (<t:XXX:F>), com fallback visual para o texto original
+        date_display = f"<t:{int(dt.timestamp())}:F>" if dt else value
+        return f"🗓️ **{date_display}**"
 
     async def handle_vote(self, interaction: discord.Interaction, option: str):
         await interaction.response.defer()
-        user_id = interaction.user.id
-        message_id = interaction.message.id
-        
-        # 1. Lógica de Toggle (Votos Múltiplos)
-        has_voted = await db.check_user_vote_on_option(message_id, user_id, option)
-        
-        if has_voted:
-            await db.remove_poll_vote_option(message_id, user_id, option)
-        else:
-            await db.add_poll_vote(message_id, user_id, option)
-        
-        # 2. Recuperar Votos
-        votes = await db.get_poll_voters_detailed(message_id)
-        
-        vote_map = {}
-        for row in votes:
-            opt = row['vote_option']
-            uid = row['user_id']
-            if opt not in vote_map: vote_map[opt] = []
-            vote_map[opt].append(uid)
-            
-        # 3. Recuperar TODAS as opções (incluindo as com 0 votos) dos botões
-        all_options = []
-        for child in self.children:
-            if isinstance(child, VotingButton) and child.value not in all_options:
-                all_options.append(child.value)
+        result = await self.apply_vote(interaction.message, interaction.guild, interaction.user.id, option)
+        if result is None:
+            return await interaction.followup.send("⚠️ Esta enquete já foi encerrada.", ephemeral=True)
+        winner_option, winning_voters = result
+        if winner_option: await self.trigger_event_creation(interaction, winner_option, winning_voters)
 
-        # 4. Reconstruir Embed com Design "Suggestion C"
-        embed = interaction.message.embeds[0]
-        new_desc_lines = []
-        winner_option = None
-        
-        # Ordena opções: primeiro por número de votos (decrescente), depois alfabético
-        sorted_options = sorted(all_options, key=lambda x: len(vote_map.get(x, [])), reverse=True)
-        
-        for opt in sorted_options:
-            user_ids = vote_map.get(opt, [])
-            count = len(user_ids)
-            
-            # Checa Vencedor
-            if count >= self.threshold and not winner_option: 
-                winner_option = opt
-            
-            # Formata Nomes
-            voter_names = []
-            guild = interaction.guild
-            for uid in user_ids:
-                dname = await utils.get_user_display_name_static(uid, self.bot, guild)
-                voter_names.append(utils.clean_voter_name(dname))
-            names_str = ", ".join(voter_names) if voter_names else "-"
+    async def apply_vote(self, message, guild, user_id, option):
+        """Aplica um voto sob o lock da enquete: grava, re-renderiza e, se a meta foi batida, tenta fechar.
 
-            # --- ESTILIZAÇÃO VISUAL ---
-            if self.poll_type == 'when':
-                # Parse para Timestamp Dinâmico (<t:XXX:F>)
-                try:
-                    dt = utils.parse_human_date(opt)
-                    # Fallback visual se o parse falhar (usa o texto original)
-                    date_display = f"<t:{int(dt.timestamp())}:F>" if dt else opt
-                except:
-                    date_display = opt
-                
-                check_mark = "✅" if count >= self.threshold else ""
-                line = f"🗓️ **{date_display}** {check_mark}\n`{count}` Votos: {names_str}\n"
-                
-            else:
-                # Estilo para Atividades (Poll What)
-                check_mark = "✅" if count >= self.threshold else ""
-                line = f"**{opt}** {check_mark}\n`{count}` Votos: {names_str}\n"
+        Retorna None se a enquete já estava encerrada; senão (opção vencedora, votantes), com a opção
+        preenchida só para o voto que de fato fechou a enquete (quem deve criar o evento)."""
+        async with self.lock:
+            if self.closed: return None
 
-            new_desc_lines.append(line)
-            
-        base_desc = f"Meta para confirmar: **{self.threshold} votos**\n\n"
-        embed.description = base_desc + "".join(new_desc_lines)
-        await interaction.message.edit(embed=embed)
-        
-        # 5. Disparar criação se venceu
-        if winner_option:
-            await self.trigger_event_creation(interaction, winner_option)
+            # 1. Lógica de Toggle (Votos Múltiplos)
+            await self.toggle_vote(message.id, user_id, option)
 
-    async def trigger_event_creation(self, interaction, winner_value):
-        poll = await db.get_poll_details(interaction.message.id)
-        if poll and poll['status'] == 'closed': return
-        await db.close_poll(interaction.message.id)
+            # 2. Reconstruir Embed com Design "Suggestion C"
+            embed = message.embeds[0]
+            embed.description, winner_option = await self.render_tally(guild)
+            await message.edit(embed=embed)
 
+            # 3. Vencedor decidido pelo placar; só quem fecha a enquete no banco cria o evento
+            if not winner_option or not await self.close(message.id): return None, []
+            return winner_option, list(self.tally[winner_option])
+
+    async def toggle_vote(self, message_id, user_id, option):
+        """Alterna o voto no banco (uma escrita) e aplica o resultado ao placar. Retorna True se o voto ficou."""
+        added = await db.toggle_poll_vote(message_id, user_id, option)
+        voters = self.tally.setdefault(option, {})
+        if added: voters[user_id] = None
+        else: voters.pop(user_id, None)
+        return added
+
+    async def close(self, message_id):
+        """Encerra a enquete no banco (compare-and-set) e só depois marca a view; True se foi esta chamada que fechou.
+        Se o banco falhar, a exceção sobe e a view continua aberta."""
+        if self.closed: return False
+        won = await db.close_poll_if_open(message_id)
+        # Fechada agora ou antes por outro caminho (ex: expiração): a view deixa de aceitar votos
+        self.closed = True
+        open_poll_views.pop(message_id, None)
+        return won
+
+    async def render_tally(self, guild):
+        """Descrição do embed a partir do placar em memória; retorna (descrição, opção vencedora ou None)."""
+        names = await utils.resolve_display_names({uid for uids in self.tally.values() for uid in uids}, self.bot, guild)
+        # Ordena opções por número de votos (decrescente), mantendo a ordem original no empate
+        sorted_options = sorted(self.options, key=lambda opt: len(self.tally.get(opt, ())), reverse=True)
+        winner_option = None
+        lines = []
+        for opt in sorted_options:
+            user_ids = self.tally.get(opt, {})
+            count = len(user_ids)
+            if count >= self.threshold and not winner_option: winner_option = opt
+            names_str = ", ".join(utils.clean_voter_name(names[uid]) for uid in user_ids) or "-"
+            check_mark = "✅" if count >= self.threshold else ""
+            lines.append(f"{self.options[opt]} {check_mark}\n`{count}` Votos: {names_str}\n")
+        return f"Meta para confirmar: **{self.threshold} votos**\n\n" + "".join(lines), winner_option
+
+    async def trigger_event_creation(self, interaction, winner_value, winning_voters):
         final_title = ""
         final_dt = None
         
         if self.poll_type == 'when':
-            final_title = self.target_data
+            final_title = self.data.get('activity', '')
             final_dt = utils.parse_human_date(winner_value)
         elif self.poll_type == 'what':
             final_title = winner_value
-            try:
-                data = json.loads(self.target_data)
-                final_dt = utils.parse_human_date(data.get('date_str', 'hoje 21h'))
-            except:
-                final_dt = utils.parse_human_date("hoje 21h")
+            final_dt = utils.parse_human_date(self.data.get('date_str', 'hoje 21h'))
 
         if not final_dt: return await interaction.channel.send("❌ Erro ao processar data.")
 
         official_name, act_type, slots = utils.detect_activity_details(final_title)
         if slots is None: slots = 6
         
-        guild = interaction.guild
-        role_name = f"{official_name[:15]} {final_dt.strftime('%d/%m')}"
-        role = await guild.create_role(name=role_name, mentionable=True, reason="Enquete Vencedora")
-
-        category = guild.get_channel(config.CATEGORY_EVENTS_ID)
-        channel_name = utils.generate_channel_name(official_name, final_dt, act_type, slots, description="Criado via Enquete")
-        
-        if category: channel = await guild.create_text_channel(name=channel_name, category=category)
-        else: channel = await guild.create_text_channel(name=channel_name)
-
-        from views import PersistentRsvpView
-        embed_loading = discord.Embed(title="Gerando evento...", color=discord.Color.gold())
-        msg = await channel.send(content=f"{role.mention} A comunidade decidiu!", embed=embed_loading, view=PersistentRsvpView())
-
-        create_data = {
-            'guild_id': guild.id, 'channel_id': channel.id, 'message_id': msg.id,
-            'role_id': role.id, 'title': official_name, 'desc': "Criado via Enquete",
-            'type': act_type, 'date': final_dt, 'slots': slots, 'creator': self.bot.user.id
-        }
-        event_id = await db.create_event(create_data)
-        
-        db_data = create_data.copy()
-        db_data['event_id'] = event_id
-        db_data['date_time'] = final_dt
-        db_data['max_slots'] = slots
-        
-        winning_voters = await db.get_voters_for_option(interaction.message.id, winner_value)
-        for uid in winning_voters:
-            await db.update_rsvp(event_id, uid, 'confirmed')
-            try:
-                member = guild.get_member(uid)
-                if member: await member.add_roles(role)
-            except: pass
-        
-        rsvps = await db.get_rsvps(event_id)
-        final_embed = await utils.build_event_embed(db_data, rsvps, self.bot)
-        await msg.edit(embed=final_embed)
+        result = await provision_event(self.bot, interaction.guild, title=official_name, description="Criado via Enquete",
+                                       activity_type=act_type, dt=final_dt, max_slots=slots, creator_id=self.bot.user.id,
+                                       confirmed_ids=winning_voters, role_name=f"{official_name[:15]} {final_dt.strftime('%d/%m')}",
+                                       announcement="A comunidade decidiu!", reason="Enquete Vencedora")
+        if not result: return await interaction.channel.send("❌ Erro ao criar o evento da enquete.")
+        event_id, channel = result
         
         await interaction.channel.send(f"🎉 Evento criado em {channel.mention} com {len(winning_voters)} confirmados!")
         
@@ -164,22 +154,51 @@ class PollView(discord.ui.View):
         except: pass
 
 class VotingPollView(PollView):
-    def __init__(self, bot, poll_type, target_data, options_list):
-        super().__init__(bot, poll_type, target_data)
+    def __init__(self, bot, poll_type, target_data, options_list, tally=None):
+        super().__init__(bot, poll_type, target_data, tally)
+        option_times = []
         for opt in options_list:
             label = opt.get('label', opt.get('value'))
             value = opt.get('value', label)
+            if value in self.options: continue
+            dt = self.option_time(value) if poll_type == 'when' else None
+            if dt: option_times.append(dt)
+            self.options[value] = self.option_heading(value, dt)
             self.add_item(VotingButton(label, value))
+        self.expires_at = poll_expiry(poll_type, self.data, option_times)
 
-    @discord.ui.button(label="🗑️ Apagar", style=discord.ButtonStyle.danger, row=4)
+    @discord.ui.button(label="🗑️ Apagar", style=discord.ButtonStyle.danger, row=4, custom_id="poll_delete")
     async def btn_delete(self, interaction: discord.Interaction, button: discord.ui.Button):
         if not interaction.user.guild_permissions.manage_messages:
             return await interaction.response.send_message("❌ Apenas Moderadores podem apagar enquetes.", ephemeral=True)
             
-        await db.close_poll(interaction.message.id)
+        async with self.lock: await self.close(interaction.message.id)
         await interaction.message.delete()
         await interaction.response.send_message("Enquete apagada.", ephemeral=True)
 
+async def register_poll(bot, message, view):
+    """Grava a enquete recém-enviada, guarda a view viva e agenda a expiração."""
+    await db.create_poll(message.id, message.channel.id, message.guild.id, view.poll_type, view.target_data, view.expires_at)
+    open_poll_views[message.id] = view
+    tasks_cog = bot.get_cog('TasksCog')
+    if tasks_cog: tasks_cog.schedule_poll_expiry(message.id, view.expires_at)
+
+async def restore_poll_views(bot):
+    """Religa as views das enquetes abertas após um restart: uma leitura das enquetes e uma dos votos."""
+    polls = await db.get_active_polls()
+    tallies = await db.get_open_poll_votes()
+    restored = 0
+    for poll in polls:
+        options = parse_poll_data(poll['poll_type'], poll['target_data']).get('options')
+        if not options:
+            print(f"[POLLS] Enquete {poll['message_id']} sem opções salvas; botões não restaurados.")
+            continue
+        view = VotingPollView(bot, poll['poll_type'], poll['target_data'], options, tally=tallies.get(poll['message_id'], {}))
+        bot.add_view(view, message_id=poll['message_id'])
+        open_poll_views[poll['message_id']] = view
+        restored += 1
+    return restored
+
 class VotingButton(discord.ui.Button):
     def __init__(self, label, value):
         super().__init__(label=label, style=discord.ButtonStyle.secondary, custom_id=f"vote_{label[:20]}")
@@ -245,7 +264,8 @@ class PollBuilderView(discord.ui.View):
             
             desc_lines.append(f"🗓️ **{ts_display}**\n0 Votos: -\n")
             
-        poll_view = VotingPollView(self.bot, 'when', self.activity_name, options_list)
+        target_data = json.dumps({'activity': self.activity_name, 'options': options_list})
+        poll_view = VotingPollView(self.bot, 'when', target_data, options_list)
         
         embed = discord.Embed(
             title=f"📊 Horário: {self.activity_name}",
@@ -257,7 +277,7 @@ class PollBuilderView(discord.ui.View):
         try:
             poll_channel = interaction.channel
             msg = await poll_channel.send(embed=embed, view=poll_view)
-            await db.create_poll(msg.id, poll_channel.id, interaction.guild.id, 'when', self.activity_name)
+            await register_poll(self.bot, msg, poll_view)
             
             main_chat = interaction.guild.get_channel(config.CHANNEL_MAIN_CHAT)
             if main_chat and interaction.channel_id != config.CHANNEL_MAIN_CHAT:
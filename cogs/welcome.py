@@ -84,10 +84,8 @@ class StaffApprovalView(ui.View):
             try: await self.member.add_roles(*roles_to_add)
             except: pass
 
-        try:
-            embed_dm = discord.Embed(title="🚀 Acesso Aprovado!", description="Bem-vindo ao Clã! Agora você tem acesso total ao servidor.", color=discord.Color.green())
-            await self.member.send(embed=embed_dm)
-        except: pass
+        embed_dm = discord.Embed(title="🚀 Acesso Aprovado!", description="Bem-vindo ao Clã! Agora você tem acesso total ao servidor.", color=discord.Color.green())
+        self.bot.dms.send(self.member.id, embed=embed_dm, run="onboarding")
 
         main_chat = guild.get_channel(config.CHANNEL_MAIN_CHAT)
         if main_chat:
@@ -281,8 +279,8 @@ class WelcomeCog(commands.Cog):
         for channel in category.text_channels:
             if channel.name.startswith("👋│boas-vindas-"):
                 try:
-                    last_msg_time = channel.created_at
-                    async for msg in channel.history(limit=1): last_msg_time = msg.created_at
+                    # last_message_id vem do gateway: sem chamada REST por canal
+                    last_msg_time = discord.utils.snowflake_time(channel.last_message_id) if channel.last_message_id else channel.created_at
                     if (now - last_msg_time).total_seconds() > 86400: # 24h
                         target_member = None
                         for target in channel.overwrites:
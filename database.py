@@ -1,120 +1,627 @@
 import aiosqlite
+import asyncio
+import collections
 import datetime
+from contextlib import asynccontextmanager
 from constants import BR_TIMEZONE
 
 DB_NAME = "clan_bot.db"
+DB_READERS = 3
+
+# Write-behind: escritas de alta frequência são agrupadas num commit a cada N ms ou M operações
+WRITE_BEHIND_DELAY = 0.25
+WRITE_BEHIND_BATCH = 200
+
+# Linhas de `events` mantidas em memória (botões e renders leem o mesmo evento a cada clique)
+EVENT_CACHE_SIZE = 512
+
+# Aplicados em toda conexão do pool (WAL permite leitores em paralelo com o escritor)
+DB_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA mmap_size = 67108864",
+]
+
+# --- POOL DE CONEXÕES ---
+
+class ConnectionPool:
+    """Conexões persistentes: uma escritora (serializada por lock) e N leitoras.
+
+    Abre sozinho no primeiro uso; depois de um `close()` explícito, read/write levantam RuntimeError
+    em vez de reabrir (uma escrita atrasada após o close_db não pode vazar conexões novas)."""
+
+    def __init__(self, path, readers=DB_READERS):
+        self.path = path
+        self.readers_count = readers
+        self._writer = None
+        self._readers = None
+        self._all = []
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        self._closed = False
+
+    @property
+    def is_open(self):
+        return self._writer is not None
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.path)
+        conn.row_factory = aiosqlite.Row
+        for pragma in DB_PRAGMAS: await conn.execute(pragma)
+        self._all.append(conn)
+        return conn
+
+    async def _ensure_open(self):
+        if self.is_open: return
+        if self._closed: raise RuntimeError(f"[DB] Pool de {self.path} já foi fechado")
+        await self.open()
+
+    async def open(self):
+        async with self._open_lock:
+            self._closed = False
+            if self.is_open: return
+            # O escritor abre primeiro para o WAL já estar ativo quando os leitores conectarem
+            writer = await self._connect()
+            readers = asyncio.Queue()
+            for _ in range(self.readers_count): readers.put_nowait(await self._connect())
+            self._readers = readers
+            self._writer = writer
+
+    async def close(self):
+        async with self._open_lock:
+            self._closed = True
+            if not self.is_open: return
+            async with self._write_lock:
+                try: await self._writer.execute("PRAGMA optimize")
+                except: pass
+                for conn in self._all:
+                    try: await conn.close()
+                    except Exception as e: print(f"[DB] Erro ao fechar conexão: {e}")
+                self._all = []
+                self._writer = None
+                self._readers = None
+
+    @asynccontextmanager
+    async def read(self):
+        await self._ensure_open()
+        readers = self._readers
+        conn = await readers.get()
+        try: yield conn
+        finally: readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def write(self):
+        await self._ensure_open()
+        async with self._write_lock:
+            conn = self._writer
+            try:
+                yield conn
+                await conn.commit()
+            except:
+                await conn.rollback()
+                raise
+
+_pool = ConnectionPool(DB_NAME)
+
+# --- FILA WRITE-BEHIND ---
+
+class WriteBehindQueue:
+    """Agrupa escritas pequenas (sessões de voz, presença, votos, flags) numa única transação.
+
+    `enqueue` retorna na hora; um worker grava o lote após `delay` segundos ou ao juntar `batch` operações.
+    Leituras que dependem dessas tabelas chamam `barrier(tabela)` antes (read-your-writes).
+    """
+
+    def __init__(self, pool, delay=WRITE_BEHIND_DELAY, batch=WRITE_BEHIND_BATCH):
+        self.pool = pool
+        self.delay = delay
+        self.batch = batch
+        self._pending = []
+        self._tables = collections.Counter()  # pendentes + em gravação, por tabela
+        self._seq = 0
+        self._committed = 0
+        self._wake = asyncio.Event()
+        self._urgent = False
+        self._batch_done = None
+        self._task = None
+        self.stats = {'enqueued': 0, 'written': 0, 'batches': 0, 'errors': 0, 'max_depth': 0, 'last_batch_ms': 0}
+
+    def _ensure_worker(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, tables, statements):
+        """`statements`: lista de (sql, params) aplicada em ordem, junto com as demais do lote."""
+        self._seq += 1
+        self._pending.append((self._seq, tables, statements))
+        for t in tables: self._tables[t] += 1
+        self.stats['enqueued'] += 1
+        self.stats['max_depth'] = max(self.stats['max_depth'], len(self._pending))
+        self._ensure_worker()
+        if len(self._pending) == 1 or len(self._pending) >= self.batch: self._wake.set()
+
+    def depth(self):
+        return len(self._pending)
+
+    async def flush(self):
+        """Espera até tudo que foi enfileirado antes desta chamada estar commitado."""
+        target = self._seq
+        while self._committed < target:
+            self._ensure_worker()
+            if self._batch_done is None: self._batch_done = asyncio.get_running_loop().create_future()
+            done = self._batch_done
+            self._urgent = True
+            self._wake.set()
+            await asyncio.shield(done)
+
+    async def barrier(self, *tables):
+        if any(self._tables[t] for t in tables): await self.flush()
+
+    async def close(self):
+        await self.flush()
+        if self._task: self._task.cancel()
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if not self._pending: continue
+            if len(self._pending) < self.batch and not self._urgent:
+                try: await asyncio.wait_for(self._wake.wait(), timeout=self.delay)
+                except asyncio.TimeoutError: pass
+                self._wake.clear()
+            self._urgent = False
+            await self._write_batch()
+            if self._pending: self._wake.set()
+
+    async def _write_batch(self):
+        batch, self._pending = self._pending[:self.batch], self._pending[self.batch:]
+        started = asyncio.get_running_loop().time()
+        try:
+            async with self.pool.write() as db:
+                for _, _, statements in batch:
+                    for sql, params in statements: await db.execute(sql, params)
+        except Exception as e:
+            # Uma operação ruim não derruba o lote inteiro: regrava uma a uma
+            print(f"[DB] Erro no lote write-behind ({len(batch)} ops), regravando individualmente: {e}")
+            for _, _, statements in batch:
+                try:
+                    async with self.pool.write() as db:
+                        for sql, params in statements: await db.execute(sql, params)
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    print(f"[DB] Escrita descartada: {e}")
+        finally:
+            for _, tables, _ in batch:
+                for t in tables: self._tables[t] -= 1
+            self._committed = batch[-1][0]
+            self.stats['written'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['last_batch_ms'] = round((asyncio.get_running_loop().time() - started) * 1000, 1)
+            done, self._batch_done = self._batch_done, None
+            if done and not done.done(): done.set_result(None)
+
+_writes = WriteBehindQueue(_pool)
+
+class EventCache:
+    """Cache LRU das linhas de `events`. Toda escrita em `events` chama invalidate(); uma leitura
+    iniciada antes de uma invalidação não é guardada, para nunca reviver uma linha antiga."""
+
+    def __init__(self, size=EVENT_CACHE_SIZE):
+        self.size = size
+        self._rows = collections.OrderedDict()
+        self.generation = 0
+        self.stats = collections.Counter()
+
+    def get(self, event_id):
+        row = self._rows.get(event_id)
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        self._rows.move_to_end(event_id)
+        self.stats['hits'] += 1
+        return row
+
+    def put(self, event_id, row, generation):
+        if row is None or generation != self.generation: return
+        self._rows[event_id] = row
+        self._rows.move_to_end(event_id)
+        while len(self._rows) > self.size: self._rows.popitem(last=False)
+
+    def invalidate(self, *event_ids):
+        self.generation += 1
+        for event_id in event_ids: self._rows.pop(event_id, None)
+
+_events = EventCache()
+
+def get_write_queue_stats():
+    return {**_writes.stats, 'depth': _writes.depth()}
+
+async def close_db():
+    # Grava o que ainda está na fila antes de fechar as conexões
+    await _writes.close()
+    await _pool.close()
+
+# --- MIGRAÇÕES ---
+
+async def _column_exists(db, table, column):
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        return any(r['name'] == column for r in await cursor.fetchall())
+
+async def _add_column(db, table, column, ddl):
+    if not await _column_exists(db, table, column):
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+async def _migration_001_base(db):
+    # Tabelas Principais
+    await db.execute("CREATE TABLE IF NOT EXISTS events (event_id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER, channel_id INTEGER, message_id INTEGER, role_id INTEGER, title TEXT, description TEXT, activity_type TEXT, date_time TIMESTAMP, max_slots INTEGER, creator_id INTEGER, status TEXT DEFAULT 'active')")
+    await db.execute("CREATE TABLE IF NOT EXISTS rsvps (event_id INTEGER, user_id INTEGER, status TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (event_id, user_id), FOREIGN KEY(event_id) REFERENCES events(event_id) ON DELETE CASCADE)")
+    await db.execute("CREATE TABLE IF NOT EXISTS voice_sessions (session_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, start_time TIMESTAMP, end_time TIMESTAMP, duration_minutes INTEGER, is_valid BOOLEAN DEFAULT 1)")
+
+    # Configurações e Polls
+    await db.execute("CREATE TABLE IF NOT EXISTS guild_settings (guild_id INTEGER PRIMARY KEY, manager_role_id INTEGER)")
+    await db.execute("CREATE TABLE IF NOT EXISTS polls (message_id INTEGER PRIMARY KEY, channel_id INTEGER, guild_id INTEGER, poll_type TEXT, target_data TEXT, status TEXT DEFAULT 'open', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    await db.execute("CREATE TABLE IF NOT EXISTS poll_votes_v2 (poll_message_id INTEGER, user_id INTEGER, vote_option TEXT, PRIMARY KEY (poll_message_id, user_id, vote_option))")
+
+    # Ciclo de Vida e Histórico
+    await db.execute("CREATE TABLE IF NOT EXISTS event_lifecycle (event_id INTEGER PRIMARY KEY, maybe_alert_sent BOOLEAN DEFAULT 0, start_alert_sent BOOLEAN DEFAULT 0, late_report_sent BOOLEAN DEFAULT 0, reminder_1h_sent BOOLEAN DEFAULT 0, reminder_4h_sent BOOLEAN DEFAULT 0, reminder_24h_sent BOOLEAN DEFAULT 0)")
+    await db.execute("CREATE TABLE IF NOT EXISTS master_history (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, date_won TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    await db.execute("CREATE TABLE IF NOT EXISTS pending_joins (user_id INTEGER PRIMARY KEY, bungie_id TEXT, roles_json TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    await db.execute("CREATE TABLE IF NOT EXISTS probation_extensions (user_id INTEGER PRIMARY KEY, extended_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+
+    # Attendance com Minutos
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS event_attendance (
+            event_id INTEGER, 
+            user_id INTEGER, 
+            status TEXT DEFAULT 'present', 
+            first_seen_at TIMESTAMP, 
+            minutes_active INTEGER DEFAULT 0,
+            PRIMARY KEY (event_id, user_id)
+        )
+    """)
+
+    # Colunas adicionadas em versões antigas (bancos criados antes delas)
+    await _add_column(db, 'event_lifecycle', 'reminder_1h_sent', 'BOOLEAN DEFAULT 0')
+    await _add_column(db, 'event_lifecycle', 'reminder_4h_sent', 'BOOLEAN DEFAULT 0')
+    await _add_column(db, 'event_lifecycle', 'reminder_24h_sent', 'BOOLEAN DEFAULT 0')
+    await _add_column(db, 'event_lifecycle', 'start_alert_sent', 'BOOLEAN DEFAULT 0')
+    await _add_column(db, 'event_attendance', 'minutes_active', 'INTEGER DEFAULT 0')
+
+async def _migration_002_hot_indexes(db):
+    # Ranking: WHERE is_valid = 1 AND start_time > ? GROUP BY user_id (cobre SUM(duration_minutes))
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_voice_valid_start ON voice_sessions (is_valid, start_time, user_id, duration_minutes)")
+    # Sessões / última atividade de um usuário
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_voice_user_start ON voice_sessions (user_id, start_time)")
+    # Loops de eventos ativos
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_events_status_date ON events (status, date_time)")
+    # RSVPs em ordem de chegada
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_rsvps_event_ts ON rsvps (event_id, timestamp)")
+    # Última presença em evento / estatísticas semanais
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_attendance_user_seen ON event_attendance (user_id, first_seen_at)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_polls_status ON polls (status)")
+
+async def _migration_003_voice_daily(db):
+    # Resumo diário de voz: o ranking soma poucas linhas por dia em vez de todas as sessões
+    await db.execute("CREATE TABLE IF NOT EXISTS voice_daily (day TEXT, user_id INTEGER, valid_minutes INTEGER DEFAULT 0, invalid_minutes INTEGER DEFAULT 0, PRIMARY KEY (day, user_id)) WITHOUT ROWID")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_voice_daily_user ON voice_daily (user_id, day)")
+    await _rebuild_voice_daily(db)
+
+async def _migration_004_open_voice_sessions(db):
+    # Diário dos trechos de voz em andamento, para fechar no último heartbeat após uma queda
+    await db.execute("CREATE TABLE IF NOT EXISTS open_voice_sessions (user_id INTEGER PRIMARY KEY, start_time TIMESTAMP, is_valid BOOLEAN DEFAULT 1, last_seen TIMESTAMP)")
+
+async def _migration_005_bot_messages(db):
+    # Registro das mensagens fixas do bot (quadros), para editar direto sem varrer o histórico
+    await db.execute("CREATE TABLE IF NOT EXISTS bot_messages (guild_id INTEGER, key TEXT, channel_id INTEGER, message_id INTEGER, PRIMARY KEY (guild_id, key))")
+
+async def _migration_006_poll_expiry(db):
+    # Validade das enquetes (calculada na criação) e momento do fechamento, para podar os votos antigos
+    await _add_column(db, 'polls', 'expires_at', 'TIMESTAMP')
+    await _add_column(db, 'polls', 'closed_at', 'TIMESTAMP')
+    await db.execute("UPDATE polls SET closed_at = ? WHERE status = 'closed' AND closed_at IS NULL", (datetime.datetime.now(BR_TIMEZONE),))
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_polls_status_expires ON polls (status, expires_at)")
+
+async def _migration_007_rsvp_view_version(db):
+    # Versão dos botões de RSVP em cada mensagem de evento; as antigas são reeditadas uma vez no startup
+    await _add_column(db, 'events', 'rsvp_view_version', 'INTEGER DEFAULT 0')
+
+async def _migration_008_rsvp_seq(db):
+    # Ordem de chegada por evento: o timestamp tem resolução de 1s e o upsert mantém o rowid antigo
+    await _add_column(db, 'rsvps', 'seq', 'INTEGER')
+    await db.execute("""
+        UPDATE rsvps SET seq = ranked.n FROM (
+            SELECT rowid AS rid, ROW_NUMBER() OVER (PARTITION BY event_id ORDER BY timestamp, rowid) AS n FROM rsvps
+        ) AS ranked WHERE rsvps.rowid = ranked.rid
+    """)
+    await db.execute("DROP INDEX IF EXISTS idx_rsvps_event_ts")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_rsvps_event_seq ON rsvps (event_id, seq)")
+
+async def _migration_009_drop_unused_voice_indexes(db):
+    # Ranking lê voice_daily: o índice de 4 colunas só custava escrita a cada sessão gravada.
+    # O (user_id, day) fazia o planejador varrer o índice inteiro em vez de buscar pelo dia na PK.
+    await db.execute("DROP INDEX IF EXISTS idx_voice_valid_start")
+    await db.execute("DROP INDEX IF EXISTS idx_voice_daily_user")
+
+# Cada migração roda uma única vez, em ordem, dentro da própria transação.
+# Nunca altere uma migração já publicada: adicione uma nova no fim da lista.
+MIGRATIONS = [
+    (1, _migration_001_base),
+    (2, _migration_002_hot_indexes),
+    (3, _migration_003_voice_daily),
+    (4, _migration_004_open_voice_sessions),
+    (5, _migration_005_bot_messages),
+    (6, _migration_006_poll_expiry),
+    (7, _migration_007_rsvp_view_version),
+    (8, _migration_008_rsvp_seq),
+    (9, _migration_009_drop_unused_voice_indexes),
+]
+
+async def get_schema_version(db):
+    await db.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    async with db.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version") as cursor:
+        return (await cursor.fetchone())['version']
+
+async def run_migrations(db):
+    current = await get_schema_version(db)
+    for version, migration in MIGRATIONS:
+        if version <= current: continue
+        await db.execute("BEGIN")
+        await migration(db)
+        await db.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+        await db.commit()
+        print(f"[DB] Migração {version} aplicada ({migration.__name__}).")
 
 async def init_db():
-    async with aiosqlite.connect(DB_NAME) as db:
-        # Tabelas Principais
-        await db.execute("CREATE TABLE IF NOT EXISTS events (event_id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id INTEGER, channel_id INTEGER, message_id INTEGER, role_id INTEGER, title TEXT, description TEXT, activity_type TEXT, date_time TIMESTAMP, max_slots INTEGER, creator_id INTEGER, status TEXT DEFAULT 'active')")
-        await db.execute("CREATE TABLE IF NOT EXISTS rsvps (event_id INTEGER, user_id INTEGER, status TEXT, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (event_id, user_id), FOREIGN KEY(event_id) REFERENCES events(event_id) ON DELETE CASCADE)")
-        await db.execute("CREATE TABLE IF NOT EXISTS voice_sessions (session_id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, start_time TIMESTAMP, end_time TIMESTAMP, duration_minutes INTEGER, is_valid BOOLEAN DEFAULT 1)")
-        
-        # Configurações e Polls
-        await db.execute("CREATE TABLE IF NOT EXISTS guild_settings (guild_id INTEGER PRIMARY KEY, manager_role_id INTEGER)")
-        await db.execute("CREATE TABLE IF NOT EXISTS polls (message_id INTEGER PRIMARY KEY, channel_id INTEGER, guild_id INTEGER, poll_type TEXT, target_data TEXT, status TEXT DEFAULT 'open', created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
-        await db.execute("CREATE TABLE IF NOT EXISTS poll_votes_v2 (poll_message_id INTEGER, user_id INTEGER, vote_option TEXT, PRIMARY KEY (poll_message_id, user_id, vote_option))")
-        
-        # Ciclo de Vida e Histórico
-        await db.execute("CREATE TABLE IF NOT EXISTS event_lifecycle (event_id INTEGER PRIMARY KEY, maybe_alert_sent BOOLEAN DEFAULT 0, start_alert_sent BOOLEAN DEFAULT 0, late_report_sent BOOLEAN DEFAULT 0, reminder_1h_sent BOOLEAN DEFAULT 0, reminder_4h_sent BOOLEAN DEFAULT 0, reminder_24h_sent BOOLEAN DEFAULT 0)")
-        await db.execute("CREATE TABLE IF NOT EXISTS master_history (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, date_won TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
-        await db.execute("CREATE TABLE IF NOT EXISTS pending_joins (user_id INTEGER PRIMARY KEY, bungie_id TEXT, roles_json TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
-        await db.execute("CREATE TABLE IF NOT EXISTS probation_extensions (user_id INTEGER PRIMARY KEY, extended_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
-
-        # Attendance com Minutos
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS event_attendance (
-                event_id INTEGER, 
-                user_id INTEGER, 
-                status TEXT DEFAULT 'present', 
-                first_seen_at TIMESTAMP, 
-                minutes_active INTEGER DEFAULT 0,
-                PRIMARY KEY (event_id, user_id)
-            )
-        """)
-        
-        # Migrações de Segurança
-        try: await db.execute("ALTER TABLE event_lifecycle ADD COLUMN reminder_1h_sent BOOLEAN DEFAULT 0")
-        except: pass
-        try: await db.execute("ALTER TABLE event_lifecycle ADD COLUMN reminder_4h_sent BOOLEAN DEFAULT 0")
-        except: pass
-        try: await db.execute("ALTER TABLE event_lifecycle ADD COLUMN reminder_24h_sent BOOLEAN DEFAULT 0")
-        except: pass
-        try: await db.execute("ALTER TABLE event_lifecycle ADD COLUMN start_alert_sent BOOLEAN DEFAULT 0")
-        except: pass
-        try: await db.execute("ALTER TABLE event_attendance ADD COLUMN minutes_active INTEGER DEFAULT 0")
-        except: pass
-        
-        await db.commit()
+    await _pool.open()
+    async with _pool.write() as db:
+        await run_migrations(db)
 
 # --- FUNÇÕES DE EVENTOS ---
 
-async def create_event(data):
-    async with aiosqlite.connect(DB_NAME) as db:
+async def create_event(data, confirmed_ids=()):
+    """Cria o evento e os RSVPs iniciais ('confirmed') na mesma transação. Retorna o event_id."""
+    async with _pool.write() as db:
         cursor = await db.execute("INSERT INTO events (guild_id, channel_id, message_id, role_id, title, description, activity_type, date_time, max_slots, creator_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", 
-                                  (data['guild_id'], data['channel_id'], data['message_id'], data['role_id'], data['title'], data['desc'], data['type'], data['date'], data['slots'], data['creator']))
-        await db.commit()
-        return cursor.lastrowid
+                                  (data['guild_id'], data['channel_id'], data.get('message_id'), data['role_id'], data['title'], data['desc'], data['type'], data['date'], data['slots'], data['creator']))
+        event_id = cursor.lastrowid
+        if confirmed_ids:
+            await db.executemany(f"INSERT OR IGNORE INTO rsvps (event_id, user_id, status, seq) VALUES (?, ?, 'confirmed', {_NEXT_RSVP_SEQ})", [(event_id, uid, event_id) for uid in confirmed_ids])
+        return event_id
+
+async def set_event_message(event_id, message_id, rsvp_view_version=0):
+    async with _pool.write() as db:
+        await db.execute("UPDATE events SET message_id = ?, rsvp_view_version = ? WHERE event_id = ?", (message_id, rsvp_view_version, event_id))
+    _events.invalidate(event_id)
+
+async def get_events_with_old_rsvp_view(version):
+    """Eventos ativos cuja mensagem ainda tem botões de uma versão anterior a `version`."""
+    async with _pool.read() as db:
+        async with db.execute("SELECT event_id, channel_id, message_id FROM events WHERE status = 'active' AND message_id IS NOT NULL AND COALESCE(rsvp_view_version, 0) < ?", (version,)) as cursor:
+            return await cursor.fetchall()
+
+async def set_rsvp_view_version(event_ids, version):
+    if not event_ids: return
+    async with _pool.write() as db:
+        await db.executemany("UPDATE events SET rsvp_view_version = ? WHERE event_id = ?", [(version, eid) for eid in event_ids])
+    _events.invalidate(*event_ids)
+
+async def discard_event(event_id):
+    """Desfaz um evento cuja criação falhou no meio (evento, RSVPs e ciclo de vida)."""
+    await _writes.barrier('event_lifecycle')
+    async with _pool.write() as db:
+        await db.execute("DELETE FROM rsvps WHERE event_id = ?", (event_id,))
+        await db.execute("DELETE FROM event_lifecycle WHERE event_id = ?", (event_id,))
+        await db.execute("DELETE FROM events WHERE event_id = ?", (event_id,))
+    _events.invalidate(event_id)
+    _drop_rsvp_lock(event_id)
 
 async def get_event(event_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    row = _events.get(event_id)
+    if row is not None: return row
+    generation = _events.generation
+    async with _pool.read() as db:
         async with db.execute("SELECT * FROM events WHERE event_id = ?", (event_id,)) as cursor:
-            return await cursor.fetchone()
+            row = await cursor.fetchone()
+    _events.put(event_id, row, generation)
+    return row
+
+def get_event_cache_stats():
+    return {**_events.stats, 'size': len(_events._rows)}
+
+# Consultas quentes ficam em constantes: tests/test_indexes.py confere o plano destas mesmas strings
+ACTIVE_EVENTS_QUERY = "SELECT * FROM events WHERE status = 'active'"
 
 async def get_active_events():
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM events WHERE status = 'active'") as cursor:
+    async with _pool.read() as db:
+        async with db.execute(ACTIVE_EVENTS_QUERY) as cursor:
             return await cursor.fetchall()
 
+LIFECYCLE_FLAGS = ['maybe_alert_sent', 'start_alert_sent', 'late_report_sent', 'reminder_1h_sent', 'reminder_4h_sent', 'reminder_24h_sent']
+RSVP_STATUSES = ['confirmed', 'waitlist', 'maybe', 'absent']
+
+def _as_local_dt(value):
+    if not value: return None
+    if isinstance(value, str):
+        try: value = datetime.datetime.fromisoformat(value)
+        except: return None
+    if value.tzinfo is None: value = BR_TIMEZONE.localize(value)
+    return value
+
+ACTIVE_EVENTS_OVERVIEW_QUERY = f"""
+    SELECT e.*, {", ".join(f"l.{f}" for f in LIFECYCLE_FLAGS)}, r.user_id AS rsvp_user_id, r.status AS rsvp_status
+    FROM events e
+    LEFT JOIN event_lifecycle l ON l.event_id = e.event_id
+    LEFT JOIN rsvps r ON r.event_id = e.event_id
+    WHERE e.status = 'active' {{event_filter}}
+    ORDER BY e.event_id, r.seq
+"""
+
+async def get_active_events_overview(event_id=None):
+    """Eventos ativos com RSVPs agrupados e flags de ciclo de vida, numa única consulta.
+
+    Cada item é um dict com as colunas de `events` mais:
+    - 'dt': date_time já convertido para datetime com fuso BR (ou None)
+    - 'rsvps': {status: [user_id, ...]} em ordem de chegada
+    - 'counts': {status: quantidade}
+    - 'lifecycle': {flag: 0/1}
+    """
+    query = ACTIVE_EVENTS_OVERVIEW_QUERY.format(event_filter="AND e.event_id = ?" if event_id is not None else "")
+    params = (event_id,) if event_id is not None else ()
+    overview = {}
+    await _writes.barrier('event_lifecycle')
+    async with _pool.read() as db:
+        async with db.execute(query, params) as cursor:
+            async for row in cursor:
+                evt = overview.get(row['event_id'])
+                if evt is None:
+                    evt = dict(row)
+                    evt['lifecycle'] = {f: evt.pop(f) or 0 for f in LIFECYCLE_FLAGS}
+                    evt.pop('rsvp_user_id'); evt.pop('rsvp_status')
+                    evt['dt'] = _as_local_dt(evt['date_time'])
+                    evt['rsvps'] = {s: [] for s in RSVP_STATUSES}
+                    overview[row['event_id']] = evt
+                if row['rsvp_user_id'] is not None:
+                    evt['rsvps'].setdefault(row['rsvp_status'], []).append(row['rsvp_user_id'])
+    for evt in overview.values():
+        evt['counts'] = {s: len(ids) for s, ids in evt['rsvps'].items()}
+    return list(overview.values())
+
+def event_overview_from_rsvps(event, rsvps):
+    """Mesmo formato do overview (sem 'lifecycle') a partir da linha do evento e de RSVPs já lidos."""
+    evt = dict(event)
+    evt['dt'] = _as_local_dt(evt['date_time'])
+    evt['rsvps'] = {s: [] for s in RSVP_STATUSES}
+    for r in rsvps: evt['rsvps'].setdefault(r['status'], []).append(r['user_id'])
+    evt['counts'] = {s: len(ids) for s, ids in evt['rsvps'].items()}
+    return evt
+
+async def get_event_overview(event_id):
+    events = await get_active_events_overview(event_id)
+    return events[0] if events else None
+
 async def update_event_status(event_id, status):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _pool.write() as db:
         await db.execute("UPDATE events SET status = ? WHERE event_id = ?", (status, event_id))
-        await db.commit()
+    _events.invalidate(event_id)
+    if status != 'active': _drop_rsvp_lock(event_id)
 
 async def update_event_details(event_id, title, desc, dt, type_key, slots):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _pool.write() as db:
         await db.execute("UPDATE events SET title = ?, description = ?, date_time = ?, activity_type = ?, max_slots = ? WHERE event_id = ?", (title, desc, dt, type_key, slots, event_id))
-        await db.commit()
+    _events.invalidate(event_id)
 
 async def delete_event(event_id):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _pool.write() as db:
         await db.execute("DELETE FROM events WHERE event_id = ?", (event_id,))
-        await db.commit()
+    _events.invalidate(event_id)
+    _drop_rsvp_lock(event_id)
 
 # --- RSVPS ---
 
+# Próxima posição na ordem de chegada do evento (usado dentro da transação que grava o RSVP)
+_NEXT_RSVP_SEQ = "(SELECT COALESCE(MAX(seq), 0) + 1 FROM rsvps WHERE event_id = ?)"
+
+# Grava o status; só uma mudança de status vai para o fim da fila (repetir o mesmo mantém a posição)
+_UPSERT_RSVP = f"""
+    INSERT INTO rsvps (event_id, user_id, status, timestamp, seq) VALUES (?, ?, ?, CURRENT_TIMESTAMP, {_NEXT_RSVP_SEQ})
+    ON CONFLICT(event_id, user_id) DO UPDATE SET
+        timestamp = CASE WHEN rsvps.status = excluded.status THEN rsvps.timestamp ELSE excluded.timestamp END,
+        seq = CASE WHEN rsvps.status = excluded.status THEN rsvps.seq ELSE excluded.seq END,
+        status = excluded.status
+"""
+
+RSVPS_QUERY = "SELECT * FROM rsvps WHERE event_id = ? ORDER BY seq"
+
 async def update_rsvp(event_id, user_id, status):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("INSERT OR REPLACE INTO rsvps (event_id, user_id, status) VALUES (?, ?, ?)", (event_id, user_id, status))
-        await db.commit()
+    async with _pool.write() as db:
+        await db.execute(_UPSERT_RSVP, (event_id, user_id, status, event_id))
+
+# Um lock por evento: cliques no mesmo evento entram na transação um de cada vez
+_rsvp_locks = collections.defaultdict(asyncio.Lock)
+
+def _drop_rsvp_lock(event_id):
+    # Evento concluído/apagado: o lock sai do dicionário se ninguém estiver usando
+    lock = _rsvp_locks.get(event_id)
+    if lock and not lock.locked(): del _rsvp_locks[event_id]
+
+async def _promote_waitlist(db, event_id, max_slots):
+    # FIFO: ocupa as vagas livres com a lista de espera em ordem de chegada
+    async with db.execute("""
+        UPDATE rsvps SET status = 'confirmed'
+        WHERE event_id = ? AND rowid IN (
+            SELECT rowid FROM rsvps WHERE event_id = ? AND status = 'waitlist'
+            ORDER BY seq
+            LIMIT max(0, ? - (SELECT COUNT(*) FROM rsvps WHERE event_id = ? AND status = 'confirmed'))
+        ) RETURNING user_id
+    """, (event_id, event_id, max_slots or 0, event_id)) as cursor:
+        return [r['user_id'] for r in await cursor.fetchall()]
+
+async def apply_rsvp(event_id, user_id, status):
+    """Aplica um clique de RSVP numa única transação (BEGIN IMMEDIATE): checa a vaga, grava o status
+    e promove a lista de espera. Retorna (status_final, promovidos, rsvps) ou None se o evento não existe.
+
+    'confirmed' sem vaga vira 'waitlist'. Repetir o mesmo status mantém a posição na fila.
+    """
+    async with _rsvp_locks[event_id]:
+        async with _pool.write() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            async with db.execute("SELECT max_slots FROM events WHERE event_id = ?", (event_id,)) as cursor:
+                event = await cursor.fetchone()
+            if not event: return None
+            max_slots = event['max_slots'] or 0
+
+            final_status = status
+            if status == 'confirmed':
+                async with db.execute("""
+                    SELECT (SELECT status FROM rsvps WHERE event_id = ? AND user_id = ?) AS current,
+                           (SELECT COUNT(*) FROM rsvps WHERE event_id = ? AND status = 'confirmed') AS confirmed
+                """, (event_id, user_id, event_id)) as cursor:
+                    row = await cursor.fetchone()
+                if row['current'] != 'confirmed' and row['confirmed'] >= max_slots: final_status = 'waitlist'
+
+            await db.execute(_UPSERT_RSVP, (event_id, user_id, final_status, event_id))
+            promoted = await _promote_waitlist(db, event_id, max_slots)
+
+            async with db.execute(RSVPS_QUERY, (event_id,)) as cursor:
+                rsvps = await cursor.fetchall()
+            return final_status, promoted, rsvps
+
+async def promote_waitlist(event_id):
+    """Promove a lista de espera após mudanças fora do clique (ex: admin). Retorna os promovidos."""
+    async with _rsvp_locks[event_id]:
+        async with _pool.write() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            async with db.execute("SELECT max_slots FROM events WHERE event_id = ?", (event_id,)) as cursor:
+                event = await cursor.fetchone()
+            if not event: return []
+            return await _promote_waitlist(db, event_id, event['max_slots'])
 
 async def get_rsvps(event_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM rsvps WHERE event_id = ? ORDER BY timestamp ASC", (event_id,)) as cursor:
+    async with _pool.read() as db:
+        async with db.execute(RSVPS_QUERY, (event_id,)) as cursor:
             return await cursor.fetchall()
 
 # --- ATTENDANCE & TRACKING ---
 
 async def increment_event_attendance(event_id, user_id, minutes_to_add=5):
     now = datetime.datetime.now()
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("""
+    _writes.enqueue(('event_attendance',), [("""
             INSERT INTO event_attendance (event_id, user_id, status, first_seen_at, minutes_active) 
             VALUES (?, ?, 'present', ?, ?) 
             ON CONFLICT(event_id, user_id) 
             DO UPDATE SET 
                 minutes_active = minutes_active + excluded.minutes_active,
                 first_seen_at = COALESCE(first_seen_at, excluded.first_seen_at)
-        """, (event_id, user_id, now, minutes_to_add))
-        await db.commit()
+        """, (event_id, user_id, now, minutes_to_add))])
 
 async def get_valid_attendees(event_id, min_minutes=60):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    await _writes.barrier('event_attendance')
+    async with _pool.read() as db:
         async with db.execute("SELECT user_id FROM event_attendance WHERE event_id = ? AND minutes_active >= ?", (event_id, min_minutes)) as cursor:
             rows = await cursor.fetchall()
             return [r['user_id'] for r in rows]
@@ -123,8 +630,8 @@ async def mark_attendance_present(event_id, user_id):
     await increment_event_attendance(event_id, user_id, 5)
 
 async def get_attendance_status(event_id, user_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    await _writes.barrier('event_attendance')
+    async with _pool.read() as db:
         async with db.execute("SELECT status FROM event_attendance WHERE event_id = ? AND user_id = ?", (event_id, user_id)) as cursor:
             row = await cursor.fetchone()
             return row['status'] if row else 'absent'
@@ -132,8 +639,8 @@ async def get_attendance_status(event_id, user_id):
 async def get_event_stats_7d():
     limit_date = datetime.datetime.now(BR_TIMEZONE) - datetime.timedelta(days=7)
     stats = {}
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    await _writes.barrier('event_attendance')
+    async with _pool.read() as db:
         async with db.execute("SELECT creator_id, COUNT(*) as count FROM events WHERE date_time > ? GROUP BY creator_id", (limit_date,)) as cursor:
             async for row in cursor:
                 uid = row['creator_id']
@@ -149,45 +656,133 @@ async def get_event_stats_7d():
 # --- CONFIGURAÇÕES ---
 
 async def set_manager_id(guild_id, role_or_user_id):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _pool.write() as db:
         await db.execute("INSERT OR REPLACE INTO guild_settings (guild_id, manager_role_id) VALUES (?, ?)", (guild_id, role_or_user_id))
-        await db.commit()
 
 async def get_manager_id(guild_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    async with _pool.read() as db:
         async with db.execute("SELECT manager_role_id FROM guild_settings WHERE guild_id = ?", (guild_id,)) as cursor:
             row = await cursor.fetchone()
             return row['manager_role_id'] if row else None
 
 # --- VOICE SESSIONS (RANKING) ---
 
-async def log_voice_session(user_id, start, end, duration, is_valid=1):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("INSERT INTO voice_sessions (user_id, start_time, end_time, duration_minutes, is_valid) VALUES (?, ?, ?, ?, ?)", (user_id, start, end, duration, is_valid))
-        await db.commit()
+def _day_key(value):
+    if isinstance(value, datetime.datetime): return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+VOICE_TABLES = ('voice_sessions', 'voice_daily', 'open_voice_sessions')
+
+def _voice_session_statements(user_id, start, end, duration, is_valid):
+    valid_mins, invalid_mins = (duration, 0) if is_valid else (0, duration)
+    return [
+        ("INSERT INTO voice_sessions (user_id, start_time, end_time, duration_minutes, is_valid) VALUES (?, ?, ?, ?, ?)", (user_id, start, end, duration, is_valid)),
+        ("""
+        INSERT INTO voice_daily (day, user_id, valid_minutes, invalid_minutes) VALUES (?, ?, ?, ?)
+        ON CONFLICT(day, user_id) DO UPDATE SET
+            valid_minutes = valid_minutes + excluded.valid_minutes,
+            invalid_minutes = invalid_minutes + excluded.invalid_minutes
+        """, (_day_key(start), user_id, valid_mins, invalid_mins)),
+    ]
+
+async def log_voice_session(user_id, start, end, duration, is_valid=1, reopen_valid=None):
+    """Enfileira o trecho junto com a atualização do diário de sessões abertas (mesma transação).
+
+    Com `reopen_valid` o trecho continua aberto a partir de `end` (checkpoint); sem ele, o trecho sai do diário.
+    """
+    statements = _voice_session_statements(user_id, start, end, duration, is_valid)
+    if reopen_valid is None:
+        statements.append(("DELETE FROM open_voice_sessions WHERE user_id = ?", (user_id,)))
+    else:
+        statements.append(("INSERT OR REPLACE INTO open_voice_sessions (user_id, start_time, is_valid, last_seen) VALUES (?, ?, ?, ?)", (user_id, end, 1 if reopen_valid else 0, end)))
+    _writes.enqueue(VOICE_TABLES, statements)
+
+# --- DIÁRIO DE SESSÕES ABERTAS (sobrevive a quedas do bot) ---
+
+async def flush_open_voice_sessions(upserts, deletes, last_seen):
+    """Grava trechos abertos/alterados, remove os fechados e renova o heartbeat de todos (uma transação).
+
+    Vai pela mesma fila ordenada dos trechos fechados e é enfileirado sem nenhum await antes: um trecho
+    fechado depois da foto de quem chama é sempre gravado (e sai do diário) depois deste upsert.
+    """
+    statements = [("DELETE FROM open_voice_sessions WHERE user_id = ?", (uid,)) for uid in deletes]
+    statements += [("INSERT OR REPLACE INTO open_voice_sessions (user_id, start_time, is_valid, last_seen) VALUES (?, ?, ?, ?)", (uid, start, 1 if valid else 0, last_seen)) for uid, start, valid in upserts]
+    statements.append(("UPDATE open_voice_sessions SET last_seen = ?", (last_seen,)))
+    _writes.enqueue(('open_voice_sessions',), statements)
+
+async def close_orphan_voice_sessions():
+    """Fecha no último heartbeat os trechos que ficaram abertos quando o bot caiu. Retorna quantos foram gravados."""
+    await _writes.barrier('open_voice_sessions')
+    async with _pool.write() as db:
+        async with db.execute("SELECT user_id, start_time, is_valid, last_seen FROM open_voice_sessions") as cursor:
+            rows = await cursor.fetchall()
+        logged = 0
+        for r in rows:
+            start, end = _as_local_dt(r['start_time']), _as_local_dt(r['last_seen'])
+            if not start or not end: continue
+            duration = int((end - start).total_seconds() / 60)
+            if duration >= 1:
+                for sql, params in _voice_session_statements(r['user_id'], start, end, duration, r['is_valid']):
+                    await db.execute(sql, params)
+                logged += 1
+        await db.execute("DELETE FROM open_voice_sessions")
+        return logged
+
+async def _rebuild_voice_daily(db, since_day=None):
+    if since_day: await db.execute("DELETE FROM voice_daily WHERE day >= ?", (since_day,))
+    else: await db.execute("DELETE FROM voice_daily")
+    await db.execute("""
+        INSERT INTO voice_daily (day, user_id, valid_minutes, invalid_minutes)
+        SELECT substr(start_time, 1, 10) AS day, user_id,
+               SUM(CASE WHEN is_valid = 1 THEN duration_minutes ELSE 0 END),
+               SUM(CASE WHEN is_valid = 1 THEN 0 ELSE duration_minutes END)
+        FROM voice_sessions WHERE substr(start_time, 1, 10) >= ? GROUP BY day, user_id
+    """, (since_day or '',))
+
+async def rebuild_voice_daily(days_back=89):
+    """Recalcula o resumo diário a partir das sessões brutas (só dentro da janela que ainda não foi podada)."""
+    since_day = _day_key(datetime.datetime.now(BR_TIMEZONE) - datetime.timedelta(days=days_back))
+    await _writes.barrier('voice_sessions')
+    async with _pool.write() as db:
+        await _rebuild_voice_daily(db, since_day)
+
+VOICE_HOURS_QUERY = "SELECT user_id, SUM(valid_minutes) as total_mins FROM voice_daily WHERE day > ? GROUP BY user_id HAVING total_mins > 0"
+ACTIVE_DAYS_QUERY = "SELECT user_id, COUNT(*) as active_days FROM voice_daily WHERE day > ? AND valid_minutes >= ? GROUP BY user_id"
+SESSIONS_IN_RANGE_QUERY = "SELECT start_time, duration_minutes, is_valid FROM voice_sessions WHERE user_id = ? AND start_time > ?"
+LAST_VOICE_QUERY = "SELECT MAX(start_time) as last_voice FROM voice_sessions WHERE user_id = ?"
+LAST_EVENT_QUERY = "SELECT MAX(first_seen_at) as last_event FROM event_attendance WHERE user_id = ?"
 
 async def get_voice_hours(days_back):
-    limit_date = datetime.datetime.now(BR_TIMEZONE) - datetime.timedelta(days=days_back)
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row 
-        async with db.execute("SELECT user_id, SUM(duration_minutes) as total_mins FROM voice_sessions WHERE start_time > ? AND is_valid = 1 GROUP BY user_id", (limit_date,)) as cursor:
+    # days_back=None -> total histórico
+    if days_back is None: limit_day = ''
+    else: limit_day = _day_key(datetime.datetime.now(BR_TIMEZONE) - datetime.timedelta(days=days_back))
+    await _writes.barrier('voice_daily')
+    async with _pool.read() as db:
+        async with db.execute(VOICE_HOURS_QUERY, (limit_day,)) as cursor:
             return await cursor.fetchall()
 
+async def get_active_days(days_back=7, min_minutes=60):
+    """{user_id: nº de dias (dentre os últimos `days_back`) com pelo menos `min_minutes` válidos}."""
+    limit_day = _day_key(datetime.datetime.now(BR_TIMEZONE) - datetime.timedelta(days=days_back))
+    await _writes.barrier('voice_daily')
+    async with _pool.read() as db:
+        async with db.execute(ACTIVE_DAYS_QUERY, (limit_day, min_minutes)) as cursor:
+            return {r['user_id']: r['active_days'] for r in await cursor.fetchall()}
+
 async def get_sessions_in_range(user_id, days_back):
     limit_date = datetime.datetime.now(BR_TIMEZONE) - datetime.timedelta(days=days_back)
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT start_time, duration_minutes, is_valid FROM voice_sessions WHERE user_id = ? AND start_time > ?", (user_id, limit_date)) as cursor:
+    await _writes.barrier('voice_sessions')
+    async with _pool.read() as db:
+        async with db.execute(SESSIONS_IN_RANGE_QUERY, (user_id, limit_date)) as cursor:
             return await cursor.fetchall()
 
 async def get_last_activity_timestamp(user_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT MAX(start_time) as last_voice FROM voice_sessions WHERE user_id = ?", (user_id,)) as c:
+    await _writes.barrier('voice_sessions', 'event_attendance')
+    async with _pool.read() as db:
+        async with db.execute(LAST_VOICE_QUERY, (user_id,)) as c:
             voice_row = await c.fetchone()
             last_voice = voice_row['last_voice'] if voice_row else None
-        async with db.execute("SELECT MAX(first_seen_at) as last_event FROM event_attendance WHERE user_id = ?", (user_id,)) as c:
+        async with db.execute(LAST_EVENT_QUERY, (user_id,)) as c:
             event_row = await c.fetchone()
             last_event = event_row['last_event'] if event_row else None
             
@@ -197,66 +792,115 @@ async def get_last_activity_timestamp(user_id):
         return max(str(last_voice), str(last_event))
 
 async def prune_old_voice_data(days=90):
+    # voice_daily não é podado: guarda o total histórico
     limit_date = datetime.datetime.now(BR_TIMEZONE) - datetime.timedelta(days=days)
-    async with aiosqlite.connect(DB_NAME) as db:
+    await _writes.barrier('voice_sessions')
+    async with _pool.write() as db:
         await db.execute("DELETE FROM voice_sessions WHERE start_time < ?", (limit_date,))
-        await db.commit()
 
 # --- ENQUETES (POLLS) ---
 
-async def create_poll(message_id, channel_id, guild_id, poll_type, target_data):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("INSERT INTO polls (message_id, channel_id, guild_id, poll_type, target_data) VALUES (?, ?, ?, ?, ?)", (message_id, channel_id, guild_id, poll_type, target_data))
-        await db.commit()
+async def create_poll(message_id, channel_id, guild_id, poll_type, target_data, expires_at=None):
+    async with _pool.write() as db:
+        await db.execute("INSERT INTO polls (message_id, channel_id, guild_id, poll_type, target_data, expires_at) VALUES (?, ?, ?, ?, ?, ?)", (message_id, channel_id, guild_id, poll_type, target_data, expires_at))
+
+OPEN_POLLS_QUERY = "SELECT * FROM polls WHERE status = 'open'"
 
 async def get_active_polls():
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM polls WHERE status = 'open'") as cursor:
+    """Enquetes abertas; cada item traz também 'expires' (expires_at como datetime com fuso BR, ou None)."""
+    async with _pool.read() as db:
+        async with db.execute(OPEN_POLLS_QUERY) as cursor:
+            rows = await cursor.fetchall()
+    return [dict(r, expires=_as_local_dt(r['expires_at'])) for r in rows]
+
+async def set_poll_expiry(message_id, expires_at):
+    async with _pool.write() as db:
+        await db.execute("UPDATE polls SET expires_at = ? WHERE message_id = ?", (expires_at, message_id))
+
+async def close_expired_polls(now):
+    """Fecha de uma vez todas as enquetes abertas vencidas; retorna as linhas fechadas (message_id, channel_id)."""
+    async with _pool.write() as db:
+        async with db.execute("UPDATE polls SET status = 'closed', closed_at = ? WHERE status = 'open' AND expires_at <= ? RETURNING message_id, channel_id", (now, now)) as cursor:
             return await cursor.fetchall()
 
+async def prune_closed_poll_votes(days=7, batch_size=500):
+    """Apaga os votos de enquetes fechadas há mais de `days` dias, em lotes (cada lote solta o escritor)."""
+    limit_date = datetime.datetime.now(BR_TIMEZONE) - datetime.timedelta(days=days)
+    await _writes.barrier('poll_votes_v2')
+    total = 0
+    while True:
+        async with _pool.write() as db:
+            cursor = await db.execute("DELETE FROM poll_votes_v2 WHERE rowid IN (SELECT v.rowid FROM poll_votes_v2 v JOIN polls p ON p.message_id = v.poll_message_id WHERE p.status = 'closed' AND p.closed_at < ? LIMIT ?)", (limit_date, batch_size))
+            deleted = cursor.rowcount
+        total += deleted
+        if deleted < batch_size: return total
+        await asyncio.sleep(0)
+
+async def get_open_poll_votes():
+    """Todos os votos das enquetes abertas numa leitura só: {message_id: {opção: {user_id: None}}} em ordem de voto."""
+    await _writes.barrier('poll_votes_v2')
+    async with _pool.read() as db:
+        async with db.execute("SELECT v.poll_message_id, v.vote_option, v.user_id FROM poll_votes_v2 v JOIN polls p ON p.message_id = v.poll_message_id WHERE p.status = 'open' ORDER BY v.rowid") as cursor:
+            rows = await cursor.fetchall()
+    tallies = {}
+    for r in rows:
+        tallies.setdefault(r['poll_message_id'], {}).setdefault(r['vote_option'], {})[r['user_id']] = None
+    return tallies
+
 async def get_poll_details(message_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    async with _pool.read() as db:
         async with db.execute("SELECT * FROM polls WHERE message_id = ?", (message_id,)) as cursor:
             return await cursor.fetchone()
 
 async def close_poll(message_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("UPDATE polls SET status = 'closed' WHERE message_id = ?", (message_id,))
-        await db.commit()
+    async with _pool.write() as db:
+        await db.execute("UPDATE polls SET status = 'closed', closed_at = ? WHERE message_id = ?", (datetime.datetime.now(BR_TIMEZONE), message_id))
+
+async def close_poll_if_open(message_id):
+    """Fecha a enquete só se ainda estiver aberta (compare-and-set); True apenas para quem de fato fechou."""
+    async with _pool.write() as db:
+        cursor = await db.execute("UPDATE polls SET status = 'closed', closed_at = ? WHERE message_id = ? AND status = 'open'", (datetime.datetime.now(BR_TIMEZONE), message_id))
+        return cursor.rowcount == 1
 
 async def check_user_vote_on_option(message_id, user_id, option):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    await _writes.barrier('poll_votes_v2')
+    async with _pool.read() as db:
         async with db.execute("SELECT 1 FROM poll_votes_v2 WHERE poll_message_id = ? AND user_id = ? AND vote_option = ?", (message_id, user_id, option)) as cursor:
             return await cursor.fetchone() is not None
 
 async def remove_poll_vote_option(message_id, user_id, option):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("DELETE FROM poll_votes_v2 WHERE poll_message_id = ? AND user_id = ? AND vote_option = ?", (message_id, user_id, option))
-        await db.commit()
+    # Vai pela mesma fila do add_poll_vote: a ordem entre voto e desvoto é preservada
+    _writes.enqueue(('poll_votes_v2',), [("DELETE FROM poll_votes_v2 WHERE poll_message_id = ? AND user_id = ? AND vote_option = ?", (message_id, user_id, option))])
 
 async def add_poll_vote(message_id, user_id, option):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("INSERT OR IGNORE INTO poll_votes_v2 (poll_message_id, user_id, vote_option) VALUES (?, ?, ?)", (message_id, user_id, option))
-        await db.commit()
+    _writes.enqueue(('poll_votes_v2',), [("INSERT OR IGNORE INTO poll_votes_v2 (poll_message_id, user_id, vote_option) VALUES (?, ?, ?)", (message_id, user_id, option))])
+
+async def toggle_poll_vote(message_id, user_id, option):
+    """Alterna o voto numa escrita só: o DELETE ... RETURNING diz se o voto existia; se não existia, insere.
+    Retorna True se o voto ficou registrado."""
+    await _writes.barrier('poll_votes_v2')
+    async with _pool.write() as db:
+        async with db.execute("DELETE FROM poll_votes_v2 WHERE poll_message_id = ? AND user_id = ? AND vote_option = ? RETURNING 1", (message_id, user_id, option)) as cursor:
+            removed = await cursor.fetchone() is not None
+        if not removed:
+            await db.execute("INSERT INTO poll_votes_v2 (poll_message_id, user_id, vote_option) VALUES (?, ?, ?)", (message_id, user_id, option))
+    return not removed
 
 async def get_poll_votes(message_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    await _writes.barrier('poll_votes_v2')
+    async with _pool.read() as db:
         async with db.execute("SELECT vote_option, COUNT(*) as count FROM poll_votes_v2 WHERE poll_message_id = ? GROUP BY vote_option", (message_id,)) as cursor:
             return await cursor.fetchall()
 
 async def get_poll_voters_detailed(message_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    await _writes.barrier('poll_votes_v2')
+    async with _pool.read() as db:
         async with db.execute("SELECT user_id, vote_option FROM poll_votes_v2 WHERE poll_message_id = ?", (message_id,)) as cursor:
             return await cursor.fetchall()
 
 async def get_voters_for_option(message_id, option):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    await _writes.barrier('poll_votes_v2')
+    async with _pool.read() as db:
         async with db.execute("SELECT user_id FROM poll_votes_v2 WHERE poll_message_id = ? AND vote_option = ?", (message_id, option)) as cursor:
             rows = await cursor.fetchall()
             return list(set([r['user_id'] for r in rows]))
@@ -264,34 +908,44 @@ async def get_voters_for_option(message_id, option):
 # --- EVENT LIFECYCLE ---
 
 async def get_event_lifecycle(event_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    await _writes.barrier('event_lifecycle')
+    async with _pool.read() as db:
         async with db.execute("SELECT * FROM event_lifecycle WHERE event_id = ?", (event_id,)) as cursor:
             return await cursor.fetchone()
 
 async def set_lifecycle_flag(event_id, flag_name, value=1):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("INSERT OR IGNORE INTO event_lifecycle (event_id) VALUES (?)", (event_id,))
-        query = f"UPDATE event_lifecycle SET {flag_name} = ? WHERE event_id = ?"
-        await db.execute(query, (value, event_id))
-        await db.commit()
+    query = f"UPDATE event_lifecycle SET {flag_name} = ? WHERE event_id = ?"
+    _writes.enqueue(('event_lifecycle',), [("INSERT OR IGNORE INTO event_lifecycle (event_id) VALUES (?)", (event_id,)), (query, (value, event_id))])
 
 async def reset_event_lifecycle_flags(event_id):
-    async with aiosqlite.connect(DB_NAME) as db:
+    await _writes.barrier('event_lifecycle')
+    async with _pool.write() as db:
         await db.execute("UPDATE event_lifecycle SET maybe_alert_sent = 0, start_alert_sent = 0, late_report_sent = 0, reminder_1h_sent = 0, reminder_4h_sent = 0, reminder_24h_sent = 0 WHERE event_id = ?", (event_id,))
-        await db.commit()
+
+# --- MENSAGENS FIXAS DO BOT ---
+
+async def get_bot_messages():
+    async with _pool.read() as db:
+        async with db.execute("SELECT guild_id, key, channel_id, message_id FROM bot_messages") as cursor:
+            return await cursor.fetchall()
+
+async def set_bot_message(guild_id, key, channel_id, message_id):
+    async with _pool.write() as db:
+        await db.execute("INSERT OR REPLACE INTO bot_messages (guild_id, key, channel_id, message_id) VALUES (?, ?, ?, ?)", (guild_id, key, channel_id, message_id))
+
+async def delete_bot_message(guild_id, key):
+    async with _pool.write() as db:
+        await db.execute("DELETE FROM bot_messages WHERE guild_id = ? AND key = ?", (guild_id, key))
 
 # --- WEEKLY MASTER ---
 
 async def log_master_winner(user_id):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _pool.write() as db:
         await db.execute("INSERT INTO master_history (user_id) VALUES (?)", (user_id,))
-        await db.commit()
 
 async def get_recent_masters(weeks=3):
     limit_date = datetime.datetime.now(BR_TIMEZONE) - datetime.timedelta(weeks=weeks)
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    async with _pool.read() as db:
         async with db.execute("SELECT user_id FROM master_history WHERE date_won > ?", (limit_date,)) as cursor:
             rows = await cursor.fetchall()
             return [r['user_id'] for r in rows]
@@ -301,33 +955,28 @@ async def get_recent_masters(weeks=3):
 async def save_pending_join(user_id, bungie_id, roles_list):
     import json
     roles_json = json.dumps(roles_list)
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _pool.write() as db:
         await db.execute("INSERT OR REPLACE INTO pending_joins (user_id, bungie_id, roles_json) VALUES (?, ?, ?)", (user_id, bungie_id, roles_json))
-        await db.commit()
 
 async def get_pending_join(user_id):
     import json
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    async with _pool.read() as db:
         async with db.execute("SELECT * FROM pending_joins WHERE user_id = ?", (user_id,)) as cursor:
             row = await cursor.fetchone()
             if row: return {'bungie_id': row['bungie_id'], 'roles': json.loads(row['roles_json'])}
             return None
 
 async def remove_pending_join(user_id):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _pool.write() as db:
         await db.execute("DELETE FROM pending_joins WHERE user_id = ?", (user_id,))
-        await db.commit()
 
 async def extend_probation(user_id):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with _pool.write() as db:
         now = datetime.datetime.now()
         await db.execute("INSERT OR REPLACE INTO probation_extensions (user_id, extended_at) VALUES (?, ?)", (user_id, now))
-        await db.commit()
 
 async def is_probation_extended(user_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        db.row_factory = aiosqlite.Row
+    async with _pool.read() as db:
         async with db.execute("SELECT extended_at FROM probation_extensions WHERE user_id = ?", (user_id,)) as cursor:
             row = await cursor.fetchone()
             if not row: return False
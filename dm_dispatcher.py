@@ -0,0 +1,145 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+import discord
+from ratelimit import TokenBucket
+
+DM_WORKERS = 4
+DM_BURST = 5
+DM_PER_SECOND = 2.0
+DM_MAX_ATTEMPTS = 3
+DM_DIGEST_WINDOW = 3.0     # mensagens do mesmo digest para o mesmo usuário dentro da janela viram uma DM só
+DM_DEDUP_TTL = 6 * 3600    # mesma chave para o mesmo usuário não é reenviada nesse período
+DM_CLOSED_TTL = 6 * 3600   # quem está com DM fechada só é tentado de novo depois disso
+DM_RUNS_KEPT = 50
+
+class DMDispatcher:
+    """Envio de DMs em segundo plano: pool de workers, balde de tokens, dedup por usuário,
+    digest (várias mensagens do mesmo tipo numa DM só) e memória de DMs fechadas.
+
+    `send()` só enfileira; quem chama nunca espera uma DM lenta ou bloqueada.
+    """
+
+    def __init__(self, bot, workers=DM_WORKERS):
+        self.bot = bot
+        self.workers_count = workers
+        self.queue = asyncio.Queue()
+        self.bucket = TokenBucket(DM_BURST, DM_PER_SECOND)
+        self._workers = []
+        self._digests = {}            # (user_id, digest) -> [(embed, content, run)]
+        self._sent_keys = OrderedDict()  # (user_id, key) -> monotonic do envio
+        self.closed_dms = {}          # user_id -> monotonic da última recusa
+        self.stats = Counter()
+        self.runs = OrderedDict()     # run -> Counter
+
+    def start(self):
+        if self._workers: return
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers_count)]
+
+    async def stop(self, timeout=10):
+        # Digests ainda na janela vão para a fila agora; depois a fila tem uma chance de esvaziar
+        for bucket_key in list(self._digests): self._flush_digest(bucket_key)
+        try: await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError: pass
+        for task in self._workers: task.cancel()
+        self._workers = []
+
+    def _count(self, run, stat, n=1):
+        self.stats[stat] += n
+        if run is None: return
+        counter = self.runs.get(run)
+        if counter is None:
+            counter = self.runs[run] = Counter()
+            while len(self.runs) > DM_RUNS_KEPT: self.runs.popitem(last=False)
+        counter[stat] += n
+
+    def get_stats(self, run=None):
+        return dict(self.runs.get(run, {})) if run else {**self.stats, 'queued_now': self.queue.qsize()}
+
+    def is_closed(self, user_id):
+        closed_at = self.closed_dms.get(user_id)
+        if closed_at is None: return False
+        if time.monotonic() - closed_at > DM_CLOSED_TTL:
+            del self.closed_dms[user_id]
+            return False
+        return True
+
+    def send(self, user_id, content=None, embed=None, key=None, digest=None, run=None):
+        """Enfileira uma DM.
+
+        - key: chave de dedup (ex: '42:reminder_1h'); repetida para o mesmo usuário é descartada.
+        - digest: título do resumo; mensagens com o mesmo digest para o mesmo usuário na janela viram uma DM só.
+        - run: nome da rodada de envio (ex: 'reminder_1h:42') para as estatísticas.
+        """
+        self._count(run, 'queued')
+        if self.is_closed(user_id): return self._count(run, 'skipped_closed')
+        if key is not None:
+            now = time.monotonic()
+            while self._sent_keys:
+                oldest_key, sent_at = next(iter(self._sent_keys.items()))
+                if now - sent_at <= DM_DEDUP_TTL: break
+                del self._sent_keys[oldest_key]
+            if (user_id, key) in self._sent_keys: return self._count(run, 'deduped')
+            self._sent_keys[(user_id, key)] = now
+        if digest is None:
+            self.queue.put_nowait((user_id, content, embed, [run]))
+            return
+        bucket_key = (user_id, digest)
+        if bucket_key in self._digests:
+            self._digests[bucket_key].append((embed, content, run))
+            return self._count(run, 'digested')
+        self._digests[bucket_key] = [(embed, content, run)]
+        asyncio.get_running_loop().call_later(DM_DIGEST_WINDOW, self._flush_digest, bucket_key)
+
+    def _flush_digest(self, bucket_key):
+        items = self._digests.pop(bucket_key, None)
+        if not items: return
+        user_id, digest = bucket_key
+        runs = [run for _, _, run in items]
+        if len(items) == 1:
+            embed, content, _ = items[0]
+            self.queue.put_nowait((user_id, content, embed, runs))
+            return
+        merged = discord.Embed(title=digest, color=discord.Color.orange())
+        for embed, content, _ in items[:25]:
+            if embed: merged.add_field(name=embed.title or "\u200b", value=embed.description or "\u200b", inline=False)
+            else: merged.add_field(name="\u200b", value=content or "\u200b", inline=False)
+        self.queue.put_nowait((user_id, None, merged, runs))
+
+    async def _worker(self):
+        while True:
+            user_id, content, embed, runs = await self.queue.get()
+            try: await self._deliver(user_id, content, embed, runs)
+            except Exception as e: print(f"[DM] Erro inesperado para {user_id}: {e}")
+            finally: self.queue.task_done()
+
+    async def _deliver(self, user_id, content, embed, runs):
+        def count(stat):
+            self.stats[stat] += 1
+            for run in set(runs):
+                if run in self.runs: self.runs[run][stat] += 1
+
+        if self.is_closed(user_id): return count('skipped_closed')
+        user = self.bot.get_user(user_id)
+        if user is None:
+            try: user = await self.bot.fetch_user(user_id)
+            except: return count('failed')
+
+        for attempt in range(DM_MAX_ATTEMPTS):
+            await self.bucket.acquire()
+            try:
+                await user.send(content=content, embed=embed)
+                return count('sent')
+            except discord.Forbidden:
+                self.closed_dms[user_id] = time.monotonic()
+                return count('closed')
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    retry_after = getattr(e, 'retry_after', None) or 2 ** attempt
+                    self.bucket.penalize(retry_after)
+                    count('rate_limited')
+                elif e.status < 500:
+                    return count('failed')
+                else:
+                    await asyncio.sleep(2 ** attempt)
+        count('failed')
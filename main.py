@@ -2,7 +2,11 @@ import discord
 from discord.ext import commands
 import config
 import database
-from views import PersistentRsvpView
+from boards import BoardRegistry
+from channel_renamer import ChannelRenamer
+from dm_dispatcher import DMDispatcher
+from views import PersistentRsvpView, RsvpButton
+from cogs.views_polls import restore_poll_views
 
 class ClanBot(commands.Bot):
     def __init__(self):
@@ -12,6 +16,10 @@ class ClanBot(commands.Bot):
     async def setup_hook(self):
         # 1. Banco de Dados
         await database.init_db()
+        self.dms = DMDispatcher(self)
+        self.dms.start()
+        self.boards = BoardRegistry(self)
+        self.renamer = ChannelRenamer()
         
         # 2. Cogs
         extensions = [
@@ -30,12 +38,21 @@ class ClanBot(commands.Bot):
                 print(f"Erro ao carregar {ext}: {e}")
         
         # 3. Persistent Views
-        self.add_view(PersistentRsvpView())
+        self.add_dynamic_items(RsvpButton)
+        self.add_view(PersistentRsvpView())  # mensagens antigas, até a migração dos botões
+        restored = await restore_poll_views(self)
+        if restored: print(f"[POLLS] {restored} enquetes abertas restauradas.")
         
         # 4. Sync Comandos Slash
         await self.tree.sync()
         print(f"Logado como {self.user} e pronto!")
 
+    async def close(self):
+        if hasattr(self, 'dms'): await self.dms.stop()
+        await super().close()
+        # Fecha as conexões persistentes do banco depois que os cogs pararam
+        await database.close_db()
+
 bot = ClanBot()
 
 if __name__ == '__main__':
@@ -0,0 +1,67 @@
+import asyncio
+import time
+import config
+import database as db
+import utils
+from views import RSVP_VIEW_VERSION, rsvp_view
+
+async def _timed(timings, step, coro):
+    started = time.perf_counter()
+    try: return await coro
+    finally: timings[step] = round((time.perf_counter() - started) * 1000)
+
+async def provision_event(bot, guild, *, title, description, activity_type, dt, max_slots, creator_id,
+                          confirmed_ids, role_name, announcement="", reason="Evento Bot"):
+    """Cria cargo, canal, evento e mensagem de um evento novo; usado pelo /agendar, SlotsView e enquetes.
+
+    Cargo e canal são criados em paralelo; evento e RSVPs iniciais entram numa única transação;
+    a mensagem já sai com o embed final. Se algum passo falhar, o que já foi criado é desfeito.
+    Retorna (event_id, channel) ou None.
+    """
+    timings = {}
+    started = time.perf_counter()
+    role = channel = event_id = None
+    try:
+        confirmed_ids = list(dict.fromkeys(confirmed_ids))
+        category = guild.get_channel(config.CATEGORY_EVENTS_ID)
+        channel_name = utils.generate_channel_name(title, dt, activity_type, max(0, max_slots - len(confirmed_ids)), description=description)
+        results = await _timed(timings, 'role+channel', asyncio.gather(
+            guild.create_role(name=role_name, mentionable=True, reason=reason),
+            guild.create_text_channel(name=channel_name, category=category) if category else guild.create_text_channel(name=channel_name),
+            return_exceptions=True,
+        ))
+        # Se só um dos dois falhou, o outro ainda precisa ser desfeito
+        role, channel = [None if isinstance(r, BaseException) else r for r in results]
+        for r in results:
+            if isinstance(r, BaseException): raise r
+
+        event_data = {'guild_id': guild.id, 'channel_id': channel.id, 'role_id': role.id, 'title': title, 'desc': description,
+                      'type': activity_type, 'date': dt, 'slots': max_slots, 'creator': creator_id}
+        event_id = await _timed(timings, 'db', db.create_event(event_data, confirmed_ids))
+
+        embed_data = {'event_id': event_id, 'guild_id': guild.id, 'title': title, 'description': description, 'activity_type': activity_type,
+                      'date_time': dt, 'max_slots': max_slots, 'creator_id': creator_id}
+        rsvps = [{'user_id': uid, 'status': 'confirmed'} for uid in confirmed_ids]
+        embed = await _timed(timings, 'embed', utils.build_event_embed(embed_data, rsvps, bot))
+
+        msg = await _timed(timings, 'message', channel.send(content=f"{role.mention} {announcement}".strip(), embed=embed, view=rsvp_view(event_id)))
+        await _timed(timings, 'db_message', db.set_event_message(event_id, msg.id, RSVP_VIEW_VERSION))
+    except Exception as e:
+        print(f"[PROVISION] Falha ao criar '{title}': {e}. Desfazendo...")
+        cleanup = [r.delete(reason="Criação falhou") for r in (channel, role) if r]
+        await asyncio.gather(*cleanup, return_exceptions=True)
+        if event_id:
+            try: await db.discard_event(event_id)
+            except Exception as e: print(f"[PROVISION] Erro ao desfazer evento {event_id}: {e}")
+        return None
+
+    # Cargos dos confirmados em paralelo; falha aqui não desfaz o evento
+    members = [m for m in (guild.get_member(uid) for uid in confirmed_ids) if m]
+    await _timed(timings, 'roles', asyncio.gather(*(m.add_roles(role) for m in members), return_exceptions=True))
+
+    tasks_cog = bot.get_cog('TasksCog')
+    if tasks_cog: await _timed(timings, 'schedule', tasks_cog.schedule_event(event_id))
+
+    total = round((time.perf_counter() - started) * 1000)
+    print(f"[PROVISION] Evento {event_id} criado em {total}ms: " + ", ".join(f"{k} {v}ms" for k, v in timings.items()))
+    return event_id, channel
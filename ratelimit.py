@@ -0,0 +1,33 @@
+import asyncio
+import time
+
+class TokenBucket:
+    """Balde de tokens: permite rajadas de até `capacity` chamadas e repõe `rate` tokens por segundo.
+
+    `acquire()` só espera quando o balde está vazio, em vez de dormir um intervalo fixo por chamada.
+    """
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def penalize(self, seconds):
+        """Após um 429: esvazia o balde para que o próximo acquire espere `seconds`."""
+        self._refill()
+        self._tokens = min(self._tokens, 1 - seconds * self.rate)
@@ -0,0 +1,88 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+from constants import BR_TIMEZONE
+
+# Teto de espera: mesmo sem novos agendamentos, o loop reavalia o relógio periodicamente
+MAX_SLEEP_SECONDS = 3600
+
+class EventScheduler:
+    """Dispara callbacks em horários exatos usando um heap de prazos e uma única task.
+
+    Entre um disparo e outro a task fica dormindo, sem polling nem acesso ao banco.
+    Cada agendamento tem uma chave (ex: (event_id, 'reminder_1h')); agendar de novo
+    a mesma chave substitui o anterior.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._running = set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task: self._task.cancel()
+        self._task = None
+        for task in list(self._running): task.cancel()
+
+    def schedule(self, key, when, callback):
+        """Agenda `callback()` (coroutine function) para `when` (datetime com fuso)."""
+        self.cancel(key)
+        entry = [when, next(self._seq), key, callback, True]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry: self._wakeup.set()
+
+    def cancel(self, key):
+        entry = self._entries.pop(key, None)
+        if entry: entry[4] = False
+
+    def cancel_group(self, group):
+        """Cancela todas as chaves-tupla cujo primeiro elemento é `group`."""
+        for key in [k for k in self._entries if isinstance(k, tuple) and k and k[0] == group]:
+            self.cancel(key)
+
+    def scheduled_keys(self):
+        return list(self._entries.keys())
+
+    def next_fire_time(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def _run(self):
+        while True:
+            while self._heap and not self._heap[0][4]: heapq.heappop(self._heap)
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            entry = self._heap[0]
+            delay = (entry[0] - datetime.datetime.now(BR_TIMEZONE)).total_seconds()
+            if delay > 0:
+                self._wakeup.clear()
+                try: await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, MAX_SLEEP_SECONDS))
+                except asyncio.TimeoutError: pass
+                continue
+
+            heapq.heappop(self._heap)
+            entry[4] = False
+            if self._entries.get(entry[2]) is entry: del self._entries[entry[2]]
+            task = asyncio.create_task(self._fire(entry[2], entry[3]))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _fire(self, key, callback):
+        try: await callback()
+        except asyncio.CancelledError: raise
+        except Exception as e: print(f"[SCHEDULER] Erro em {key}: {e}")
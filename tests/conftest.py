@@ -0,0 +1,33 @@
+import asyncio
+import collections
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Módulo `database` apontando para um banco temporário, com pool, fila e caches novos."""
+    pool = database.ConnectionPool(str(tmp_path / "test.db"))
+    monkeypatch.setattr(database, '_pool', pool)
+    monkeypatch.setattr(database, '_writes', database.WriteBehindQueue(pool))
+    monkeypatch.setattr(database, '_events', database.EventCache())
+    monkeypatch.setattr(database, '_rsvp_locks', collections.defaultdict(asyncio.Lock))
+    return database
+
+
+@pytest.fixture
+def run(db):
+    """Roda `coro_fn()` num loop novo com o banco migrado, fechando tudo no fim."""
+    def runner(coro_fn):
+        async def main():
+            await db.init_db()
+            try: return await coro_fn()
+            finally: await db.close_db()
+        return asyncio.run(main())
+    return runner
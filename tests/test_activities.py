@@ -0,0 +1,40 @@
+import pytest
+
+import utils
+
+
+@pytest.mark.parametrize("text", [
+    # Palavras genéricas e curtas não podem virar uma raid de 6 vagas
+    "Raid", "raid escola", "Raid mestre", "raid farm",
+    "rota", "vota", "crista", "roots", "knowledge",
+])
+def test_generic_or_near_miss_words_are_not_activities(text):
+    official, type_key, slots = utils.detect_activity_details(text)
+    assert type_key == 'OUTRO'
+    assert slots is None
+
+
+@pytest.mark.parametrize("text,official,type_key", [
+    ("voto discipulo", "Voto do Discípulo", 'RAID'),
+    ("Raid do Voto mestre", "Voto do Discípulo", 'RAID'),
+    ("raid crota", "O Fim de Crota", 'RAID'),
+    ("Crota mestre", "O Fim de Crota", 'RAID'),
+    ("root", "Raiz dos Pesadelos", 'RAID'),
+    ("vog", "Câmara de Cristal", 'RAID'),
+    ("pinaculo", "Pináculo da Sentinela", 'MASMORRA'),
+    ("trials", "Desafios de Osíris", 'PVP'),
+    # Erros de digitação que o fuzzy ainda deve pegar
+    ("crotta", "O Fim de Crota", 'RAID'),
+    ("ultmo desejo", "Último Desejo", 'RAID'),
+    ("raiz dos pesadelo", "Raiz dos Pesadelos", 'RAID'),
+    ("vault of glas", "Câmara de Cristal", 'RAID'),
+    ("profesia", "Profecia", 'MASMORRA'),
+])
+def test_known_activities_and_typos(text, official, type_key):
+    assert utils.detect_activity_details(text)[:2] == (official, type_key)
+
+
+def test_mode_is_detected_without_activity():
+    match = utils.lookup_activity("raid mestre")
+    assert match.official is None
+    assert match.mode == 'mestre'
@@ -0,0 +1,56 @@
+import datetime
+import time
+
+import pytest
+
+import utils
+from constants import BR_TIMEZONE
+
+# Formatos que o fast path cobre e que o dateparser também entende
+CORPUS = [
+    "hoje 21h", "hoje 10h", "amanhã 20:30", "amanha 8h",
+    "segunda 8h", "quarta às 19h", "quinta 21h30", "sexta 21:30", "sábado 17h", "sabado 17h", "domingo 20h",
+    "18/10 10h", "18/10 21h", "19/10 21h", "17/10 21h", "25/12 20h", "01/01 10h",
+    "18/10/2026 21h", "31/12/26 23h",
+]
+# Uma semana inteira de referências, incluindo horários antes, no meio e depois dos do corpus
+REFERENCES = [BR_TIMEZONE.localize(datetime.datetime(2026, 10, 12 + day, hour, minute))
+              for day in range(7) for hour, minute in [(0, 0), (10, 0), (17, 0), (18, 0), (21, 30), (23, 59)]]
+
+
+@pytest.mark.parametrize("now", REFERENCES, ids=lambda now: now.strftime('%a-%H%M'))
+def test_fast_path_matches_dateparser(now):
+    for text in CORPUS:
+        expected = utils._slow_parse_date(text, now)
+        assert expected is not None, text
+        assert utils._fast_parse_date(text, now) == expected.replace(second=0, microsecond=0), (text, now)
+
+
+@pytest.mark.parametrize("text,now,expected", [
+    # Mesmo dia da semana, horário já passado ou não: semana que vem
+    ("sábado 17h", datetime.datetime(2026, 10, 17, 18, 0), datetime.datetime(2026, 10, 24, 17, 0)),
+    ("domingo 20h", datetime.datetime(2026, 10, 18, 21, 0), datetime.datetime(2026, 10, 25, 20, 0)),
+    # dd/mm de hoje com horário já passado: ano seguinte
+    ("18/10 10h", datetime.datetime(2026, 10, 18, 15, 0), datetime.datetime(2027, 10, 18, 10, 0)),
+    ("18/10 21h", datetime.datetime(2026, 10, 18, 15, 0), datetime.datetime(2026, 10, 18, 21, 0)),
+])
+def test_fast_path_never_returns_past_dates(text, now, expected):
+    now = BR_TIMEZONE.localize(now)
+    dt = utils._fast_parse_date(text, now)
+    assert dt == BR_TIMEZONE.localize(expected)
+    assert dt > now
+
+
+def test_fast_path_benchmark():
+    """Benchmark: fast path vs. dateparser no mesmo corpus (sem o lru_cache)."""
+    now = REFERENCES[0]
+    rounds = 20
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in CORPUS: utils._fast_parse_date(text, now)
+    fast = (time.perf_counter() - started) / (rounds * len(CORPUS))
+    started = time.perf_counter()
+    for text in CORPUS: utils._slow_parse_date(text, now)
+    slow = (time.perf_counter() - started) / len(CORPUS)
+    print(f"\n[bench] por chamada: fast path {fast * 1e6:.1f}us, dateparser {slow * 1e6:.1f}us")
+    assert fast * 10 < slow
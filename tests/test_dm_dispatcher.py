@@ -0,0 +1,57 @@
+import asyncio
+
+import discord
+
+from dm_dispatcher import DMDispatcher
+
+
+class FakeUser:
+    def __init__(self, user_id, inbox):
+        self.id = user_id
+        self.inbox = inbox
+
+    async def send(self, content=None, embed=None):
+        self.inbox.append((self.id, content, embed))
+
+
+class FakeBot:
+    def __init__(self):
+        self.inbox = []
+
+    def get_user(self, user_id):
+        return FakeUser(user_id, self.inbox)
+
+
+def test_stop_flushes_pending_digests():
+    async def scenario():
+        bot = FakeBot()
+        dms = DMDispatcher(bot)
+        dms.start()
+        for event_id in (1, 2):
+            dms.send(10, embed=discord.Embed(title=f"Evento {event_id}"), key=f"{event_id}:reminder_1h", digest="⏰ Lembretes")
+        # Ainda dentro da janela do digest: stop() não pode perder as mensagens
+        await dms.stop()
+        return bot.inbox
+
+    inbox = asyncio.run(scenario())
+    assert len(inbox) == 1
+    user_id, _, embed = inbox[0]
+    assert user_id == 10
+    assert [f.name for f in embed.fields] == ["Evento 1", "Evento 2"]
+
+
+def test_dedup_key_with_new_time_is_sent_again():
+    async def scenario():
+        bot = FakeBot()
+        dms = DMDispatcher(bot)
+        dms.start()
+        dms.send(10, content="1h", key="42:reminder_1h:1000")
+        dms.send(10, content="1h", key="42:reminder_1h:1000")
+        # Evento remarcado: mesma etapa, outro horário
+        dms.send(10, content="1h", key="42:reminder_1h:2000")
+        await dms.stop()
+        return bot.inbox, dms.get_stats()
+
+    inbox, stats = asyncio.run(scenario())
+    assert len(inbox) == 2
+    assert stats['deduped'] == 1
@@ -0,0 +1,47 @@
+import pytest
+
+import database
+
+# RSVPs por evento: tanto a PK (event_id, user_id) quanto idx_rsvps_event_seq servem para buscar por event_id
+RSVPS_BY_EVENT = ('idx_rsvps_event_seq', 'sqlite_autoindex_rsvps_1')
+
+# Consultas quentes (as mesmas strings que o database executa) -> índice(s) aceitos para cada tabela
+HOT_QUERIES = [
+    ('VOICE_HOURS_QUERY', database.VOICE_HOURS_QUERY, ('2025-01-01',), {'voice_daily': 'PRIMARY KEY'}),
+    ('ACTIVE_DAYS_QUERY', database.ACTIVE_DAYS_QUERY, ('2025-01-01', 60), {'voice_daily': 'PRIMARY KEY'}),
+    ('SESSIONS_IN_RANGE_QUERY', database.SESSIONS_IN_RANGE_QUERY, (1, '2025-01-01'), {'voice_sessions': 'idx_voice_user_start'}),
+    ('LAST_VOICE_QUERY', database.LAST_VOICE_QUERY, (1,), {'voice_sessions': 'idx_voice_user_start'}),
+    ('LAST_EVENT_QUERY', database.LAST_EVENT_QUERY, (1,), {'event_attendance': 'idx_attendance_user_seen'}),
+    ('ACTIVE_EVENTS_QUERY', database.ACTIVE_EVENTS_QUERY, (), {'events': 'idx_events_status_date'}),
+    ('RSVPS_QUERY', database.RSVPS_QUERY, (1,), {'rsvps': 'idx_rsvps_event_seq'}),
+    ('OPEN_POLLS_QUERY', database.OPEN_POLLS_QUERY, (), {'polls': 'idx_polls_status'}),
+    ('ACTIVE_EVENTS_OVERVIEW_QUERY', database.ACTIVE_EVENTS_OVERVIEW_QUERY.format(event_filter=""), (),
+     {'e': 'idx_events_status_date', 'l': 'INTEGER PRIMARY KEY', 'r': RSVPS_BY_EVENT}),
+    ('ACTIVE_EVENTS_OVERVIEW_QUERY(event_id)', database.ACTIVE_EVENTS_OVERVIEW_QUERY.format(event_filter="AND e.event_id = ?"), (1,),
+     {'e': 'INTEGER PRIMARY KEY', 'l': 'INTEGER PRIMARY KEY', 'r': RSVPS_BY_EVENT}),
+]
+
+
+@pytest.mark.parametrize("sql,params,indexes", [q[1:] for q in HOT_QUERIES], ids=[q[0] for q in HOT_QUERIES])
+def test_hot_query_uses_index(db, run, sql, params, indexes):
+    async def scenario():
+        async with db._pool.read() as conn:
+            async with conn.execute(f"EXPLAIN QUERY PLAN {sql}", params) as cursor:
+                return [row['detail'] for row in await cursor.fetchall()]
+
+    plan = run(scenario)
+    # Cada tabela é lida por busca no índice esperado (SEARCH), nunca por varredura (SCAN)
+    for table, index in indexes.items():
+        accepted = (index,) if isinstance(index, str) else index
+        assert any(step.startswith(f'SEARCH {table} ') and any(i in step for i in accepted) for step in plan), (table, plan)
+    assert not any(step.startswith('SCAN') for step in plan), plan
+
+
+def test_unused_indexes_are_dropped(db, run):
+    async def scenario():
+        async with db._pool.read() as conn:
+            async with conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'") as cursor:
+                return {row['name'] for row in await cursor.fetchall()}
+
+    indexes = run(scenario)
+    assert not indexes & {'idx_voice_valid_start', 'idx_voice_daily_user', 'idx_rsvps_event_ts'}
@@ -0,0 +1,160 @@
+import asyncio
+import datetime
+import json
+import random
+
+import discord
+
+import utils
+from cogs.views_polls import POLL_DEFAULT_TTL, POLL_MIN_TTL, VotingPollView, poll_expiry
+from constants import BR_TIMEZONE
+
+POLL_ID = 1000
+OPTIONS = [{'label': f"{h}:00", 'value': f"2030-01-0{d} {h}:00"} for d, h in [(1, 8), (1, 11), (1, 14), (1, 17), (1, 20), (1, 22)]]
+
+
+class FakeMember:
+    def __init__(self, user_id): self.id, self.display_name = user_id, f"Guardião {user_id}"
+
+
+class FakeGuild:
+    def get_member(self, user_id): return FakeMember(user_id)
+
+
+class FakeMessage:
+    def __init__(self):
+        self.id = POLL_ID
+        self.embeds = [discord.Embed(title="📊 Horário: Crota")]
+        self.edits = 0
+    async def edit(self, embed=None): self.edits += 1
+
+
+class FakeResponse:
+    async def defer(self): pass
+
+
+class FakeFollowup:
+    def __init__(self): self.sent = []
+    async def send(self, content, ephemeral=False): self.sent.append(content)
+
+
+class FakeInteraction:
+    def __init__(self, user_id, message):
+        self.user = FakeMember(user_id)
+        self.guild = FakeGuild()
+        self.message = message
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+
+
+async def _open_poll(db, tally=None):
+    target_data = json.dumps({'activity': 'Crota', 'options': OPTIONS})
+    view = VotingPollView(None, 'when', target_data, OPTIONS, tally=tally)
+    await db.create_poll(POLL_ID, 1, 1, 'when', target_data, view.expires_at)
+    return view
+
+
+def test_concurrent_votes_cost_one_write_and_one_edit_each(db, run, monkeypatch):
+    """Carga: 30 votantes x 6 opções, 600 cliques simultâneos pelo handle_vote (vários repetidos = desvoto).
+    Cada voto custa uma escrita e uma edição da mensagem; o placar nunca relê a tabela de votos."""
+    calls = {'toggle': 0, 'reread': 0}
+    toggle = db.toggle_poll_vote
+    async def counting_toggle(*args):
+        calls['toggle'] += 1
+        return await toggle(*args)
+    monkeypatch.setattr(db, 'toggle_poll_vote', counting_toggle)
+    for name in ('get_open_poll_votes', 'get_poll_votes', 'get_poll_voters_detailed', 'get_voters_for_option', 'check_user_vote_on_option'):
+        async def reread(*args, _real=getattr(db, name)):
+            calls['reread'] += 1
+            return await _real(*args)
+        monkeypatch.setattr(db, name, reread)
+
+    async def scenario():
+        view = await _open_poll(db)
+        view.threshold = 10 ** 6  # meta inalcançável: mede só o caminho do voto
+        message = FakeMessage()
+        rng = random.Random(7)
+        clicks = [(rng.randint(1, 30), rng.choice(OPTIONS)['value']) for _ in range(600)]
+        await asyncio.gather(*(view.handle_vote(FakeInteraction(uid, message), opt) for uid, opt in clicks))
+        reads_during_votes = calls['reread']
+        persisted = (await db.get_open_poll_votes()).get(POLL_ID, {})
+        return view.tally, persisted, clicks, message.edits, reads_during_votes
+
+    tally, persisted, clicks, edits, reads_during_votes = run(scenario)
+    assert calls['toggle'] == len(clicks)
+    assert edits == len(clicks)
+    assert reads_during_votes == 0
+    as_sets = lambda t: {opt: set(uids) for opt, uids in t.items() if uids}
+    assert as_sets(tally) == as_sets(persisted)
+    # Voto fica registrado se o par (usuário, opção) foi clicado um número ímpar de vezes
+    expected = {}
+    for pair in clicks: expected[pair] = not expected.get(pair, False)
+    assert {(uid, opt) for opt, uids in as_sets(tally).items() for uid in uids} == {p for p, on in expected.items() if on}
+
+
+def test_restored_tally_matches_persisted_votes(db, run):
+    async def scenario():
+        view = await _open_poll(db)
+        for uid in range(1, 5): await view.toggle_vote(POLL_ID, uid, OPTIONS[0]['value'])
+        await view.toggle_vote(POLL_ID, 2, OPTIONS[0]['value'])
+        restored = (await db.get_open_poll_votes())[POLL_ID]
+        return view.tally, restored
+
+    tally, restored = run(scenario)
+    assert list(restored[OPTIONS[0]['value']]) == [1, 3, 4]
+    assert list(tally[OPTIONS[0]['value']]) == [1, 3, 4]
+
+
+def test_concurrent_close_has_exactly_one_winner(db, run):
+    async def scenario():
+        await _open_poll(db)
+        return await asyncio.gather(*(db.close_poll_if_open(POLL_ID) for _ in range(2)))
+
+    assert sorted(run(scenario)) == [False, True]
+
+
+def test_simultaneous_threshold_votes_close_the_poll_once(db, run):
+    """Dois votos cruzando a meta ao mesmo tempo pelo handle_vote: um cria o evento, o outro é recusado."""
+    async def scenario():
+        view = await _open_poll(db)
+        created = []
+        async def trigger(interaction, winner, voters): created.append((interaction.user.id, voters))
+        view.trigger_event_creation = trigger
+        message, option = FakeMessage(), OPTIONS[0]['value']
+        for uid in (1, 2): await view.handle_vote(FakeInteraction(uid, message), option)
+        late = [FakeInteraction(uid, message) for uid in (3, 4)]
+        await asyncio.gather(*(view.handle_vote(i, option) for i in late))
+        return created, [i.followup.sent for i in late], await db.get_poll_details(POLL_ID), await db.get_poll_voters_detailed(POLL_ID)
+
+    created, replies, poll, voters = run(scenario)
+    assert created == [(3, [1, 2, 3])]
+    assert replies == [[], ["⚠️ Esta enquete já foi encerrada."]]
+    assert poll['status'] == 'closed'
+    # O voto recusado não chega ao banco
+    assert sorted(v['user_id'] for v in voters) == [1, 2, 3]
+
+
+def test_close_keeps_view_open_when_db_fails(db, run, monkeypatch):
+    async def scenario():
+        view = await _open_poll(db)
+        async def broken(message_id): raise RuntimeError("database is locked")
+        monkeypatch.setattr(db, 'close_poll_if_open', broken)
+        try: await view.close(POLL_ID)
+        except RuntimeError: pass
+        return view.closed, await db.get_poll_details(POLL_ID)
+
+    closed, poll = run(scenario)
+    assert closed is False
+    assert poll['status'] == 'open'
+
+
+def test_poll_expiry_never_in_the_past(monkeypatch):
+    now = datetime.datetime.now(BR_TIMEZONE)
+    past, future = now - datetime.timedelta(hours=1), now + datetime.timedelta(days=1)
+    # "hoje 9h" postado às 10h
+    monkeypatch.setattr(utils, 'parse_human_date', lambda text: past)
+    assert poll_expiry('what', {'date_str': 'hoje 9h'}) >= now + POLL_MIN_TTL
+    # Todas as opções de horário já passaram / pelo menos uma ainda vem
+    assert poll_expiry('when', {}, [past]) >= now + POLL_MIN_TTL
+    assert poll_expiry('when', {}, [past, future]) == future
+    assert poll_expiry('when', {}) >= now + POLL_DEFAULT_TTL
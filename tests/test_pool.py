@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import aiosqlite
+
+CALLS = 200
+
+
+def test_pool_reads_are_faster_than_a_connection_per_call(db, run):
+    """Micro-benchmark: leituras pelo pool persistente vs. abrir uma conexão por chamada (modelo antigo)."""
+    async def scenario():
+        await db.get_active_events()  # aquece o pool
+
+        started = time.perf_counter()
+        for _ in range(CALLS): await db.get_active_events()
+        pooled = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(CALLS):
+            async with aiosqlite.connect(db._pool.path) as conn:
+                conn.row_factory = aiosqlite.Row
+                async with conn.execute("SELECT * FROM events WHERE status = 'active'") as cursor:
+                    await cursor.fetchall()
+        per_call = time.perf_counter() - started
+
+        print(f"\n[bench] {CALLS} leituras: pool {pooled * 1000:.1f}ms, conexão por chamada {per_call * 1000:.1f}ms")
+        return pooled, per_call
+
+    pooled, per_call = run(scenario)
+    assert pooled < per_call
+
+
+def test_concurrent_readers_share_the_pool(db, run):
+    async def scenario():
+        results = await asyncio.gather(*(db.get_active_events() for _ in range(50)))
+        return len(results), len(db._pool._all)
+
+    calls, connections = run(scenario)
+    assert calls == 50
+    assert connections == db.DB_READERS + 1
+
+
+def test_closed_pool_refuses_late_reads_and_writes(db, run):
+    async def scenario():
+        await db.get_active_events()
+        await db.close_db()
+        errors = []
+        for call in (db.get_active_events(), db.set_manager_id(1, 2)):
+            try: await call
+            except RuntimeError as e: errors.append(e)
+        state = (len(errors), db._pool.is_open, len(db._pool._all))
+        await db.init_db()  # reabrir só por chamada explícita
+        return state, await db.get_active_events()
+
+    (errors, is_open, connections), reopened = run(scenario)
+    assert (errors, is_open, connections) == (2, False, 0)
+    assert reopened == []
@@ -0,0 +1,50 @@
+import asyncio
+import datetime
+
+from cogs.ranking import RankingCog, VoiceOccupancy
+from constants import BR_TIMEZONE
+
+
+def _cog():
+    cog = RankingCog.__new__(RankingCog)
+    cog.active_timers, cog.occupancy, cog.journal_dirty = {}, VoiceOccupancy(), set()
+    return cog
+
+
+def test_segment_closed_during_journal_flush_is_counted_once(db, run):
+    """Trecho fechado enquanto o flush do diário está em andamento não volta para o diário (nem conta duas vezes)."""
+    async def scenario():
+        cog = _cog()
+        now = datetime.datetime.now(BR_TIMEZONE)
+        start = now - datetime.timedelta(minutes=40)
+        cog.active_timers[1] = (start, True)
+        cog.journal_dirty.add(1)
+        # Escrita pendente no diário: o flush teria de esperar a fila antes de gravar
+        await db.log_voice_session(2, start, now, 40)
+
+        flush = asyncio.create_task(cog.flush_journal())
+        await asyncio.sleep(0)
+        await cog.close_timer(1, now)
+        await flush
+        await db._writes.flush()
+        # Queda do bot: o que ficou no diário é fechado no último heartbeat
+        orphans = await db.close_orphan_voice_sessions()
+        return orphans, await db.get_sessions_in_range(1, 1)
+
+    orphans, sessions = run(scenario)
+    assert orphans == 0
+    assert [s['duration_minutes'] for s in sessions] == [40]
+
+
+def test_journal_keeps_open_segments_for_crash_recovery(db, run):
+    async def scenario():
+        cog = _cog()
+        start = datetime.datetime.now(BR_TIMEZONE) - datetime.timedelta(minutes=30)
+        cog.active_timers[1] = (start, True)
+        cog.journal_dirty.add(1)
+        await cog.flush_journal()
+        return await db.close_orphan_voice_sessions(), await db.get_sessions_in_range(1, 1)
+
+    orphans, sessions = run(scenario)
+    assert orphans == 1
+    assert len(sessions) == 1
@@ -0,0 +1,85 @@
+import asyncio
+
+import config
+from cogs.roles import RolesManager
+from ratelimit import TokenBucket
+
+
+class FakeRole:
+    def __init__(self, role_id): self.id = role_id
+
+
+class FakeGuild:
+    owner_id = 0
+    everyone_id = 1
+
+    def __init__(self, role_ids):
+        self.roles = {rid: FakeRole(rid) for rid in role_ids}
+        self.members = {}
+
+    def get_role(self, role_id): return self.roles.get(role_id)
+    def get_member(self, member_id): return self.members.get(member_id)
+
+
+class FakeMember:
+    def __init__(self, guild, member_id, role_ids, display_name):
+        self.guild = guild
+        self.id = member_id
+        self.roles = [FakeRole(guild.everyone_id)] + [guild.roles[rid] for rid in role_ids]
+        self.display_name = display_name
+        self.edits = []
+        guild.members[member_id] = self
+
+    def get_role(self, role_id): return next((r for r in self.roles if r.id == role_id), None)
+
+    async def edit(self, reason=None, **kwargs):
+        self.edits.append(kwargs)
+        if 'roles' in kwargs: self.roles = self.roles[:1] + kwargs['roles']
+        if 'nick' in kwargs: self.display_name = kwargs['nick']
+
+
+HAND_ROLE = 999
+
+
+def _setup():
+    guild = FakeGuild([config.ROLE_TURISTA_ID, config.ROLE_ATIVO_ID, config.ROLE_MESTRE_ID, config.ROLE_PRESENTE_SEMPRE, HAND_ROLE])
+    cog = RolesManager.__new__(RolesManager)
+    cog.edit_bucket = TokenBucket(100, 100)
+    return guild, cog
+
+
+def test_roles_given_while_queued_survive_the_sync():
+    """Entre o plano e a edição alguém recebe um cargo à mão: a sync não pode removê-lo."""
+    guild, cog = _setup()
+    member = FakeMember(guild, 10, [config.ROLE_TURISTA_ID], "Ana")
+    plan = cog.plan_member_sync(member, 'ATIVO', presente=True)
+    member.roles.append(guild.roles[HAND_ROLE])
+    asyncio.run(cog.apply_member_sync(guild, *plan))
+    assert {r.id for r in member.roles[1:]} == {HAND_ROLE, config.ROLE_ATIVO_ID, config.ROLE_PRESENTE_SEMPRE}
+    assert len(member.edits) == 1
+
+
+def test_nickname_changed_while_queued_keeps_the_new_name():
+    guild, cog = _setup()
+    member = FakeMember(guild, 10, [config.ROLE_TURISTA_ID], "Ana")
+    plan = cog.plan_member_sync(member, 'ATIVO', presente=False)
+    member.display_name = "Aninha"
+    asyncio.run(cog.apply_member_sync(guild, *plan))
+    assert member.edits[0]['nick'].endswith("Aninha")
+
+
+def test_member_made_mestre_while_queued_is_left_alone():
+    guild, cog = _setup()
+    member = FakeMember(guild, 10, [config.ROLE_TURISTA_ID], "Ana")
+    plan = cog.plan_member_sync(member, 'ATIVO', presente=False)
+    member.roles.append(guild.roles[config.ROLE_MESTRE_ID])
+    asyncio.run(cog.apply_member_sync(guild, *plan))
+    assert member.edits == []
+    assert config.ROLE_MESTRE_ID in {r.id for r in member.roles}
+
+
+def test_no_plan_when_nothing_changes():
+    guild, cog = _setup()
+    member = FakeMember(guild, 10, [config.ROLE_TURISTA_ID], "Ana")
+    member.display_name = cog.build_nickname(member, 'TURISTA') or member.display_name
+    assert cog.plan_member_sync(member, 'TURISTA', presente=False) is None
@@ -0,0 +1,220 @@
+import asyncio
+import datetime
+import random
+
+import views
+
+MAX_SLOTS = 6
+
+
+class FakeUser:
+    def __init__(self, user_id, client):
+        self.id = user_id
+        self.display_name = f"Guardião {user_id}"
+        self.client = client
+
+    async def add_roles(self, role): self.client.roles[self.id] = True
+    async def remove_roles(self, role): self.client.roles[self.id] = False
+
+
+class FakeDMs:
+    def __init__(self): self.sent = []
+    def send(self, user_id, content=None, **kwargs): self.sent.append((user_id, content))
+
+
+class FakeTasksCog:
+    def __init__(self): self.renames = []
+    def request_rename(self, event): self.renames.append(event['counts']['confirmed'])
+
+
+class FakeClient:
+    def __init__(self):
+        self.roles = {}
+        self.dms = FakeDMs()
+        self.tasks_cog = FakeTasksCog()
+    def get_cog(self, name): return self.tasks_cog if name == 'TasksCog' else None
+    def get_guild(self, guild_id): return None
+    def get_user(self, user_id): return FakeUser(user_id, self)
+
+
+class FakeGuild:
+    def get_role(self, role_id): return object()
+
+
+class FakeMessage:
+    def __init__(self): self.edits = []
+    async def edit(self, embed=None): self.edits.append(embed)
+
+
+class FakeResponse:
+    def __init__(self, log): self.log = log
+    async def defer(self, ephemeral=False): self.log.append('defer')
+
+
+class FakeFollowup:
+    def __init__(self, log): self.log = log
+    async def send(self, content, ephemeral=False): self.log.append(content)
+
+
+class FakeInteraction:
+    """Clique num botão de RSVP: registra defer/followups em ordem."""
+    def __init__(self, user_id, client, message):
+        self.log = []
+        self.client = client
+        self.user = FakeUser(user_id, client)
+        self.guild = FakeGuild()
+        self.message = message
+        self.response = FakeResponse(self.log)
+        self.followup = FakeFollowup(self.log)
+
+
+async def _click(client, message, event_id, user_id, status):
+    interaction = FakeInteraction(user_id, client, message)
+    await views.handle_rsvp_click(interaction, event_id, status)
+    return interaction.log
+
+
+async def _create_event(db, slots=MAX_SLOTS, confirmed_ids=()):
+    data = {'guild_id': 1, 'channel_id': 2, 'role_id': 3, 'title': 'Raid', 'desc': '', 'type': 'RAID',
+            'date': datetime.datetime(2030, 1, 1, 21, 0), 'slots': slots, 'creator': 4}
+    return await db.create_event(data, confirmed_ids)
+
+
+def _confirmed(rsvps):
+    return [r['user_id'] for r in rsvps if r['status'] == 'confirmed']
+
+
+def test_concurrent_clicks_never_overfill_a_full_event(db, run):
+    """Estresse: 300 cliques simultâneos (confirmar, desistir, talvez) num evento que já começa cheio."""
+    async def scenario():
+        event_id = await _create_event(db, confirmed_ids=range(1, MAX_SLOTS + 1))
+        rng = random.Random(42)
+        clicks = [(uid, rng.choice(['confirmed', 'confirmed', 'absent', 'maybe'])) for uid in (rng.randint(1, 60) for _ in range(300))]
+        results = await asyncio.gather(*(db.apply_rsvp(event_id, uid, status) for uid, status in clicks))
+        return results, await db.get_rsvps(event_id)
+
+    results, final = run(scenario)
+    # Nenhum estado intermediário nem o final passa do limite
+    assert all(len(_confirmed(rsvps)) <= MAX_SLOTS for _, _, rsvps in results)
+    assert len(_confirmed(final)) <= MAX_SLOTS
+    # Se sobrou vaga, não pode haver ninguém esperando
+    if len(_confirmed(final)) < MAX_SLOTS:
+        assert not any(r['status'] == 'waitlist' for r in final)
+
+
+def test_burst_of_confirms_fills_exactly_max_slots(db, run):
+    async def scenario():
+        event_id = await _create_event(db)
+        results = await asyncio.gather(*(db.apply_rsvp(event_id, uid, 'confirmed') for uid in range(100)))
+        return [r[0] for r in results], await db.get_rsvps(event_id)
+
+    statuses, final = run(scenario)
+    assert statuses.count('confirmed') == MAX_SLOTS
+    assert statuses.count('waitlist') == 100 - MAX_SLOTS
+    assert len(_confirmed(final)) == MAX_SLOTS
+
+
+def test_leaving_promotes_waitlist_in_arrival_order(db, run):
+    async def scenario():
+        event_id = await _create_event(db, slots=2)
+        for uid in (1, 2, 3, 4): await db.apply_rsvp(event_id, uid, 'confirmed')
+        _, promoted, rsvps = await db.apply_rsvp(event_id, 1, 'absent')
+        return promoted, rsvps
+
+    promoted, rsvps = run(scenario)
+    assert promoted == [3]
+    assert sorted(_confirmed(rsvps)) == [2, 3]
+
+
+def test_rsvp_lock_is_dropped_when_event_ends(db, run):
+    async def scenario():
+        done_id = await _create_event(db)
+        deleted_id = await _create_event(db)
+        await db.apply_rsvp(done_id, 1, 'confirmed')
+        await db.apply_rsvp(deleted_id, 1, 'confirmed')
+        before = set(db._rsvp_locks)
+        await db.update_event_status(done_id, 'completed')
+        await db.delete_event(deleted_id)
+        return before, set(db._rsvp_locks), done_id, deleted_id
+
+    before, after, done_id, deleted_id = run(scenario)
+    assert {done_id, deleted_id} <= before
+    assert not after & {done_id, deleted_id}
+
+
+def test_rejoining_waitlist_goes_behind_earlier_arrivals(db, run):
+    """Linha antiga (rowid menor) voltando à fila no mesmo segundo não fura a fila de quem já esperava."""
+    async def scenario():
+        event_id = await _create_event(db, slots=1)
+        await db.apply_rsvp(event_id, 10, 'maybe')
+        await db.apply_rsvp(event_id, 1, 'confirmed')
+        await db.apply_rsvp(event_id, 20, 'confirmed')
+        await db.apply_rsvp(event_id, 10, 'confirmed')
+        _, promoted, _ = await db.apply_rsvp(event_id, 1, 'absent')
+        return promoted, await db.get_rsvps(event_id)
+
+    promoted, rsvps = run(scenario)
+    assert promoted == [20]
+    assert [r['user_id'] for r in rsvps if r['status'] in ('confirmed', 'waitlist')] == [20, 10]
+
+
+def test_clicks_through_handler_defer_reply_and_render_once(db, run, monkeypatch):
+    """30 cliques 'Vou' simultâneos pelo handler real: defer primeiro, uma resposta cada, um único re-render."""
+    monkeypatch.setattr(views, 'event_renderer', views.EventEmbedRenderer(debounce=0.05))
+    overview_reads = []
+    for name in ('get_event_overview', 'get_active_events_overview'):
+        monkeypatch.setattr(db, name, lambda *args, _name=name: overview_reads.append(_name))
+
+    async def scenario():
+        event_id = await _create_event(db)
+        client, message = FakeClient(), FakeMessage()
+        logs = await asyncio.gather(*(_click(client, message, event_id, uid, 'confirmed') for uid in range(1, 31)))
+        await asyncio.sleep(0.2)
+        return client, message, logs, event_id
+
+    client, message, logs, event_id = run(scenario)
+    assert all(log[0] == 'defer' and len(log) == 2 for log in logs)
+    replies = [log[1] for log in logs]
+    assert replies.count("✅ Confirmado!") == MAX_SLOTS
+    assert replies.count("⚠️ Cheio! Entrou na **Lista de Espera**.") == 30 - MAX_SLOTS
+    # Confirmados e lista de espera recebem o cargo do evento
+    assert client.roles == {uid: True for uid in range(1, 31)}
+    assert len(message.edits) == 1
+    assert f"✅ Confirmados ({MAX_SLOTS}/{MAX_SLOTS})" in [f.name for f in message.edits[0].fields]
+    # Um pedido de renomeação por clique, com as contagens do apply_rsvp e na ordem das transações
+    assert client.tasks_cog.renames == list(range(1, MAX_SLOTS + 1)) + [MAX_SLOTS] * (30 - MAX_SLOTS)
+    assert overview_reads == []
+
+
+def test_leaving_through_handler_notifies_promoted_user(db, run, monkeypatch):
+    monkeypatch.setattr(views, 'event_renderer', views.EventEmbedRenderer(debounce=0.01))
+
+    async def scenario():
+        event_id = await _create_event(db, slots=1)
+        client, message = FakeClient(), FakeMessage()
+        for uid in (1, 2, 3): await _click(client, message, event_id, uid, 'confirmed')
+        log = await _click(client, message, event_id, 1, 'absent')
+        await asyncio.sleep(0.05)
+        return client, log
+
+    client, log = run(scenario)
+    assert log == ['defer', "❌ Ausente."]
+    assert client.roles[1] is False
+    assert [uid for uid, _ in client.dms.sent] == [2]
+
+
+def test_handler_reports_deleted_event_and_internal_errors(db, run, monkeypatch):
+    async def scenario():
+        event_id = await _create_event(db)
+        client, message = FakeClient(), FakeMessage()
+        missing = await _click(client, message, event_id + 1, 1, 'confirmed')
+
+        async def broken(*args): raise RuntimeError("database is locked")
+        monkeypatch.setattr(db, 'apply_rsvp', broken)
+        failed = await _click(client, message, event_id, 1, 'confirmed')
+        return missing, failed, message
+
+    missing, failed, message = run(scenario)
+    assert missing == ['defer', "❌ Evento deletado."]
+    assert failed == ['defer', "Erro interno."]
+    assert message.edits == []
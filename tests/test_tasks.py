@@ -0,0 +1,38 @@
+import asyncio
+
+from boards import BoardRegistry
+from channel_renamer import ChannelRenamer
+from cogs.tasks import TasksCog
+from dm_dispatcher import DMDispatcher
+
+
+class FakeBot:
+    def __init__(self):
+        self.dms = DMDispatcher(self)
+        self.renamer = ChannelRenamer()
+        self.boards = BoardRegistry(self)
+
+
+class FakeResponse:
+    def __init__(self): self.sent = []
+    async def send_message(self, embed=None, ephemeral=False): self.sent.append(embed)
+
+
+class FakeInteraction:
+    def __init__(self): self.response = FakeResponse()
+
+
+def test_diagnostics_reports_every_component():
+    async def scenario():
+        cog = TasksCog.__new__(TasksCog)
+        cog.bot = FakeBot()
+        cog.bot.dms.send(1, content="oi", run="notify:42")
+        interaction = FakeInteraction()
+        await TasksCog.diagnostics.callback(cog, interaction)
+        return interaction.response.sent
+
+    [embed] = asyncio.run(scenario())
+    fields = {f.name: f.value for f in embed.fields}
+    assert set(fields) == {"🗄️ Fila de escrita", "📦 Cache de eventos", "🖼️ Renders de evento", "✉️ DMs", "✏️ Renomeações", "📌 Quadros", "✉️ Últimas rodadas de DM"}
+    assert "`queued`: 1" in fields["✉️ DMs"]
+    assert "notify:42" in fields["✉️ Últimas rodadas de DM"]
@@ -1,23 +1,79 @@
 import discord
+import asyncio
 import datetime
+import time
 import dateparser
+import difflib
+import functools
+import hashlib
+import json
 import pytz
 import re
+import unicodedata
+from collections import OrderedDict, defaultdict, namedtuple
 from typing import Tuple, Optional
 from constants import (
     BR_TIMEZONE, RAID_INFO_PT, MASMORRA_INFO_PT, PVP_ACTIVITY_INFO_PT,
     DIAS_SEMANA_PT_SHORT, ACTIVITY_EMOJIS, ACTIVITY_MODES, CHANNEL_NAME_MAPPINGS,
-    RANK_STYLE
+    RANK_STYLE, SIMILARITY_THRESHOLD
 )
 
+# --- NOMES DE EXIBIÇÃO ---
+DISPLAY_NAME_TTL = 900
+DISPLAY_NAME_MAX = 2048
+
+class DisplayNameCache:
+    """Cache LRU com TTL de user_id -> nome, para quem não está no cache de membros (evita fetch_user repetido).
+    Invalidado pelos eventos on_user_update/on_member_update."""
+
+    def __init__(self, ttl=DISPLAY_NAME_TTL, maxsize=DISPLAY_NAME_MAX):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, user_id):
+        item = self._data.get(user_id)
+        if not item: return None
+        name, expires = item
+        if expires < time.monotonic():
+            del self._data[user_id]
+            return None
+        self._data.move_to_end(user_id)
+        return name
+
+    def set(self, user_id, name):
+        self._data[user_id] = (name, time.monotonic() + self.ttl)
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def invalidate(self, user_id):
+        self._data.pop(user_id, None)
+
+display_names = DisplayNameCache()
+
+async def resolve_display_names(user_ids, bot: discord.Client, guild: discord.Guild) -> dict:
+    """{user_id: nome} para todos os ids; os que faltam em cache são buscados juntos, em paralelo."""
+    names, missing = {}, []
+    for uid in dict.fromkeys(user_ids):
+        member = guild.get_member(uid) if guild else None
+        if member: names[uid] = member.display_name; continue
+        cached = display_names.get(uid)
+        if cached: names[uid] = cached; continue
+        user = bot.get_user(uid)
+        if user:
+            names[uid] = user.display_name
+            display_names.set(uid, user.display_name)
+        else: missing.append(uid)
+    if missing:
+        results = await asyncio.gather(*(bot.fetch_user(uid) for uid in missing), return_exceptions=True)
+        for uid, user in zip(missing, results):
+            if isinstance(user, BaseException): names[uid] = "User"; continue
+            names[uid] = user.display_name
+            display_names.set(uid, user.display_name)
+    return names
+
 async def get_user_display_name_static(user_id: int, bot: discord.Client, guild: discord.Guild) -> str:
-    if guild:
-        member = guild.get_member(user_id)
-        if member: return member.display_name
-    try:
-        user = bot.get_user(user_id) or await bot.fetch_user(user_id)
-        return user.display_name
-    except: return f"User"
+    return (await resolve_display_names([user_id], bot, guild))[user_id]
 
 def clean_voter_name(display_name: str) -> str:
     if not display_name: return "User"
@@ -98,10 +154,9 @@ async def build_event_embed(event_details: dict, rsvps_data: list, bot_instance:
     tv_ids = [r['user_id'] for r in rsvps_data if r['status'] == 'maybe']
 
     max_a = event_details.get('max_slots', 0)
-    vou_names = []
-    for uid in vou_user_ids:
-        name = await get_user_display_name_static(uid, bot_instance, guild)
-        vou_names.append(name)
+    # Uma rodada de buscas em paralelo para o roster inteiro (normalmente zero, tudo em cache)
+    names = await resolve_display_names(vou_user_ids + le_ids + nv_ids + tv_ids, bot_instance, guild)
+    vou_names = [names[uid] for uid in vou_user_ids]
     
     vou_lines = []
     if max_a > 0:
@@ -115,22 +170,26 @@ async def build_event_embed(event_details: dict, rsvps_data: list, bot_instance:
     embed.add_field(name=f"✅ Confirmados ({len(vou_names)}/{max_a})", value=vou_val, inline=False)
 
     if le_ids:
-        le_lines = [f"{i+1}. {await get_user_display_name_static(uid, bot_instance, guild)}" for i, uid in enumerate(le_ids)]
+        le_lines = [f"{i+1}. {names[uid]}" for i, uid in enumerate(le_ids)]
         le_val = "\n".join(le_lines)
         embed.add_field(name=f"⏳ Lista de Espera ({len(le_ids)})", value=le_val, inline=False)
 
     if nv_ids:
-        nv_names = [await get_user_display_name_static(uid, bot_instance, guild) for uid in nv_ids]
+        nv_names = [names[uid] for uid in nv_ids]
         embed.add_field(name=f"❌ Não vou ({len(nv_ids)})", value=", ".join(nv_names), inline=True)
 
     if tv_ids:
-        tv_names = [await get_user_display_name_static(uid, bot_instance, guild) for uid in tv_ids]
+        tv_names = [names[uid] for uid in tv_ids]
         embed.add_field(name=f"🔷 Talvez ({len(tv_ids)})", value=", ".join(tv_names), inline=True)
 
     embed.add_field(name="ℹ️ Como Participar", value="Use os botões abaixo para confirmar presença. Se lotar, você vai para a fila de espera.", inline=False)
     embed.set_footer(text=f"ID do Evento: {event_id}")
     return embed
 
+def embed_hash(embed: discord.Embed) -> str:
+    """Hash canônico do conteúdo do embed (para pular edições que não mudam nada)."""
+    return hashlib.sha1(json.dumps(embed.to_dict(), sort_keys=True, default=str).encode()).hexdigest()
+
 # --- PARSING E DETECÇÃO (Mantido igual) ---
 def normalize_date_str(date_str: str) -> str:
     text = date_str.lower()
@@ -140,10 +199,47 @@ def normalize_date_str(date_str: str) -> str:
     text = re.sub(r'(\d{1,2})[hH](\d{2})', r'\1:\2', text)
     return text
 
-def parse_human_date(date_str: str) -> Optional[datetime.datetime]:
-    if not date_str: return None
-    clean = normalize_date_str(date_str)
-    now = datetime.datetime.now(BR_TIMEZONE)
+# --- FAST PATH DE DATAS ---
+# Formatos que o clã realmente digita; o resto cai no dateparser (lento).
+_FAST_WEEKDAYS = {'segunda': 0, 'terca': 1, 'terça': 1, 'quarta': 2, 'quinta': 3, 'sexta': 4, 'sabado': 5, 'sábado': 5, 'domingo': 6}
+_FAST_TIME = r'(?:\s*,?\s*(?:às|as|a partir das)?\s*(?P<hour>\d{1,2})(?:[:h](?P<minute>\d{2})|h)\s*)'
+_FAST_RELATIVE_RE = re.compile(r'^(?P<word>hoje|amanhã|amanha|depois de amanhã|depois de amanha)' + _FAST_TIME + r'$')
+_FAST_WEEKDAY_RE = re.compile(r'^(?:(?P<prefix>no|na|neste|nesta|próximo|proximo|próxima|proxima)\s+)?(?P<word>' + '|'.join(_FAST_WEEKDAYS) + r')(?:-feira|\s+feira)?' + _FAST_TIME + r'$')
+_FAST_DMY_RE = re.compile(r'^(?:dia\s+)?(?P<day>\d{1,2})/(?P<month>\d{1,2})(?:/(?P<year>\d{2}|\d{4}))?' + _FAST_TIME + r'$')
+_FAST_ISO_RE = re.compile(r'^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})[ t](?P<hour>\d{2}):(?P<minute>\d{2})(?::\d{2})?$')
+_RELATIVE_DAYS = {'hoje': 0, 'amanhã': 1, 'amanha': 1, 'depois de amanhã': 2, 'depois de amanha': 2}
+
+def _fast_parse_date(text: str, now: datetime.datetime) -> Optional[datetime.datetime]:
+    """Mesmo resultado que o dateparser (PREFER_DATES_FROM future, DMY) para os formatos comuns; None se não reconhecer."""
+    try:
+        m = _FAST_ISO_RE.match(text)
+        if m: return BR_TIMEZONE.localize(datetime.datetime(*(int(m[k]) for k in ('year', 'month', 'day', 'hour', 'minute'))))
+        m = _FAST_RELATIVE_RE.match(text) or _FAST_WEEKDAY_RE.match(text)
+        if m:
+            hour, minute = int(m['hour']), int(m['minute'] or 0)
+            word = m['word']
+            if word in _RELATIVE_DAYS: days = _RELATIVE_DAYS[word]
+            else:
+                # Dia da semana: sempre a próxima ocorrência; o próprio dia vira a semana que vem (igual ao dateparser)
+                days = (_FAST_WEEKDAYS[word] - now.weekday() - 1) % 7 + 1
+            day = now.date() + datetime.timedelta(days=days)
+            return BR_TIMEZONE.localize(datetime.datetime(day.year, day.month, day.day, hour, minute))
+        m = _FAST_DMY_RE.match(text)
+        if m:
+            hour, minute = int(m['hour']), int(m['minute'] or 0)
+            day, month = int(m['day']), int(m['month'])
+            if m['year']:
+                year = int(m['year']) + (2000 if len(m['year']) == 2 else 0)
+                return BR_TIMEZONE.localize(datetime.datetime(year, month, day, hour, minute))
+            dt = BR_TIMEZONE.localize(datetime.datetime(now.year, month, day, hour, minute))
+            # Sem ano: data/hora já passada vai para o ano seguinte
+            if dt <= now: dt = BR_TIMEZONE.localize(datetime.datetime(now.year + 1, month, day, hour, minute))
+            return dt
+    except ValueError: return None  # 31/02, 25h...
+    return None
+
+def _slow_parse_date(text: str, now: datetime.datetime) -> Optional[datetime.datetime]:
+    clean = normalize_date_str(text)
     settings = {'PREFER_DATES_FROM': 'future', 'RELATIVE_BASE': now.replace(tzinfo=None), 'TIMEZONE': 'America/Sao_Paulo', 'RETURN_AS_TIMEZONE_AWARE': True, 'DATE_ORDER': 'DMY', 'PREFER_DAY_OF_MONTH': 'current'}
     dt = dateparser.parse(clean, settings=settings, languages=['pt'])
     if not dt: return None
@@ -153,33 +249,113 @@ def parse_human_date(date_str: str) -> Optional[datetime.datetime]:
         if try_y > now: dt = try_y
     return dt
 
+@functools.lru_cache(maxsize=512)
+def _parse_human_date_cached(text: str, now: datetime.datetime) -> Optional[datetime.datetime]:
+    return _fast_parse_date(text, now) or _slow_parse_date(text, now)
+
+def parse_human_date(date_str: str) -> Optional[datetime.datetime]:
+    if not date_str: return None
+    # Cache por (texto normalizado, minuto de referência): enquetes re-parseiam as mesmas opções a cada voto
+    text = " ".join(date_str.lower().split())
+    now = datetime.datetime.now(BR_TIMEZONE).replace(second=0, microsecond=0)
+    return _parse_human_date_cached(text, now)
+
+# --- ÍNDICE DE ATIVIDADES ---
+# Montado uma vez no import a partir das tabelas de constants; os helpers de nome
+# de atividade/canal compartilham o mesmo resultado de lookup (em cache).
+
+ActivityMatch = namedtuple('ActivityMatch', 'official type_key slots mode')
+
+# Fuzzy: termos e janelas curtos demais batem com qualquer palavra (1 letra diferente em 4 = 0.75)
+FUZZY_MIN_LENGTH = 5
+FUZZY_SHORT_LENGTH = 8          # abaixo disso a similaridade exigida sobe
+FUZZY_SHORT_THRESHOLD = 0.85
+# Palavras genéricas que nunca identificam uma atividade sozinhas (além dos modos: escola, farm, mestre...)
+FUZZY_STOP_WORDS = {'raid', 'raide', 'raids', 'masmorra', 'dungeon', 'pvp', 'crisol', 'atividade', 'jogar', 'hoje', 'amanha'}
+
+def normalize_text(text: str) -> str:
+    """Minúsculo, sem acentos e com espaços colapsados."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return " ".join(''.join(c for c in text if not unicodedata.combining(c)).split())
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _build_activity_index():
+    terms = {}  # termo normalizado -> (prioridade, oficial, tipo, vagas); a ordem das tabelas é a prioridade
+    patterns = []
+    priority = 0
+    for table, type_key, slots in ((RAID_INFO_PT, 'RAID', 6), (MASMORRA_INFO_PT, 'MASMORRA', 3), (PVP_ACTIVITY_INFO_PT, 'PVP', 3)):
+        for official, aliases in table.items():
+            entry = (priority, official, type_key, slots)
+            priority += 1
+            for raw in [official] + aliases:
+                term = normalize_text(raw)
+                if not term or term in terms: continue
+                terms[term] = entry
+                # Nomes oficiais e aliases longos batem em qualquer lugar; siglas e aliases curtos só como palavra inteira
+                if raw == official or len(term) >= FUZZY_MIN_LENGTH: patterns.append(re.escape(term))
+                else: patterns.append(rf"(?<![a-z0-9]){re.escape(term)}(?![a-z0-9])")
+    patterns.sort(key=len, reverse=True)
+    # Lookahead: encontra acertos sobrepostos numa só passada
+    exact_re = re.compile("(?=(" + "|".join(patterns) + "))")
+
+    fuzzy_terms = [t for t in terms if len(t) >= FUZZY_MIN_LENGTH]
+    trigram_index = defaultdict(set)
+    for term in fuzzy_terms:
+        for tri in _trigrams(term): trigram_index[tri].add(term)
+    return terms, exact_re, trigram_index
+
+_ACTIVITY_TERMS, _ACTIVITY_RE, _ACTIVITY_TRIGRAMS = _build_activity_index()
+_MODE_ORDER = {normalize_text(kw): i for i, kw in enumerate(ACTIVITY_MODES)}
+_MODE_KEYWORDS = {normalize_text(kw): kw for kw in ACTIVITY_MODES}
+_MODE_RE = re.compile("|".join(re.escape(kw) for kw in sorted(_MODE_ORDER, key=len, reverse=True)))
+
+_FUZZY_IGNORED = {normalize_text(w) for w in FUZZY_STOP_WORDS} | set(_MODE_ORDER)
+
+def _fuzzy_threshold(length: int) -> float:
+    return FUZZY_SHORT_THRESHOLD if length < FUZZY_SHORT_LENGTH else SIMILARITY_THRESHOLD
+
+def _fuzzy_activity(norm: str):
+    """Melhor termo por similaridade (janelas de palavras do texto, sem palavras genéricas), acima do limiar."""
+    words = [w for w in norm.split() if w not in _FUZZY_IGNORED]
+    best = None
+    for size in range(1, min(len(words), 5) + 1):
+        for i in range(len(words) - size + 1):
+            window = " ".join(words[i:i + size])
+            if len(window) < FUZZY_MIN_LENGTH: continue
+            candidates = set()
+            for tri in _trigrams(window): candidates |= _ACTIVITY_TRIGRAMS.get(tri, set())
+            for term in candidates:
+                ratio = difflib.SequenceMatcher(None, window, term).ratio()
+                if ratio < _fuzzy_threshold(min(len(window), len(term))): continue
+                key = (ratio, -_ACTIVITY_TERMS[term][0])
+                if best is None or key > best[0]: best = (key, term)
+    return _ACTIVITY_TERMS[best[1]] if best else None
+
+@functools.lru_cache(maxsize=1024)
+def lookup_activity(text: str) -> ActivityMatch:
+    """Atividade e modo detectados no texto. Sem atividade: official=None, type_key='OUTRO'."""
+    norm = normalize_text(text)
+    hits = [_ACTIVITY_TERMS[m.group(1)] for m in _ACTIVITY_RE.finditer(norm)]
+    entry = min(hits) if hits else _fuzzy_activity(norm)
+    modes = [m.group(0) for m in _MODE_RE.finditer(norm)]
+    mode = _MODE_KEYWORDS[min(modes, key=_MODE_ORDER.get)] if modes else None
+    if not entry: return ActivityMatch(None, 'OUTRO', None, mode)
+    _, official, type_key, slots = entry
+    return ActivityMatch(official, type_key, slots, mode)
+
 def detect_activity_details(user_input: str) -> Tuple[str, str, int]:
-    text_lower = user_input.lower()
-    for official, aliases in RAID_INFO_PT.items():
-        if official.lower() in text_lower: return official, 'RAID', 6
-        for alias in aliases:
-            if f" {alias} " in f" {text_lower} " or (len(alias) > 3 and alias in text_lower): return official, 'RAID', 6
-    for official, aliases in MASMORRA_INFO_PT.items():
-        if official.lower() in text_lower: return official, 'MASMORRA', 3
-        for alias in aliases:
-            if f" {alias} " in f" {text_lower} " or (len(alias) > 3 and alias in text_lower): return official, 'MASMORRA', 3
-    for official, aliases in PVP_ACTIVITY_INFO_PT.items():
-        if official.lower() in text_lower: return official, 'PVP', 3
-        for alias in aliases:
-            if f" {alias} " in f" {text_lower} " or (len(alias) > 3 and alias in text_lower): return official, 'PVP', 3
-    return user_input.strip().title(), 'OUTRO', None
+    match = lookup_activity(user_input)
+    if not match.official: return user_input.strip().title(), 'OUTRO', None
+    return match.official, match.type_key, match.slots
 
 def generate_channel_name(title: str, dt: datetime.datetime, type_key: str, free_slots: int, description: str = "") -> str:
     emoji1 = ACTIVITY_EMOJIS.get(type_key, ACTIVITY_EMOJIS['OUTRO'])
-    emoji2 = ""
-    search = (title + " " + description).lower()
-    for kw, icon in ACTIVITY_MODES.items():
-        if kw in search: emoji2 = icon; break
-    simple = title
-    if title in CHANNEL_NAME_MAPPINGS: simple = CHANNEL_NAME_MAPPINGS[title]
-    else:
-        for k, v in CHANNEL_NAME_MAPPINGS.items():
-            if k.lower() in title.lower(): simple = v; break
+    mode = lookup_activity(f"{title} {description}").mode
+    emoji2 = ACTIVITY_MODES[mode] if mode else ""
+    simple = CHANNEL_NAME_MAPPINGS.get(title) or CHANNEL_NAME_MAPPINGS.get(lookup_activity(title).official) or title
     clean = simple.lower().replace(' ', '-')
     clean = ''.join(e for e in clean if e.isalnum() or e == '-' or e in ['à','á','â','ã','é','ê','í','ó','ô','õ','ú','ç'])
     now = datetime.datetime.now(BR_TIMEZONE)
@@ -192,9 +368,7 @@ def generate_channel_name(title: str, dt: datetime.datetime, type_key: str, free
 def format_activity_name(raw_name: str) -> str:
     official, type_key, _ = detect_activity_details(raw_name)
     emoji1 = ACTIVITY_EMOJIS.get(type_key, "")
-    emoji2 = ""
-    mode = ""
-    search = raw_name.lower()
-    for kw, icon in ACTIVITY_MODES.items():
-        if kw in search: emoji2 = icon; mode = f" ({kw.capitalize()})"; break
+    kw = lookup_activity(raw_name).mode
+    emoji2 = ACTIVITY_MODES[kw] if kw else ""
+    mode = f" ({kw.capitalize()})" if kw else ""
     return f"{official}{mode} {emoji1}{emoji2}".strip()
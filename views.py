@@ -2,19 +2,78 @@ import discord
 import database as db
 import utils
 from constants import BR_TIMEZONE
+import asyncio
 import datetime
 import re
 
+# Janela de coalescência: cliques de RSVP dentro dela geram uma única edição do embed
+RENDER_DEBOUNCE_SECONDS = 1.5
+
+class EventEmbedRenderer:
+    """Re-render coalescido por evento: cliques marcam o evento como sujo e, após o debounce,
+    sai uma única edição da mensagem. Se o hash do embed não mudou, a edição é pulada."""
+
+    def __init__(self, debounce=RENDER_DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        self._pending = {}   # event_id -> task aguardando o debounce
+        self._targets = {}   # event_id -> (client, mensagem ou None)
+        self._hashes = {}    # event_id -> hash do último embed publicado
+        self._locks = {}
+        self.stats = {'requested': 0, 'rendered': 0, 'skipped': 0, 'errors': 0}
+
+    def request(self, event_id, client, message=None):
+        """Marca o evento como sujo. Sem `message`, a mensagem é localizada pelo registro do evento."""
+        self.stats['requested'] += 1
+        self._targets[event_id] = (client, message)
+        if event_id not in self._pending:
+            self._pending[event_id] = asyncio.create_task(self._render_later(event_id))
+
+    def forget(self, event_id):
+        task = self._pending.pop(event_id, None)
+        if task: task.cancel()
+        self._targets.pop(event_id, None)
+        self._hashes.pop(event_id, None)
+        self._locks.pop(event_id, None)
+
+    async def _render_later(self, event_id):
+        await asyncio.sleep(self.debounce)
+        self._pending.pop(event_id, None)
+        target = self._targets.pop(event_id, None)
+        if target: await self.render(event_id, *target)
+
+    async def render(self, event_id, client, message=None):
+        # Lock: um render mais antigo nunca sobrescreve um mais novo
+        async with self._locks.setdefault(event_id, asyncio.Lock()):
+            try:
+                event = await db.get_event(event_id)
+                if not event: return
+                rsvps = await db.get_rsvps(event_id)
+                embed = await utils.build_event_embed(dict(event), rsvps, client)
+                digest = utils.embed_hash(embed)
+                if self._hashes.get(event_id) == digest:
+                    self.stats['skipped'] += 1
+                    return
+                if message is None:
+                    channel = client.get_channel(event['channel_id'])
+                    if not channel: return
+                    message = channel.get_partial_message(event['message_id'])
+                await message.edit(embed=embed)
+                self._hashes[event_id] = digest
+                self.stats['rendered'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"[RENDER ERROR] Evento {event_id}: {e}")
+
+event_renderer = EventEmbedRenderer()
+
 async def notify_confirmed_users(interaction: discord.Interaction, event_id: int, message: str):
+    # Só enfileira: o envio sai pelo dispatcher de DMs, sem segurar a interação
     try:
         rsvps = await db.get_rsvps(event_id)
         confirmed_ids = [r['user_id'] for r in rsvps if r['status'] == 'confirmed']
         for uid in confirmed_ids:
             if uid == interaction.user.id: continue
-            try:
-                user = interaction.client.get_user(uid) or await interaction.client.fetch_user(uid)
-                await user.send(message)
-            except: pass
+            interaction.client.dms.send(uid, content=message, run=f"notify:{event_id}")
     except Exception as e: print(f"[NOTIFY ERROR] {e}")
 
 class EventEditModal(discord.ui.Modal, title="Editar Evento"):
@@ -52,96 +111,178 @@ class EventEditModal(discord.ui.Modal, title="Editar Evento"):
         if date_changed: msg_notification = f"📅 **DATA ALTERADA:** O evento **{official_name}** foi remarcado para **{new_dt.strftime('%d/%m às %H:%M')}**."
 
         await db.update_event_details(self.event_data['event_id'], official_name, self.desc_input.value, new_dt, act_type, slots)
+        # Nova data -> lembretes e marcos precisam disparar de novo no novo horário
+        if date_changed: await db.reset_event_lifecycle_flags(self.event_data['event_id'])
+        tasks_cog = self.bot.get_cog('TasksCog')
+        if tasks_cog: await tasks_cog.schedule_event(self.event_data['event_id'])
         await notify_confirmed_users(interaction, self.event_data['event_id'], msg_notification)
         
         event = await db.get_event(self.event_data['event_id'])
         rsvps = await db.get_rsvps(self.event_data['event_id'])
-        embed = await utils.build_event_embed(dict(event), rsvps, self.bot)
+        event_renderer.request(event['event_id'], self.bot)
         
         channel = interaction.guild.get_channel(event['channel_id'])
         if channel:
             try:
-                msg = await channel.fetch_message(event['message_id'])
-                await msg.edit(embed=embed)
                 confirmed_count = len([r for r in rsvps if r['status'] == 'confirmed'])
                 free_slots = max(0, slots - confirmed_count)
                 new_name = utils.generate_channel_name(official_name, new_dt, act_type, free_slots, description=self.desc_input.value)
-                if channel.name != new_name:
-                    try: await channel.edit(name=new_name)
-                    except: pass
+                self.bot.renamer.request(channel, new_name)
                 if date_changed: await channel.send(f"📢 {interaction.user.mention} alterou a data para **{new_dt.strftime('%d/%m às %H:%M')}**!")
                 await interaction.followup.send("✅ Evento atualizado!", ephemeral=True)
             except Exception as e: await interaction.followup.send(f"Erro visual: {e}", ephemeral=True)
 
+# Versão dos botões de RSVP; mensagens com versão menor são reeditadas uma vez (migrate_rsvp_messages)
+RSVP_VIEW_VERSION = 1
+
+# ação do custom_id -> (label, estilo, emoji, linha)
+RSVP_BUTTONS = {
+    'yes': ("Vou", discord.ButtonStyle.secondary, "✅", 0),
+    'no': ("Não Vou", discord.ButtonStyle.secondary, "❌", 0),
+    'maybe': ("Talvez", discord.ButtonStyle.secondary, "🔷", 0),
+    'edit': ("Editar", discord.ButtonStyle.primary, "✏️", 1),
+    'delete': ("Apagar", discord.ButtonStyle.danger, "🗑️", 1),
+}
+RSVP_ACTION_STATUS = {'yes': 'confirmed', 'no': 'absent', 'maybe': 'maybe'}
+
+async def handle_rsvp_click(interaction: discord.Interaction, event_id: int, status: str):
+    # FIX: Immediate defer to prevent timeouts
+    await interaction.response.defer(ephemeral=True)
+    try:
+        event = await db.get_event(event_id)
+        if not event: return await interaction.followup.send("❌ Evento deletado.", ephemeral=True)
+
+        # Vaga, status e promoção da lista de espera numa transação só
+        result = await db.apply_rsvp(event_id, interaction.user.id, status)
+        if result is None: return await interaction.followup.send("❌ Evento deletado.", ephemeral=True)
+        final_status, promoted, rsvps = result
+        # Nome do canal com as contagens desta transação, sem reconsultar o banco. Pedido antes de
+        # qualquer await: os pedidos chegam ao renomeador na mesma ordem das transações.
+        tasks_cog = interaction.client.get_cog('TasksCog')
+        if tasks_cog: tasks_cog.request_rename(db.event_overview_from_rsvps(event, rsvps))
+
+        if final_status == 'waitlist': await interaction.followup.send("⚠️ Cheio! Entrou na **Lista de Espera**.", ephemeral=True)
+        elif final_status == 'confirmed': await interaction.followup.send("✅ Confirmado!", ephemeral=True)
+        elif final_status == 'absent': await interaction.followup.send("❌ Ausente.", ephemeral=True)
+        elif final_status == 'maybe': await interaction.followup.send("🔷 Talvez.", ephemeral=True)
+
+        role = interaction.guild.get_role(event['role_id'])
+        if role:
+            try:
+                if final_status in ['confirmed', 'waitlist']: await interaction.user.add_roles(role)
+                else: await interaction.user.remove_roles(role)
+            except: pass
+        # Quem saiu da lista de espera nesta transação fica sabendo por DM
+        for uid in promoted:
+            interaction.client.dms.send(uid, content=f"✅ Abriu uma vaga! Você saiu da lista de espera e está confirmado em **{event['title']}**.", run=f"promoted:{event_id}")
+        event_renderer.request(event_id, interaction.client, interaction.message)
+    except Exception as e:
+        print(f"[HANDLE CLICK ERROR] {e}")
+        await interaction.followup.send("Erro interno.", ephemeral=True)
+
+async def check_manager_permission(interaction: discord.Interaction, event):
+    if interaction.user.id == event['creator_id']: return True
+    if interaction.user.guild_permissions.administrator: return True
+    manager_id = await db.get_manager_id(interaction.guild.id)
+    if manager_id:
+        if interaction.user.id == manager_id: return True
+        if interaction.user.get_role(manager_id): return True
+    return False
+
+async def handle_edit_click(interaction: discord.Interaction, event_id: int):
+    # Edição exige Modal, então não pode Defer
+    try:
+        event = await db.get_event(event_id)
+        if not event: return await interaction.response.send_message("Evento não encontrado.", ephemeral=True)
+        if not await check_manager_permission(interaction, event): return await interaction.response.send_message("Sem permissão.", ephemeral=True)
+        await interaction.response.send_modal(EventEditModal(dict(event), interaction.client))
+    except Exception as e: print(f"[EDIT ERROR] {e}")
+
+async def handle_delete_click(interaction: discord.Interaction, event_id: int):
+    await interaction.response.defer(ephemeral=True)
+    try:
+        event = await db.get_event(event_id)
+        if not event: return await interaction.followup.send("Já apagado.", ephemeral=True)
+        if not await check_manager_permission(interaction, event): return await interaction.followup.send("Sem permissão.", ephemeral=True)
+        
+        await notify_confirmed_users(interaction, event_id, f"⚠️ **Aviso:** O evento **{event['title']}** foi CANCELADO.")
+        await interaction.followup.send("✅ Apagando...", ephemeral=True)
+        guild = interaction.guild
+        if guild:
+            interaction.client.renamer.forget(event['channel_id'])
+            try: 
+                c = guild.get_channel(event['channel_id'])
+                if c: await c.delete(reason="User Delete")
+            except: pass
+            try: 
+                r = guild.get_role(event['role_id'])
+                if r: await r.delete(reason="User Delete")
+            except: pass
+        await db.delete_event(event_id)
+        event_renderer.forget(event_id)
+        tasks_cog = interaction.client.get_cog('TasksCog')
+        if tasks_cog: tasks_cog.unschedule_event(event_id)
+    except Exception as e: print(f"[DELETE ERROR] {e}")
+
+class RsvpButton(discord.ui.DynamicItem[discord.ui.Button], template=r'rsvp:(?P<action>yes|no|maybe|edit|delete):(?P<event_id>\d+)'):
+    """Botão de evento com o id no próprio custom_id (`rsvp:<ação>:<event_id>`): não depende do embed."""
+
+    def __init__(self, action: str, event_id: int):
+        label, style, emoji, row = RSVP_BUTTONS[action]
+        super().__init__(discord.ui.Button(label=label, style=style, emoji=emoji, row=row, custom_id=f"rsvp:{action}:{event_id}"))
+        self.action = action
+        self.event_id = event_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match['action'], int(match['event_id']))
+
+    async def callback(self, interaction: discord.Interaction):
+        if self.action == 'edit': await handle_edit_click(interaction, self.event_id)
+        elif self.action == 'delete': await handle_delete_click(interaction, self.event_id)
+        else: await handle_rsvp_click(interaction, self.event_id, RSVP_ACTION_STATUS[self.action])
+
+def rsvp_view(event_id: int) -> discord.ui.View:
+    view = discord.ui.View(timeout=None)
+    for action in RSVP_BUTTONS: view.add_item(RsvpButton(action, event_id))
+    return view
+
+async def migrate_rsvp_messages(bot):
+    """Reedita de uma vez as mensagens de eventos ativos que ainda têm os botões antigos. Retorna quantas migraram."""
+    events = await db.get_events_with_old_rsvp_view(RSVP_VIEW_VERSION)
+    if not events: return 0
+
+    async def migrate(event):
+        channel = bot.get_channel(event['channel_id'])
+        # Canal ou mensagem sumiram: nada a migrar, marca como feito
+        if channel:
+            try: await channel.get_partial_message(event['message_id']).edit(view=rsvp_view(event['event_id']))
+            except discord.NotFound: pass
+        return event['event_id']
+
+    results = await asyncio.gather(*(migrate(e) for e in events), return_exceptions=True)
+    done = [r for r in results if not isinstance(r, BaseException)]
+    for r in results:
+        if isinstance(r, BaseException): print(f"[RSVP] Erro ao migrar botões: {r}")
+    await db.set_rsvp_view_version(done, RSVP_VIEW_VERSION)
+    return len(done)
+
 class PersistentRsvpView(discord.ui.View):
+    """Botões antigos (custom_id fixo, id do evento lido do rodapé do embed).
+    Continua registrada para mensagens ainda não migradas para o RsvpButton."""
+
     def __init__(self): super().__init__(timeout=None)
 
-    async def update_event_embed(self, interaction: discord.Interaction, event_id: int):
-        try:
-            event = await db.get_event(event_id)
-            if not event: return
-            rsvps = await db.get_rsvps(event_id)
-            confirmed = [r for r in rsvps if r['status'] == 'confirmed']
-            waitlist = [r for r in rsvps if r['status'] == 'waitlist']
-            slots = event['max_slots']
-            changed = False
-            while len(confirmed) < slots and len(waitlist) > 0:
-                lucky = waitlist.pop(0) 
-                await db.update_rsvp(event_id, lucky['user_id'], 'confirmed')
-                confirmed.append(lucky); changed = True
-            if changed: rsvps = await db.get_rsvps(event_id)
-            embed = await utils.build_event_embed(dict(event), rsvps, interaction.client)
-            await interaction.message.edit(embed=embed)
-        except Exception as e: print(f"[UPDATE ERROR] {e}")
+    @staticmethod
+    def footer_event_id(interaction: discord.Interaction):
+        if not interaction.message.embeds: return None
+        match = re.search(r'\d+', interaction.message.embeds[0].footer.text or "")
+        return int(match.group()) if match else None
 
     async def handle_click(self, interaction: discord.Interaction, status: str):
-        # FIX: Immediate defer to prevent timeouts
-        await interaction.response.defer(ephemeral=True)
-        try:
-            # FIX: Regex extraction instead of brittle split
-            if not interaction.message.embeds: return await interaction.followup.send("Erro: Embed sumiu.", ephemeral=True)
-            footer_text = interaction.message.embeds[0].footer.text
-            match = re.search(r'\d+', footer_text)
-            if not match: return await interaction.followup.send("Erro: ID não encontrado.", ephemeral=True)
-            event_id = int(match.group())
-            
-            event = await db.get_event(event_id)
-            if not event: return await interaction.followup.send("❌ Evento deletado.", ephemeral=True)
-
-            rsvps = await db.get_rsvps(event_id)
-            confirmed_count = len([r for r in rsvps if r['status'] == 'confirmed'])
-            
-            final_status = status
-            if status == 'confirmed':
-                user_current = next((r for r in rsvps if r['user_id'] == interaction.user.id), None)
-                is_confirmed = user_current and user_current['status'] == 'confirmed'
-                if confirmed_count >= event['max_slots'] and not is_confirmed:
-                    final_status = 'waitlist'
-                    await interaction.followup.send("⚠️ Cheio! Entrou na **Lista de Espera**.", ephemeral=True)
-                else: await interaction.followup.send("✅ Confirmado!", ephemeral=True)
-            elif status == 'absent': await interaction.followup.send("❌ Ausente.", ephemeral=True)
-            elif status == 'maybe': await interaction.followup.send("🔷 Talvez.", ephemeral=True)
-
-            await db.update_rsvp(event_id, interaction.user.id, final_status)
-            role = interaction.guild.get_role(event['role_id'])
-            if role:
-                try:
-                    if final_status in ['confirmed', 'waitlist']: await interaction.user.add_roles(role)
-                    else: await interaction.user.remove_roles(role)
-                except: pass
-            await self.update_event_embed(interaction, event_id)
-        except Exception as e:
-            print(f"[HANDLE CLICK ERROR] {e}")
-            await interaction.followup.send("Erro interno.", ephemeral=True)
-
-    async def check_manager_permission(self, interaction: discord.Interaction, event):
-        if interaction.user.id == event['creator_id']: return True
-        if interaction.user.guild_permissions.administrator: return True
-        manager_id = await db.get_manager_id(interaction.guild.id)
-        if manager_id:
-            if interaction.user.id == manager_id: return True
-            if interaction.user.get_role(manager_id): return True
-        return False
+        event_id = self.footer_event_id(interaction)
+        if event_id is None: return await interaction.response.send_message("Erro: ID não encontrado.", ephemeral=True)
+        await handle_rsvp_click(interaction, event_id, status)
 
     @discord.ui.button(label="Vou", style=discord.ButtonStyle.secondary, custom_id="rsvp_yes", emoji="✅")
     async def btn_yes(self, interaction: discord.Interaction, button: discord.ui.Button): await self.handle_click(interaction, 'confirmed')
@@ -152,41 +293,12 @@ class PersistentRsvpView(discord.ui.View):
 
     @discord.ui.button(label="Editar", style=discord.ButtonStyle.primary, custom_id="btn_edit", emoji="✏️", row=1)
     async def btn_edit(self, interaction: discord.Interaction, button: discord.ui.Button):
-        # Edição exige Modal, então não pode Defer
-        try:
-            footer_text = interaction.message.embeds[0].footer.text
-            match = re.search(r'\d+', footer_text)
-            if not match: return await interaction.response.send_message("Erro ID.", ephemeral=True)
-            event_id = int(match.group())
-            event = await db.get_event(event_id)
-            if not event: return await interaction.response.send_message("Evento não encontrado.", ephemeral=True)
-            if not await self.check_manager_permission(interaction, event): return await interaction.response.send_message("Sem permissão.", ephemeral=True)
-            await interaction.response.send_modal(EventEditModal(dict(event), interaction.client))
-        except Exception as e: print(f"[EDIT ERROR] {e}")
+        event_id = self.footer_event_id(interaction)
+        if event_id is None: return await interaction.response.send_message("Erro ID.", ephemeral=True)
+        await handle_edit_click(interaction, event_id)
 
     @discord.ui.button(label="Apagar", style=discord.ButtonStyle.danger, custom_id="btn_delete", emoji="🗑️", row=1)
     async def btn_delete(self, interaction: discord.Interaction, button: discord.ui.Button):
-        await interaction.response.defer(ephemeral=True)
-        try:
-            footer_text = interaction.message.embeds[0].footer.text
-            match = re.search(r'\d+', footer_text)
-            if not match: return await interaction.followup.send("Erro ID.", ephemeral=True)
-            event_id = int(match.group())
-            event = await db.get_event(event_id)
-            if not event: return await interaction.followup.send("Já apagado.", ephemeral=True)
-            if not await self.check_manager_permission(interaction, event): return await interaction.followup.send("Sem permissão.", ephemeral=True)
-            
-            await notify_confirmed_users(interaction, event_id, f"⚠️ **Aviso:** O evento **{event['title']}** foi CANCELADO.")
-            await interaction.followup.send("✅ Apagando...", ephemeral=True)
-            guild = interaction.guild
-            if guild:
-                try: 
-                    c = guild.get_channel(event['channel_id'])
-                    if c: await c.delete(reason="User Delete")
-                except: pass
-                try: 
-                    r = guild.get_role(event['role_id'])
-                    if r: await r.delete(reason="User Delete")
-                except: pass
-            await db.delete_event(event_id)
-        except Exception as e: print(f"[DELETE ERROR] {e}")
+        event_id = self.footer_event_id(interaction)
+        if event_id is None: return await interaction.response.send_message("Erro ID.", ephemeral=True)
+        await handle_delete_click(interaction, event_id)